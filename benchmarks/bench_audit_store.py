@@ -0,0 +1,85 @@
+"""Benchmark: ingest and query times of the audit history store.
+
+Stores runs of a generated site (pages with a random set of issues that
+drifts a little from run to run) and times the ingest and each query.
+
+    python benchmarks/bench_audit_store.py --pages 100000 --runs 3
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from mandevu.utils.audit_store import AuditStore  # noqa: E402
+
+ISSUES = [
+    "Missing canonical tag.",
+    "Missing meta description.",
+    "Title tag length should be between 30-60 characters.",
+    "No H1 tag found on the page. Each page should have one main H1 tag for SEO.",
+    "Missing structured data.",
+    "Missing Open Graph image.",
+    "Page load time is too high: {:.2f} seconds.",
+    "Broken internal link found: https://example.com/missing/{}.html",
+    "Image missing alt text: https://example.com/img/{}.png",
+]
+
+
+def iter_run(pages, run, rng):
+    yield {"record_type": "site", "site_id": "example.com"}
+    for number in range(pages):
+        # About one page in twenty changes its issues between runs
+        page_rng = random.Random(number * 1000 + (run if rng.random() < 0.05 else 0))
+        issues = [issue.format(page_rng.random() * 5 if "{:" in issue else page_rng.randrange(500))
+                  for issue in page_rng.sample(ISSUES, page_rng.randint(0, 5))]
+        yield {
+            "record_type": "page",
+            "url": f"https://example.com/page/{number}.html",
+            "meta_title": f"Page {number}",
+            "site_id": "example.com",
+            "issues_detected": issues,
+        }
+
+
+def timed(name, function, pages=None):
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    per_page = f"  ({elapsed / pages * 1e6:.1f} us/page)" if pages else ""
+    print(f"{name:28s} {elapsed * 1000:10.1f} ms{per_page}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=100000)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "audits.sqlite")
+        store = AuditStore(path)
+        runs = [
+            timed(f"ingest run {run + 1}", lambda run=run: store.ingest(iter_run(args.pages, run, rng)), args.pages)
+            for run in range(args.runs)
+        ]
+        print(f"Store size: {os.path.getsize(path) / 2 ** 20:.1f} MiB for {args.runs} x {args.pages} pages")
+
+        old, new = runs[-2:]
+        timed("issue counts of a run", lambda: store.issue_counts(new))
+        timed("pages with an issue type", lambda: list(store.pages_with_issue(new, "Broken internal link found: https://example.com/")))
+        timed("trend of an issue type", lambda: store.trend("example.com", "Missing canonical tag."))
+        timed("history of a page", lambda: store.page_history("https://example.com/page/7.html"))
+        changes = timed("diff of the last two runs", lambda: sum(1 for _ in store.diff(old, new)))
+        print(f"{changes} changes between runs {old} and {new}")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Micro-benchmark: single-pass extraction vs. the per-field XPath queries.
+
+Builds a synthetic page, checks that both extractors return the same data and
+prints the time each takes per page.
+
+    python benchmarks/bench_extraction.py --sections 200 --images 40
+"""
+import argparse
+import os
+import sys
+import timeit
+
+from parsel import Selector
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from mandevu.utils.extraction import extract_page  # noqa: E402
+
+
+def xpath_extract(selector):
+    """The extraction parse used to run, one XPath query per field."""
+    images = []
+    for img in selector.xpath("//img/@src").getall():
+        images.append({
+            "src": img,
+            "alt": selector.xpath(f"//img[@src='{img}']/@alt").get(default="No Alt Text"),
+            "status": selector.xpath(f"//img[@src='{img}']/@status").get(default=200),
+        })
+
+    return {
+        "meta_title": selector.xpath("normalize-space(//title/text())").get(default="No Title Tag"),
+        "meta_description": selector.xpath("normalize-space(//meta[@name='description']/@content)").get(default="No Description Available"),
+        "canonical": selector.xpath("normalize-space(//link[@rel='canonical']/@href)").get(default="No Canonical Tag"),
+        "meta_robots": selector.xpath("normalize-space(//meta[@name='robots']/@content)").get(default="No Robots Tag"),
+        "h1_tags": [tag.strip() for tag in selector.xpath("//h1//text()").getall()],
+        "h2_tags": [tag.strip() for tag in selector.xpath("//h2//text()").getall()],
+        "h3_tags": [tag.strip() for tag in selector.xpath("//h3//text()").getall()],
+        "h4_tags": [tag.strip() for tag in selector.xpath("//h4//text()").getall()],
+        "h5_tags": [tag.strip() for tag in selector.xpath("//h5//text()").getall()],
+        "h6_tags": [tag.strip() for tag in selector.xpath("//h6//text()").getall()],
+        "hrefs": selector.css("a::attr(href)").getall(),
+        "images": images,
+        "structured_data": selector.xpath("//script[@type='application/ld+json']/text()").getall(),
+        "open_graph_data": {
+            "og:title": selector.xpath("//meta[@property='og:title']/@content").get(default=""),
+            "og:description": selector.xpath("//meta[@property='og:description']/@content").get(default=""),
+            "og:image": selector.xpath("//meta[@property='og:image']/@content").get(default=""),
+            "og:url": selector.xpath("//meta[@property='og:url']/@content").get(default=""),
+        },
+        "twitter_card_data": {
+            "twitter:title": selector.xpath("//meta[@name='twitter:title']/@content").get(default=""),
+            "twitter:description": selector.xpath("//meta[@name='twitter:description']/@content").get(default=""),
+            "twitter:image": selector.xpath("//meta[@name='twitter:image']/@content").get(default=""),
+            "twitter:url": selector.xpath("//meta[@name='twitter:url']/@content").get(default=""),
+        },
+        "hreflang_tags": selector.xpath("//link[@rel='alternate']/@hreflang").getall(),
+        "viewport": selector.xpath("//meta[@name='viewport']/@content").get(default=""),
+    }
+
+
+def build_page(sections, images):
+    """Generate an HTML page with roughly 15 nodes per section plus the given number of images."""
+    head = """<head>
+  <title>  Synthetic   benchmark page
+  </title>
+  <meta name="description" content=" A page used to benchmark extraction ">
+  <meta name="robots" content="index, follow">
+  <meta name="viewport" content="width=device-width, initial-scale=1">
+  <link rel="canonical" href="https://example.com/bench">
+  <link rel="alternate" hreflang="en" href="https://example.com/en/bench">
+  <link rel="alternate" hreflang="fr" href="https://example.com/fr/bench">
+  <meta property="og:title" content="Bench">
+  <meta property="og:image" content="https://example.com/og.png">
+  <meta name="twitter:title" content="Bench">
+  <script type="application/ld+json">{"@type": "WebPage"}</script>
+</head>"""
+    body = ["<body><h1>Main <em>heading</em></h1>"]
+    for i in range(sections):
+        level = 2 + i % 5
+        body.append(
+            f"<section><h{level}> Section {i} <!-- note --> title </h{level}>"
+            f"<div><p>Paragraph {i} with <a href='/page-{i}'>a link</a> and "
+            f"<a href='https://external.example/{i}'>another</a>.</p>"
+            f"<ul><li>one</li><li>two</li><li><span>three</span></li></ul></div></section>"
+        )
+    for i in range(images):
+        alt = f" alt='Image {i % 7}'" if i % 3 else ""
+        body.append(f"<img src='/img/{i % (images // 2 or 1)}.png'{alt}>")
+    body.append("<a href='mailto:team@example.com'>mail</a></body>")
+    return f"<html>{head}{''.join(body)}</html>"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sections", type=int, default=200)
+    parser.add_argument("--images", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    html = build_page(args.sections, args.images)
+    selector = Selector(text=html)
+    nodes = sum(1 for _ in selector.root.iter())
+
+    expected = xpath_extract(selector)
+    actual = extract_page(selector.root)
+    if expected != actual:
+        for key in expected:
+            if expected[key] != actual[key]:
+                print(f"Mismatch in {key}:\n  xpath:       {expected[key]!r}\n  single-pass: {actual[key]!r}")
+        sys.exit(1)
+
+    xpath_time = timeit.timeit(lambda: xpath_extract(selector), number=args.repeat) / args.repeat
+    single_time = timeit.timeit(lambda: extract_page(selector.root), number=args.repeat) / args.repeat
+
+    print(f"Page: {nodes} nodes, {args.images} images")
+    print(f"XPath per field: {xpath_time * 1000:8.2f} ms/page")
+    print(f"Single pass:     {single_time * 1000:8.2f} ms/page")
+    print(f"Speed-up:        {xpath_time / single_time:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
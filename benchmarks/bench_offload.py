@@ -0,0 +1,58 @@
+"""Benchmark: page parsing throughput with CPU_WORKERS worker processes.
+
+Renders pages of the benchmark site, parses them on this thread the way the
+spider does without CPU_WORKERS, then in pools of worker processes the way
+it does with them, checks that every pool returns the same fields, and
+prints pages per second for each pool size.
+
+    python benchmarks/bench_offload.py --pages 400 --padding 200 --workers 1 2 4 8
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from scrapy.http import HtmlResponse  # noqa: E402
+
+from mandevu.utils.offload import extract_body, extract_response  # noqa: E402
+from site_server import SiteOptions, page_path, render_page  # noqa: E402
+
+WINDOW = 1024 * 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--padding", type=int, default=200, help="kilobytes of extra markup per page")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    options = SiteOptions(pages=args.pages, padding=args.padding)
+    pages = [(f"https://example.com{page_path(number)}", render_page(options, number)) for number in range(args.pages)]
+
+    start = time.perf_counter()
+    expected = [extract_response(HtmlResponse(url, body=body, encoding="utf-8"), WINDOW) for url, body in pages]
+    inline = args.pages / (time.perf_counter() - start)
+    print(f"Page size: {sum(len(body) for _, body in pages) // args.pages // 1024} KiB, {os.cpu_count()} CPUs")
+    print(f"in process     {inline:8.1f} pages/s")
+
+    for workers in args.workers:
+        with ProcessPoolExecutor(workers) as pool:
+            # Start the workers before timing
+            list(pool.map(abs, range(workers)))
+            start = time.perf_counter()
+            results = list(pool.map(
+                extract_body, [url for url, _ in pages], [body for _, body in pages],
+                ["utf-8"] * args.pages, [WINDOW] * args.pages, chunksize=1,
+            ))
+            rate = args.pages / (time.perf_counter() - start)
+        if [(page_data, truncated) for page_data, truncated, _ in results] != expected:
+            sys.exit(f"{workers} workers returned different fields than the in-process parse")
+        print(f"{workers:2d} workers     {rate:8.1f} pages/s  ({rate / inline:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Benchmark: memory and feed cost of page dicts against PageRecords.
+
+Builds page records like the spider's (fields extracted from pages of the
+benchmark site, with checked links and images), then reports the memory
+each form holds per page, and the time to export and load them in the
+indented JSON feed, the JSON Lines feed and the binary records feed. The
+records feed is checked to load back the same pages.
+
+    python benchmarks/bench_records.py --pages 2000 --fanout 40 --images 10
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from scrapy.exporters import JsonItemExporter, JsonLinesItemExporter  # noqa: E402
+from scrapy.http import HtmlResponse  # noqa: E402
+
+from mandevu.exporters import RecordFeedExporter  # noqa: E402
+from mandevu.items import PageRecord  # noqa: E402
+from mandevu.utils.offload import extract_response  # noqa: E402
+from mandevu.utils.record_feed import iter_records  # noqa: E402
+from mandevu.utils.timing import TIMING_METRICS  # noqa: E402
+from site_server import SiteOptions, page_path, render_page  # noqa: E402
+
+
+def build_page(options, number, rng):
+    """Return the page dict the spider would emit for a page of the benchmark site."""
+    url = f"https://example.com{page_path(number)}"
+    page_data, truncated = extract_response(HtmlResponse(url, body=render_page(options, number), encoding="utf-8"), 1 << 20)
+    links = [f"https://example.com{page_path(rng.randrange(options.pages))}" for _ in range(options.fanout)]
+    return {
+        "record_type": "page",
+        "url": url,
+        **{key: page_data[key] for key in ("meta_title", "meta_description", "canonical", "meta_robots")},
+        **{f"h{level}_tags": page_data[f"h{level}_tags"] for level in range(1, 7)},
+        "internal_links_count": len(links),
+        "internal_links": [{"url": link, "status": rng.choice((200, 200, 200, 404, 301))} for link in links],
+        "external_links_count": 1,
+        "external_links": ["https://external.example/"],
+        "image_data": [
+            {"src": f"https://example.com/img/{rng.randrange(100)}.png", "alt": "No Alt Text",
+             "size": rng.randrange(1000, 90000), "status": 200, "type": "png"}
+            for _ in range(options.images)
+        ],
+        **{key: page_data[key] for key in ("structured_data", "open_graph_data", "twitter_card_data", "hreflang_tags", "viewport")},
+        "load_time": rng.random(),
+        "timing": {metric: rng.random() for metric in TIMING_METRICS},
+        "response_size": 20000,
+        "truncated": truncated,
+        "redirect_chain": [],
+        "site_id": "example.com",
+        "issues_detected": ["Missing canonical tag.", "No robots meta tag found."],
+        "ai_recommendations": {"ai_recommendations": ["Add a canonical tag."]},
+    }
+
+
+def held_memory(build):
+    """Return the bytes still allocated by what build() returns."""
+    tracemalloc.start()
+    kept = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return size
+
+
+def export(exporter_class, items, **kwargs):
+    file = io.BytesIO()
+    exporter = exporter_class(file, **kwargs)
+    start = time.perf_counter()
+    exporter.start_exporting()
+    for item in items:
+        exporter.export_item(item)
+    exporter.finish_exporting()
+    return file.getvalue(), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--fanout", type=int, default=40, help="checked internal links per page")
+    parser.add_argument("--images", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    options = SiteOptions(pages=args.pages, fanout=args.fanout, images=args.images, seed=args.seed)
+    rng = random.Random(args.seed)
+    # Kept as JSON so each measured form decodes its own copies of the strings
+    lines = [json.dumps(build_page(options, number, rng)) for number in range(args.pages)]
+    pages = [json.loads(line) for line in lines]
+    records = [PageRecord.from_dict(page) for page in pages]
+
+    dict_memory = held_memory(lambda: [json.loads(line) for line in lines])
+    record_memory = held_memory(lambda: [PageRecord.from_dict(json.loads(line)) for line in lines])
+    print(f"Pages: {args.pages}, {args.fanout} links and {args.images} images each")
+    print(f"Memory per page:  dict {dict_memory / args.pages:8.0f} B   PageRecord {record_memory / args.pages:8.0f} B"
+          f"   ({dict_memory / record_memory:.1f}x)")
+
+    results = [
+        ("JSON, indented", *export(JsonItemExporter, pages, indent=4)),
+        ("JSON Lines", *export(JsonLinesItemExporter, pages)),
+        ("records", *export(RecordFeedExporter, records)),
+    ]
+    start = time.perf_counter()
+    loaded = [dict(record) for record in iter_records(io.BytesIO(results[-1][1]))]
+    load_seconds = time.perf_counter() - start
+    if loaded != pages:
+        sys.exit("The records feed did not load back the pages written to it")
+
+    baseline = results[0][2]
+    for name, data, seconds in results:
+        print(f"{name:16s} {len(data) / args.pages:8.0f} B/page  export {seconds / args.pages * 1e6:7.1f} us/page"
+              f"  ({baseline / seconds:.1f}x)")
+    start = time.perf_counter()
+    json.loads(results[0][1])
+    print(f"Load: JSON {(time.perf_counter() - start) / args.pages * 1e6:.1f} us/page, "
+          f"records {load_seconds / args.pages * 1e6:.1f} us/page (as dicts)")
+
+
+if __name__ == "__main__":
+    main()
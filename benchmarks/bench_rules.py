@@ -0,0 +1,129 @@
+"""Benchmark: per-page SEORuleChecker vs. the column-wise RuleEngine.
+
+Builds synthetic page records, checks that both produce the same issue
+messages and prints the time each takes over the whole batch.
+
+    python benchmarks/bench_rules.py --pages 100000
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from mandevu.utils.rule_engine import PageBatch, RuleEngine  # noqa: E402
+from mandevu.utils.seo_rules import SEORuleChecker  # noqa: E402
+
+SITE = {
+    "record_type": "site",
+    "site_id": "example.com",
+    "robots_txt": "User-agent: *\nAllow: /\nSitemap: https://example.com/sitemap.xml\n",
+    "sitemap_url": "https://example.com/sitemap.xml",
+}
+
+
+def build_record(i, rng):
+    """Generate a page record with a mix of passing and failing fields."""
+    images = []
+    for j in range(rng.randint(0, 8)):
+        images.append({
+            "src": f"https://example.com/img/{i}-{j}.png",
+            "alt": rng.choice(["", "No Alt Text", "photo", "Product shot", "Product shot", f"Figure {j}"]),
+            "size": rng.choice([0, 4000, 250000]),
+            "status": rng.choice([200, 200, 200, 404]),
+            "type": "png",
+        })
+    return {
+        "record_type": "page",
+        "site_id": "example.com",
+        "url": f"{rng.choice(['https', 'http'])}://example.com/page-{i}",
+        "meta_title": "x" * rng.choice([0, 12, 45, 80]),
+        "meta_description": "y" * rng.choice([0, 30, 120, 200]),
+        "canonical": rng.choice(["", f"https://example.com/page-{i}"]),
+        "meta_robots": rng.choice(["", "index, follow", "noindex"]),
+        "h1_tags": ["Title"] * rng.choice([0, 1, 1, 2]),
+        "h2_tags": ["Section"] * rng.randint(0, 3),
+        "h3_tags": ["Sub"] * rng.randint(0, 2),
+        "h4_tags": ["Deep"] * rng.choice([0, 0, 1]),
+        "h5_tags": [],
+        "h6_tags": [],
+        "internal_links_count": rng.randint(0, 10),
+        "internal_links": [{"url": f"https://example.com/page-{k}", "status": 200} for k in range(rng.randint(0, 5))],
+        "external_links_count": rng.randint(0, 2),
+        "external_links": [],
+        "image_data": images,
+        "structured_data": rng.choice([[], ['{"@type": "WebPage"}']]),
+        "open_graph_data": {
+            "og:title": rng.choice(["", "OG"]),
+            "og:description": rng.choice(["", "OG"]),
+            "og:image": "",
+            "og:url": "https://example.com/",
+        },
+        "twitter_card_data": {
+            "twitter:title": rng.choice(["", "TW"]),
+            "twitter:description": "",
+            "twitter:image": "",
+            "twitter:url": "",
+        },
+        "hreflang_tags": rng.choice([[], ["en"]]),
+        "viewport": rng.choice(["", "width=device-width"]),
+        "load_time": rng.choice([0.2, 1.5, 4.25]),
+    }
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    records = [build_record(i, rng) for i in range(args.pages)]
+    # Keep the collector from rescanning the fixture, which would be timed
+    # as part of whichever side happened to trigger a full collection
+    gc.collect()
+    gc.freeze()
+
+    expected, per_page_time = timed(lambda: [SEORuleChecker(record, SITE).analyze() for record in records])
+
+    batch, build_time = timed(lambda: PageBatch(records, {SITE["site_id"]: SITE}))
+    engine = RuleEngine()
+    issues, evaluate_time = timed(lambda: engine.evaluate(batch))
+    _, counts_time = timed(issues.counts)
+    actual, format_time = timed(issues.format)
+
+    if expected != actual:
+        for page, (want, got) in enumerate(zip(expected, actual)):
+            if want != got:
+                print(f"Mismatch on page {page}:\n  per-page: {want!r}\n  batched:  {got!r}")
+                break
+        sys.exit(1)
+
+    strict = RuleEngine({"title_max_length": 50, "max_load_time": 1})
+    rescored, rescore_time = timed(lambda: strict.evaluate(batch))
+
+    # What rule_engine.py prints: issue counts, no messages
+    counted_time = build_time + evaluate_time + counts_time
+    batched_time = counted_time + format_time
+    print(f"Pages: {args.pages}, issues: {len(issues)}")
+    print(f"Per-page SEORuleChecker:     {per_page_time:8.2f} s")
+    print(f"Batched, issue counts:       {counted_time:8.2f} s  ({per_page_time / counted_time:.1f}x)")
+    print(f"Batched, with messages:      {batched_time:8.2f} s  ({per_page_time / batched_time:.1f}x)")
+    print(f"  build columns:             {build_time:8.2f} s")
+    print(f"  evaluate rules:            {evaluate_time:8.2f} s")
+    print(f"  count issues:              {counts_time:8.2f} s")
+    print(f"  format messages:           {format_time:8.2f} s")
+    print(f"Re-score, new thresholds:    {rescore_time:8.2f} s  ({len(rescored)} issues, no formatting)")
+
+
+if __name__ == "__main__":
+    main()
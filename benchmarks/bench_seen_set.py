@@ -0,0 +1,69 @@
+"""Benchmark: memory and speed of the crawl seen-sets.
+
+Adds the URLs of a generated faceted shop (category pages with sorted,
+filtered and tracking-tagged variants) to a plain set of URL strings, a
+FingerprintSet and a BloomFilter, and reports the memory each holds, the
+time per add and how many distinct URLs each kept.
+
+    python benchmarks/bench_seen_set.py --urls 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from mandevu.utils.urls import BloomFilter, FingerprintSet, canonicalize  # noqa: E402
+
+FACETS = ["color=red", "color=blue", "size=m", "size=l", "sort=price", "sort=new", "page=2", "page=3"]
+TRACKING = ["", "utm_source=news", "utm_source=ads&utm_medium=cpc", "gclid=abc123"]
+
+
+def iter_urls(count, rng):
+    """Yield count URLs; one in four is a tracking variant of another one."""
+    for i in range(count):
+        params = rng.sample(FACETS, rng.randint(0, 3))
+        params.append(rng.choice(TRACKING))
+        rng.shuffle(params)
+        query = "&".join(param for param in params if param)
+        yield f"https://shop.example.com/category/{i % 5000}/products/{i // 5000}" + (f"?{query}" if query else "")
+
+
+class StringSet(set):
+    def add(self, url):
+        url = canonicalize(url)
+        new = url not in self
+        super().add(url)
+        return new
+
+    def memory_size(self):
+        return sys.getsizeof(self) + sum(sys.getsizeof(url) for url in self)
+
+
+def measure(name, factory, urls):
+    seen = factory()
+    start = time.perf_counter()
+    for url in urls:
+        seen.add(url)
+    elapsed = time.perf_counter() - start
+    size = seen.memory_size() / 2 ** 20
+    print(f"{name:16s} {len(seen):10d} URLs  {size:8.1f} MiB  {elapsed / len(urls) * 1e6:6.2f} us/add")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--urls", type=int, default=1_000_000)
+    parser.add_argument("--error-rate", type=float, default=0.001, help="Bloom filter false-positive rate")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    urls = list(iter_urls(args.urls, random.Random(args.seed)))
+    measure("set of strings", StringSet, urls)
+    measure("fingerprints", FingerprintSet, urls)
+    measure("bloom", lambda: BloomFilter(args.urls, args.error_rate), urls)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Benchmark: site analysis over a large synthetic link graph.
+
+Feeds page records for a generated site through SiteAnalyzer and reports
+the time taken to collect them and to run the analysis, and the peak memory
+of the process.
+
+    python benchmarks/bench_site_analysis.py --pages 100000 --links 10
+"""
+import argparse
+import os
+import random
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from mandevu.utils.site_analysis import SiteAnalyzer  # noqa: E402
+
+WORDS = [f"word{i}" for i in range(2000)]
+TEMPLATE = ["shop", "example", "store"]
+
+
+def title(i, rng):
+    """Return a page title; one page in 20 reuses the words of an earlier title with one changed."""
+    words = random.Random(i - i % 20 if i % 20 == 1 else i).choices(WORDS, k=7)
+    if i % 20 == 1:
+        words[rng.randrange(len(words))] = rng.choice(WORDS)
+    return " ".join(TEMPLATE + words)
+
+
+def iter_records(pages, links, rng):
+    """Yield page records whose links mostly point to nearby pages, like a category tree."""
+    for i in range(pages):
+        targets = {(i + rng.randint(1, 50)) % pages for _ in range(links - 1)}
+        targets.add(rng.randrange(pages))
+        yield {
+            "url": f"https://example.com/p/{i}",
+            "internal_links": [{"url": f"https://example.com/p/{t}", "status": 200} for t in targets],
+            "redirect_chain": [f"https://example.com/old/{i}"] if i % 100 == 0 else [],
+            "meta_title": title(i, rng),
+            "meta_description": " ".join(TEMPLATE + [rng.choice(WORDS) for _ in range(15)]),
+            "h1_tags": [f"Heading {i % 3000}"],
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=100000)
+    parser.add_argument("--links", type=int, default=10, help="internal links per page")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    analyzer = SiteAnalyzer("https://example.com/p/0")
+
+    start = time.perf_counter()
+    for record in iter_records(args.pages, args.links, rng):
+        analyzer.add(record)
+    collect_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    analysis = analyzer.analyze()
+    analyze_time = time.perf_counter() - start
+    # ru_maxrss is in KiB on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+
+    print(f"Pages: {analysis['pages']}, links: {analysis['links']}")
+    print(f"Orphans: {len(analysis['orphans'])}, redirect chains: {len(analysis['redirect_chains'])}")
+    for field in analysis["duplicates"]:
+        print(f"{field}: {len(analysis['duplicates'][field])} duplicate groups, "
+              f"{len(analysis['near_duplicates'][field])} near-duplicate groups")
+    print(f"Collect: {collect_time:8.2f} s")
+    print(f"Analyze: {analyze_time:8.2f} s")
+    print(f"Peak RSS: {peak:7.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""Benchmark: a full audit of a generated site served locally.
+
+Starts benchmarks/site_server.py in its own process, crawls it with
+SEOAuditSpider using the stub AI backend while ReportPipeline renders the
+HTML reports, and prints pages per second, requests per page, peak memory
+and the report time left after the crawl (with --offline-reports, the time
+to render the reports from the feed once the crawl is done). With --baseline, exits non-zero when throughput
+falls, or memory or report time grows, by more than --tolerance.
+
+    python benchmarks/run_benchmark.py --pages 2000 --fanout 10 --slow 0.01
+    python benchmarks/run_benchmark.py --save baseline.json
+    python benchmarks/run_benchmark.py --baseline baseline.json
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("SCRAPY_SETTINGS_MODULE", "mandevu.settings")
+
+from scrapy.crawler import CrawlerProcess  # noqa: E402
+from scrapy.utils.project import get_project_settings  # noqa: E402
+
+from mandevu.spiders.my_spider import SEOAuditSpider  # noqa: E402
+from mandevu.utils.generate_report import (  # noqa: E402
+    attach_site_analysis,
+    generate_reports,
+    iter_entries,
+    load_site_analysis,
+    resolve_site_records,
+)
+from site_server import add_site_arguments  # noqa: E402
+
+# Results where a higher value is better; the rest are better lower
+HIGHER_IS_BETTER = {"pages_per_second"}
+COMPARED = ("pages_per_second", "requests_per_page", "peak_rss_mib", "report_seconds")
+# Feed file extensions and the feed formats they are written in
+FEED_FORMATS = {"jsonl": "jsonlines", "records": "records"}
+# Options passed on to site_server.py
+SITE_ARGUMENTS = (
+    "pages", "fanout", "images", "image_pool", "image_size", "sitemap_size", "broken", "downloads", "download_size",
+    "padding", "slow", "slow_delay", "max_concurrent", "retry_after", "seed", "port",
+)
+
+
+def start_server(args):
+    """Start the site server in a child process and return it with its base URL."""
+    command = [sys.executable, os.path.join(os.path.dirname(__file__), "site_server.py")]
+    for name, value in vars(args).items():
+        if name in SITE_ARGUMENTS and value is not None:
+            command += [f"--{name.replace('_', '-')}", str(value)]
+    server = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = server.stdout.readline()
+    if not line.startswith("Serving on "):
+        server.kill()
+        raise RuntimeError(f"Site server did not start: {line!r}")
+    return server, line.split()[-1]
+
+
+def crawl(url, output_dir, args):
+    settings = get_project_settings()
+    feed_path = os.path.join(output_dir, f"crawl.{args.feed_format}")
+    settings.setdict({
+        "FEEDS": {feed_path: {"format": FEED_FORMATS[args.feed_format], "encoding": "utf8", "overwrite": True}},
+        "SITE_ANALYSIS_PATH": os.path.join(output_dir, "site_analysis.json"),
+        "TIMING_PATH": os.path.join(output_dir, "timing.json"),
+        "AI_BACKEND": "stub",
+        "AI_CACHE_DIR": os.path.join(output_dir, "ai_cache"),
+        "CRAWL_STATE_PATH": args.crawl_state,
+        "CONCURRENT_REQUESTS": args.concurrency,
+        "CONCURRENT_REQUESTS_PER_DOMAIN": args.concurrency,
+        "CPU_WORKERS": args.cpu_workers,
+        "REPORT_DIR": "" if args.skip_reports or args.offline_reports else os.path.join(output_dir, "results"),
+        "REPORT_PDF": args.pdf,
+        "REPORT_WORKERS": args.report_workers,
+        "ADAPTIVE_CONCURRENCY_ENABLED": not args.fixed_concurrency,
+        "LOG_LEVEL": args.log_level,
+    }, priority="cmdline")
+
+    process = CrawlerProcess(settings)
+    crawler = process.create_crawler(SEOAuditSpider)
+    process.crawl(crawler, start_url=url)
+    process.start()
+    return crawler.stats.get_stats(), feed_path
+
+
+def render_reports(feed_path, output_dir, args):
+    entries = resolve_site_records(iter_entries(feed_path))
+    views = load_site_analysis(os.path.join(output_dir, "site_analysis.json"))
+    return generate_reports(
+        attach_site_analysis(entries, views),
+        os.path.join(output_dir, "results"),
+        args.report_workers,
+        html_only=not args.pdf,
+        quiet=True,
+    )
+
+
+def compare(results, baseline, tolerance):
+    """Return a message for each result that is worse than the baseline by more than tolerance."""
+    regressions = []
+    for name in COMPARED:
+        old, new = baseline.get(name), results.get(name)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        if name in HIGHER_IS_BETTER:
+            change = -change
+        if change > tolerance:
+            regressions.append(f"{name}: {old:.2f} -> {new:.2f} ({change:+.0%} worse)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_site_arguments(parser)
+    parser.add_argument("--concurrency", type=int, default=16, help="CONCURRENT_REQUESTS for the crawl")
+    parser.add_argument("--fixed-concurrency", action="store_true",
+                        help="send --concurrency requests at a time instead of adapting it per host")
+    parser.add_argument("--cpu-workers", type=int, default=0, help="CPU_WORKERS: processes parsing pages")
+    parser.add_argument("--feed-format", choices=FEED_FORMATS, default="jsonl", help="format of the crawl feed")
+    parser.add_argument("--crawl-state", help="CRAWL_STATE_PATH, to benchmark an incremental re-audit")
+    # Stored page URLs include the port, so a re-audit must find the site where the first run did
+    parser.add_argument("--port", type=int, default=18765,
+                        help="port of the site server (0: any free port, which a --crawl-state cannot be reused with)")
+    parser.add_argument("--report-workers", type=int, default=1,
+                        help="threads rendering reports during the crawl (processes with --offline-reports)")
+    parser.add_argument("--offline-reports", action="store_true",
+                        help="render the reports from the feed after the crawl, as generate_report.py does")
+    parser.add_argument("--pdf", action="store_true", help="also render PDFs (needs wkhtmltopdf)")
+    parser.add_argument("--skip-reports", action="store_true", help="only benchmark the crawl")
+    parser.add_argument("--output-dir", help="where to keep the feed and reports (default: a temporary directory)")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare with results saved by an earlier --save")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed change against the baseline")
+    args = parser.parse_args()
+
+    output_dir = args.output_dir or tempfile.mkdtemp(prefix="mandevu-bench-")
+    os.makedirs(output_dir, exist_ok=True)
+    server, url = start_server(args)
+    try:
+        stats, feed_path = crawl(url, output_dir, args)
+    finally:
+        server.terminate()
+        server.wait()
+    # ru_maxrss is in KiB on Linux; taken before reports so only the crawl counts
+    peak_rss_mib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    pages = stats.get("pages_crawled", 0)
+    elapsed = stats.get("elapsed_time_seconds", 0.0)
+    results = {
+        "pages": pages,
+        "items": stats.get("item_scraped_count", 0),
+        "requests": stats.get("downloader/request_count", 0),
+        "crawl_seconds": round(elapsed, 2),
+        "pages_per_second": round(pages / elapsed, 2) if elapsed else None,
+        "requests_per_page": round(stats.get("downloader/request_count", 0) / pages, 2) if pages else None,
+        "refused": stats.get("downloader/response_status_count/429", 0),
+        "peak_rss_mib": round(peak_rss_mib, 1),
+        "report_seconds": None,
+    }
+
+    if args.offline_reports:
+        start = time.perf_counter()
+        totals = render_reports(feed_path, output_dir, args)
+        results["report_seconds"] = round(time.perf_counter() - start, 2)
+        results["report_render_seconds"] = round(totals["render"], 2)
+        results["report_pdf_seconds"] = round(totals["pdf"], 2)
+    elif not args.skip_reports:
+        # Rendered during the crawl; what is left is the wait for the last pages
+        results["report_seconds"] = stats.get("stages/report/drain/seconds", 0.0)
+        results["report_render_seconds"] = stats.get("stages/report/render/seconds", 0.0)
+        results["report_pdf_seconds"] = stats.get("stages/report/pdf/seconds", 0.0)
+
+    stages = sorted(
+        ((key[len("stages/"):-len("/seconds")], value) for key, value in stats.items()
+         if key.startswith("stages/") and key.endswith("/seconds")),
+        key=lambda stage: stage[1], reverse=True,
+    )
+
+    print(f"Site: {args.pages} pages, {args.fanout} links and {args.images} images per page, output in {output_dir}")
+    print(f"Pages crawled:        {results['pages']:10d}  ({results['items']} items)")
+    print(f"Crawl time:           {results['crawl_seconds']:10.2f} s")
+    print(f"Pages per second:     {results['pages_per_second'] or 0:10.2f}")
+    print(f"Requests per page:    {results['requests_per_page'] or 0:10.2f}  ({results['requests']} requests)")
+    print(f"Refused (429):        {results['refused']:10d}")
+    print(f"Peak RSS (crawl):     {results['peak_rss_mib']:10.1f} MiB")
+    if results["report_seconds"] is not None:
+        print(f"Report generation:    {results['report_seconds']:10.2f} s")
+    if stages:
+        print("Slowest stages:")
+        for name, seconds in stages[:5]:
+            print(f"  {seconds:8.3f} s  {name}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""A generated website served locally, for crawling benchmarks.
+
+Every page, image, sitemap and robots.txt is derived from the page number
+and the seed, so the same options always serve the same site and nothing
+is held in memory. Pages link to the next page (so the whole site is
+reachable from the home page) and to fanout - 1 others; a share of the
+links point to pages that do not exist, a share of the pages link to a
+large downloadable file, and a share of the pages are answered only after
+a delay. With --max-concurrent, requests beyond that many at a time are
+refused with a 429 and a Retry-After, like a rate-limited origin.
+
+    python benchmarks/site_server.py --pages 1000 --fanout 10 --port 8000
+"""
+import argparse
+import hashlib
+import random
+import sys
+import threading
+import time
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = [
+    "audit", "blue", "cart", "delivery", "eco", "fresh", "garden", "home", "ideas", "jacket",
+    "kitchen", "light", "modern", "natural", "outdoor", "premium", "quality", "repair", "summer", "travel",
+    "urban", "vintage", "winter", "yoga", "zero", "guide", "review", "sale", "best", "new",
+]
+
+# Sitemap files hold at most this many URLs, as the sitemap protocol requires
+SITEMAP_CHUNK = 50000
+
+
+class SiteOptions:
+    def __init__(self, pages=1000, fanout=10, images=5, image_pool=100, image_size=20000,
+                 sitemap_size=None, broken=0.02, downloads=0.0, download_size=5000000, padding=0,
+                 slow=0.0, slow_delay=0.5, max_concurrent=0, retry_after=1, seed=0):
+        self.pages = pages
+        self.fanout = fanout
+        self.images = images
+        self.image_pool = image_pool
+        self.image_size = image_size
+        self.sitemap_size = pages if sitemap_size is None else sitemap_size
+        self.broken = broken
+        self.downloads = downloads
+        self.download_size = download_size
+        self.padding = padding
+        self.slow = slow
+        self.slow_delay = slow_delay
+        self.max_concurrent = max_concurrent
+        self.retry_after = retry_after
+        self.seed = seed
+        self.active = threading.BoundedSemaphore(max_concurrent) if max_concurrent else None
+
+    def rng(self, *key):
+        return random.Random(f"{self.seed}:{':'.join(map(str, key))}")
+
+
+def page_path(number):
+    return "/" if number == 0 else f"/page/{number}.html"
+
+
+def render_page(options, number):
+    """Return the HTML of a page, with the same content for the same page number every time."""
+    rng = options.rng("page", number)
+    title = " ".join(rng.choices(WORDS, k=rng.randint(3, 9))).capitalize()
+    description = " ".join(rng.choices(WORDS, k=rng.randint(5, 25)))
+
+    links = [page_path((number + 1) % options.pages)]
+    for _ in range(options.fanout - 1):
+        if rng.random() < options.broken:
+            links.append(f"/missing/{rng.randrange(options.pages)}.html")
+        else:
+            links.append(page_path(rng.randrange(options.pages)))
+    if rng.random() < options.downloads:
+        links.append(f"/files/{number}.pdf")
+    images = [
+        (f"/img/{rng.randrange(options.image_pool)}.png", rng.choice(["", "Product photo", "Detail view"]))
+        for _ in range(options.images)
+    ]
+
+    sections = "".join(
+        f"<h2>{word.capitalize()}</h2><p>{' '.join(rng.choices(WORDS, k=40))}</p>"
+        for word in rng.choices(WORDS, k=rng.randint(2, 6))
+    )
+    # Roughly padding kilobytes of extra markup, for pages that are costly to parse
+    sections += "".join(
+        f"<div class=\"row\"><span>{word}</span><em>{number}</em></div>" for word in rng.choices(WORDS, k=options.padding * 20)
+    )
+    return (
+        "<!DOCTYPE html><html><head>"
+        f"<title>{title}</title>"
+        f'<meta name="description" content="{description}">'
+        '<meta name="viewport" content="width=device-width, initial-scale=1">'
+        f'<link rel="canonical" href="{page_path(number)}">'
+        f'<meta property="og:title" content="{title}">'
+        '<script type="application/ld+json">{"@type": "WebPage"}</script>'
+        f"</head><body><h1>{title}</h1>{sections}"
+        + "".join(f'<a href="{link}">{link}</a>' for link in links)
+        + "".join(f'<img src="{src}" alt="{alt}">' for src, alt in images)
+        + '<a href="https://example.org/">External</a>'
+        "</body></html>"
+    ).encode("utf-8")
+
+
+def render_sitemap(options, base_url, chunk):
+    """Return one sitemap file; page numbers past the end of the site are listed but missing."""
+    if options.sitemap_size > SITEMAP_CHUNK and chunk is None:
+        files = range((options.sitemap_size + SITEMAP_CHUNK - 1) // SITEMAP_CHUNK)
+        entries = "".join(f"<sitemap><loc>{base_url}/sitemap-{index}.xml</loc></sitemap>" for index in files)
+        return f'<?xml version="1.0" encoding="UTF-8"?><sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</sitemapindex>'.encode()
+
+    start = (chunk or 0) * SITEMAP_CHUNK
+    numbers = range(start, min(start + SITEMAP_CHUNK, options.sitemap_size))
+    entries = "".join(f"<url><loc>{base_url}{page_path(number)}</loc></url>" for number in numbers)
+    return f'<?xml version="1.0" encoding="UTF-8"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</urlset>'.encode()
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def __init__(self, *args, options, **kwargs):
+        self.options = options
+        super().__init__(*args, **kwargs)
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.limit(include_body=True)
+
+    def do_HEAD(self):
+        self.limit(include_body=False)
+
+    def limit(self, include_body):
+        active = self.options.active
+        if active is None:
+            self.respond(include_body)
+        elif not active.acquire(blocking=False):
+            self.refuse(include_body)
+        else:
+            try:
+                self.respond(include_body)
+            finally:
+                active.release()
+
+    def refuse(self, include_body):
+        body = b"Too Many Requests"
+        self.send_response(429)
+        self.send_header("Retry-After", str(self.options.retry_after))
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if include_body:
+            self.wfile.write(body)
+
+    def respond(self, include_body):
+        path = self.path.split("?", 1)[0]
+        options = self.options
+        base_url = f"http://{self.headers.get('Host')}"
+
+        if path == "/robots.txt":
+            self.send_body(f"User-agent: *\nAllow: /\nSitemap: {base_url}/sitemap.xml\n".encode(), "text/plain", include_body)
+        elif path == "/sitemap.xml":
+            self.send_body(render_sitemap(options, base_url, None), "application/xml", include_body)
+        elif path.startswith("/sitemap-") and path.endswith(".xml") and path[9:-4].isdigit():
+            self.send_body(render_sitemap(options, base_url, int(path[9:-4])), "application/xml", include_body)
+        elif path.startswith("/img/") and path.endswith(".png"):
+            self.send_body(b"\0" * options.image_size, "image/png", include_body)
+        elif path.startswith("/files/") and path.endswith(".pdf"):
+            self.send_body(b"\0" * options.download_size, "application/pdf", include_body)
+        else:
+            number = self.page_number(path)
+            if number is None:
+                self.send_body(b"Not Found", "text/plain", include_body, status=404)
+                return
+            if options.slow and options.rng("slow", number).random() < options.slow:
+                time.sleep(options.slow_delay)
+            self.send_body(render_page(options, number), "text/html; charset=utf-8", include_body, validators=True)
+
+    def page_number(self, path):
+        if path == "/":
+            return 0
+        if path.startswith("/page/") and path.endswith(".html") and path[6:-5].isdigit():
+            number = int(path[6:-5])
+            if 0 < number < self.options.pages:
+                return number
+        return None
+
+    def send_body(self, body, content_type, include_body, status=200, validators=False):
+        etag = None
+        if validators:
+            etag = '"%s"' % hashlib.md5(body).hexdigest()
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        if include_body:
+            self.wfile.write(body)
+
+
+class SiteServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # The crawler closes connections to stop downloads it does not need
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def make_server(options, host="127.0.0.1", port=0):
+    server = SiteServer((host, port), partial(SiteHandler, options=options))
+    return server
+
+
+def add_site_arguments(parser):
+    parser.add_argument("--pages", type=int, default=1000, help="number of pages on the site")
+    parser.add_argument("--fanout", type=int, default=10, help="internal links per page")
+    parser.add_argument("--images", type=int, default=5, help="images per page")
+    parser.add_argument("--image-pool", type=int, default=100, help="distinct images shared by all pages")
+    parser.add_argument("--image-size", type=int, default=20000, help="size of each image in bytes")
+    parser.add_argument("--sitemap-size", type=int, default=None,
+                        help="URLs listed in the sitemap (default: one per page)")
+    parser.add_argument("--broken", type=float, default=0.02, help="share of links that point to missing pages")
+    parser.add_argument("--downloads", type=float, default=0.0, help="share of pages linking to a downloadable file")
+    parser.add_argument("--download-size", type=int, default=5000000, help="size of each downloadable file in bytes")
+    parser.add_argument("--padding", type=int, default=0, help="kilobytes of extra markup per page")
+    parser.add_argument("--slow", type=float, default=0.0, help="share of pages answered after --slow-delay")
+    parser.add_argument("--slow-delay", type=float, default=0.5, help="delay of slow pages in seconds")
+    parser.add_argument("--max-concurrent", type=int, default=0,
+                        help="requests served at a time; more are refused with a 429 (default: no limit)")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After of refused requests in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def site_options(args):
+    return SiteOptions(
+        pages=args.pages, fanout=args.fanout, images=args.images, image_pool=args.image_pool,
+        image_size=args.image_size, sitemap_size=args.sitemap_size, broken=args.broken,
+        downloads=args.downloads, download_size=args.download_size, padding=args.padding,
+        slow=args.slow, slow_delay=args.slow_delay, max_concurrent=args.max_concurrent,
+        retry_after=args.retry_after, seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_site_arguments(parser)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="port to listen on (default: any free port)")
+    args = parser.parse_args()
+
+    server = make_server(site_options(args), args.host, args.port)
+    host, port = server.server_address[:2]
+    # run_benchmark.py reads the address from this line
+    print(f"Serving on http://{host}:{port}/", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""Audit many sites at once, one crawl per worker process.
+
+    python -m mandevu.batch --sites sites.txt --workers 8 --output-dir audits
+
+sites.txt lists one start URL per line (blank lines and lines starting
+with # are skipped); URLs can also be given on the command line. Every site
+is crawled in a fresh worker process, since the Twisted reactor cannot be
+restarted, and gets its own directory under --output-dir holding its feed,
+site analysis, timings, crawl log and reports. A batch_summary.json with the
+outcome of every site is written when the batch is done.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import time
+import traceback
+from urllib.parse import urlparse
+
+
+def site_directory_name(url):
+    """Return a file system friendly directory name for a site."""
+    parsed = urlparse(url if "://" in url else f"https://{url}")
+    name = parsed.netloc + parsed.path.rstrip("/")
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name).strip("_") or "site"
+
+
+def read_sites(paths, urls):
+    """Return the start URLs from the site list files and the command line, without repeats."""
+    sites = list(urls)
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as file:
+            sites.extend(line.strip() for line in file if line.strip() and not line.lstrip().startswith("#"))
+
+    unique = {}
+    for site in sites:
+        # Two crawls of the same site at once would defeat the politeness limits
+        unique.setdefault(site_directory_name(site), site)
+    return list(unique.values())
+
+
+def crawl_settings(site_dir, options):
+    """Return the settings for one site's crawl, with every output file in site_dir."""
+    from scrapy.utils.project import get_project_settings
+
+    os.environ.setdefault("SCRAPY_SETTINGS_MODULE", "mandevu.settings")
+    settings = get_project_settings()
+    feed_path = os.path.join(site_dir, "crawl.jsonl")
+    overrides = {
+        "FEEDS": {feed_path: {"format": "jsonlines", "encoding": "utf8", "overwrite": True}},
+        "SITE_ANALYSIS_PATH": os.path.join(site_dir, "site_analysis.json"),
+        "TIMING_PATH": os.path.join(site_dir, "timing.json"),
+        # Reports are rendered by ReportPipeline as the pages are crawled
+        "REPORT_DIR": os.path.join(site_dir, "results") if options["reports"] else "",
+        "REPORT_PDF": options["pdf"],
+        # The batch already uses every core
+        "REPORT_WORKERS": 1,
+        "LOG_FILE": os.path.join(site_dir, "crawl.log"),
+        "LOG_LEVEL": options["log_level"],
+        "CONCURRENT_REQUESTS": options["concurrency"],
+        "CONCURRENT_REQUESTS_PER_DOMAIN": options["per_domain"],
+        "DOWNLOAD_DELAY": options["download_delay"],
+    }
+    if options["incremental"]:
+        # Kept between batches so the next audit of the site is incremental
+        overrides["CRAWL_STATE_PATH"] = os.path.join(site_dir, "crawl_state.sqlite")
+    if options["ai_backend"]:
+        overrides["AI_BACKEND"] = options["ai_backend"]
+    if settings.get("PROFILE_PATH"):
+        overrides["PROFILE_PATH"] = os.path.join(site_dir, "profile.folded")
+    overrides.update(options.get("settings", {}))
+    settings.setdict(overrides, priority="cmdline")
+    return settings, feed_path
+
+
+def render_site_reports(site_dir, feed_path, html_only):
+    """Render the reports of a crawl from its feed, as generate_report.py does, with the site summary."""
+    from mandevu.utils.generate_report import (
+        SiteSummary,
+        attach_site_analysis,
+        generate_reports,
+        iter_entries,
+        load_analysis,
+        page_views,
+        resolve_site_records,
+        write_site_summary,
+    )
+
+    summary = SiteSummary()
+    entries = resolve_site_records(summary.track(iter_entries(feed_path)))
+    analysis = load_analysis(os.path.join(site_dir, "site_analysis.json"))
+    results_dir = os.path.join(site_dir, "results")
+    # The batch already uses every core, so each site renders in its own process only
+    totals = generate_reports(
+        attach_site_analysis(entries, page_views(analysis) if analysis is not None else None),
+        results_dir, 1, html_only, quiet=True,
+    )
+    write_site_summary(summary.context(analysis), results_dir)
+    return totals
+
+
+def audit_site(job):
+    """Crawl one site and render its reports; runs in a worker process."""
+    url, site_dir, options = job
+    os.makedirs(site_dir, exist_ok=True)
+    result = {"site": url, "output_dir": site_dir, "status": "ok"}
+    start = time.perf_counter()
+    try:
+        from scrapy.crawler import CrawlerProcess
+
+        from mandevu.spiders.my_spider import SEOAuditSpider
+
+        settings, _ = crawl_settings(site_dir, options)
+        process = CrawlerProcess(settings)
+        crawler = process.create_crawler(SEOAuditSpider)
+        process.crawl(crawler, start_url=url)
+        process.start()
+
+        stats = crawler.stats.get_stats()
+        result.update({
+            "pages": stats.get("pages_crawled", 0),
+            "items": stats.get("item_scraped_count", 0),
+            "errors": stats.get("log_count/ERROR", 0),
+            "finish_reason": stats.get("finish_reason"),
+            "crawl_seconds": round(stats.get("elapsed_time_seconds", 0.0), 2),
+        })
+        if options["reports"]:
+            result["reports"] = stats.get("report/pages", 0)
+    except Exception:
+        result["status"] = "failed"
+        result["error"] = traceback.format_exc(limit=5)
+    result["seconds"] = round(time.perf_counter() - start, 2)
+    return result
+
+
+def run_batch(sites, output_dir, workers, options):
+    """Audit every site across a pool of worker processes and return their results in completion order."""
+    jobs = [(url, os.path.join(output_dir, site_directory_name(url)), options) for url in sites]
+    results = []
+    # A fresh interpreter per site: a process can only run one Twisted reactor
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(processes=workers, maxtasksperchild=1) as pool:
+        for index, result in enumerate(pool.imap_unordered(audit_site, jobs), start=1):
+            results.append(result)
+            if result["status"] == "ok":
+                print(f"[{index}/{len(jobs)}] {result['site']}: {result['pages']} pages in {result['seconds']:.1f}s")
+            else:
+                print(f"[{index}/{len(jobs)}] {result['site']}: failed, see {output_dir}/batch_summary.json")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Audit a list of sites across a pool of worker processes.")
+    parser.add_argument("urls", nargs="*", help="start URLs to audit")
+    parser.add_argument("--sites", action="append", default=[], metavar="FILE",
+                        help="file with one start URL per line (can be repeated)")
+    parser.add_argument("--output-dir", default="audits", help="directory holding one subdirectory per site")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="sites crawled at the same time (default: number of CPUs)")
+    parser.add_argument("--total-concurrency", type=int, default=128,
+                        help="concurrent requests across all workers, split evenly between them")
+    parser.add_argument("--per-domain", type=int, default=8, help="most concurrent requests to any one domain (each host is adapted below it)")
+    parser.add_argument("--download-delay", type=float, default=0.0, help="seconds between requests to a domain")
+    parser.add_argument("--incremental", action="store_true",
+                        help="keep a crawl state per site so later batches only re-audit changed pages")
+    parser.add_argument("--ai-backend", help="AI_BACKEND for every crawl, e.g. stub for offline runs")
+    parser.add_argument("--no-reports", action="store_true", help="crawl only, skip report generation")
+    parser.add_argument("--pdf", action="store_true", help="also render PDF reports")
+    parser.add_argument("--log-level", default="INFO")
+    args = parser.parse_args(argv)
+
+    sites = read_sites(args.sites, args.urls)
+    if not sites:
+        parser.error("no sites given")
+
+    workers = max(1, min(args.workers, len(sites)))
+    options = {
+        "concurrency": max(1, args.total_concurrency // workers),
+        "per_domain": args.per_domain,
+        "download_delay": args.download_delay,
+        "incremental": args.incremental,
+        "ai_backend": args.ai_backend,
+        "reports": not args.no_reports,
+        "pdf": args.pdf,
+        "log_level": args.log_level,
+    }
+    os.makedirs(args.output_dir, exist_ok=True)
+    print(f"Auditing {len(sites)} sites with {workers} workers, {options['concurrency']} concurrent requests each")
+
+    results = run_batch(sites, args.output_dir, workers, options)
+    summary_path = os.path.join(args.output_dir, "batch_summary.json")
+    with open(summary_path, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+
+    failed = [result for result in results if result["status"] != "ok"]
+    print(f"{len(results) - len(failed)} sites audited, {len(failed)} failed; summary in {summary_path}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
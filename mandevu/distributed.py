@@ -0,0 +1,161 @@
+"""Crawl one large site with several worker processes sharing a URL frontier.
+
+    python -m mandevu.distributed crawl https://example.com/ --workers 8 --output-dir audit
+
+Each worker is a separate spider process with its own feed under
+audit/workers/; pages are handed out through the frontier (see
+mandevu.utils.frontier), so each is crawled by one worker. When every
+worker is done, their feeds are merged into audit/crawl.jsonl with a single
+site record, and the site analysis is run over the whole site.
+
+Workers on several machines share a Redis frontier instead:
+
+    python -m mandevu.distributed crawl https://example.com/ --frontier redis://queue:6379/0 \\
+        --workers 8 --output-dir node-a --no-merge
+    python -m mandevu.distributed merge node-*/workers/*/crawl.jsonl --output-dir audit
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import socket
+
+from mandevu.batch import audit_site, render_site_reports
+
+
+def merge_feeds(feed_paths, output_dir, start_url=None):
+    """Merge worker feeds into one feed with one site record and run the site analysis on it.
+
+    Every worker emits the site record it built from its own site-wide
+    checks; the first one is kept. A page crawled by two workers (after a
+    lease ran out) is kept once. Returns the merged feed path and counts.
+    """
+    from mandevu.utils.generate_report import iter_entries
+    from mandevu.utils.site_analysis import SiteAnalyzer
+
+    os.makedirs(output_dir, exist_ok=True)
+    feed_path = os.path.join(output_dir, "crawl.jsonl")
+    analyzer = SiteAnalyzer(start_url)
+    sites = set()
+    pages = set()
+    counts = {"workers": len(feed_paths), "pages": 0, "duplicates": 0}
+    with open(feed_path, "w", encoding="utf-8") as feed:
+        for path in feed_paths:
+            for entry in iter_entries(path):
+                if entry.get("record_type") == "site":
+                    if entry["site_id"] in sites:
+                        continue
+                    sites.add(entry["site_id"])
+                elif entry.get("url") in pages:
+                    counts["duplicates"] += 1
+                    continue
+                else:
+                    pages.add(entry.get("url"))
+                    analyzer.add(entry)
+                    counts["pages"] += 1
+                feed.write(json.dumps(dict(entry), ensure_ascii=False) + "\n")
+
+    with open(os.path.join(output_dir, "site_analysis.json"), "w", encoding="utf-8") as file:
+        json.dump(analyzer.analyze(), file, indent=2)
+    return feed_path, counts
+
+
+def crawl(args):
+    output_dir = os.path.abspath(args.output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    frontier = args.frontier
+    if frontier is None:
+        frontier_path = os.path.join(output_dir, "frontier.db")
+        # A new crawl starts from an empty frontier; --resume picks up the last one
+        if not args.resume:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(frontier_path + suffix):
+                    os.remove(frontier_path + suffix)
+        frontier = f"sqlite:///{frontier_path}"
+
+    settings = {"FRONTIER_URL": frontier, "FRONTIER_PREFETCH": args.prefetch}
+    if args.incremental:
+        # Pages land on a different worker each run, so the workers share one state
+        settings["CRAWL_STATE_PATH"] = os.path.join(output_dir, "crawl_state.sqlite")
+    options = {
+        "concurrency": args.concurrency,
+        "per_domain": args.per_domain,
+        "download_delay": args.download_delay,
+        "incremental": False,
+        "ai_backend": args.ai_backend,
+        "reports": False,
+        "pdf": False,
+        "log_level": args.log_level,
+    }
+    node = args.node or socket.gethostname()
+    jobs = []
+    for index in range(args.workers):
+        worker = f"{node}-{index}"
+        worker_settings = {**settings, "FRONTIER_WORKER_ID": worker}
+        jobs.append((args.start_url, os.path.join(output_dir, "workers", worker), {**options, "settings": worker_settings}))
+
+    print(f"Crawling {args.start_url} with {args.workers} workers through {frontier}")
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(processes=args.workers, maxtasksperchild=1) as pool:
+        results = pool.map(audit_site, jobs)
+    for result in results:
+        if result["status"] == "ok":
+            print(f"  {os.path.basename(result['output_dir'])}: {result['pages']} pages in {result['crawl_seconds']:.1f}s")
+        else:
+            print(f"  {os.path.basename(result['output_dir'])}: failed\n{result['error']}")
+
+    if args.no_merge:
+        return 0 if all(result["status"] == "ok" for result in results) else 1
+    feeds = [os.path.join(result["output_dir"], "crawl.jsonl") for result in results]
+    return merge(feeds, output_dir, args.start_url, args)
+
+
+def merge(feeds, output_dir, start_url, args):
+    feeds = [path for path in feeds if os.path.exists(path)]
+    feed_path, counts = merge_feeds(feeds, output_dir, start_url)
+    print(f"Merged {counts['pages']} pages from {counts['workers']} workers into {feed_path}"
+          f" ({counts['duplicates']} pages crawled twice)")
+    if not args.no_reports:
+        totals = render_site_reports(output_dir, feed_path, not args.pdf)
+        print(f"Rendered {totals['pages']} reports in {os.path.join(output_dir, 'results')}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Crawl one site with several workers sharing a URL frontier.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    crawl_parser = commands.add_parser("crawl", help="run workers on this machine, then merge their feeds")
+    crawl_parser.add_argument("start_url")
+    crawl_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    crawl_parser.add_argument("--frontier", help="shared FRONTIER_URL (default: a SQLite file in the output directory)")
+    crawl_parser.add_argument("--resume", action="store_true", help="keep the frontier of an interrupted crawl")
+    crawl_parser.add_argument("--node", help="name of this machine in worker IDs (default: host name)")
+    crawl_parser.add_argument("--prefetch", type=int, default=32, help="pages each worker claims ahead")
+    crawl_parser.add_argument("--concurrency", type=int, default=16, help="concurrent requests per worker")
+    crawl_parser.add_argument("--per-domain", type=int, default=16, help="concurrent requests to the site per worker")
+    crawl_parser.add_argument("--download-delay", type=float, default=0.0)
+    crawl_parser.add_argument("--incremental", action="store_true", help="share a crawl state between the workers")
+    crawl_parser.add_argument("--ai-backend", help="AI_BACKEND for the workers, e.g. stub for offline runs")
+    crawl_parser.add_argument("--no-merge", action="store_true", help="leave merging to a later merge command")
+
+    merge_parser = commands.add_parser("merge", help="merge worker feeds, possibly from several machines")
+    merge_parser.add_argument("feeds", nargs="+", help="worker feeds (glob patterns are expanded)")
+    merge_parser.add_argument("--start-url", help="start URL, for click depths in the site analysis")
+
+    for command in (crawl_parser, merge_parser):
+        command.add_argument("--output-dir", default="audit")
+        command.add_argument("--no-reports", action="store_true", help="skip report generation after merging")
+        command.add_argument("--pdf", action="store_true", help="also render PDF reports")
+        command.add_argument("--log-level", default="INFO")
+    args = parser.parse_args(argv)
+
+    if args.command == "crawl":
+        return crawl(args)
+    feeds = sorted(path for pattern in args.feeds for path in (glob.glob(pattern) or [pattern]))
+    return merge(feeds, os.path.abspath(args.output_dir), args.start_url, args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,29 @@
+from scrapy.dupefilters import RFPDupeFilter
+
+from mandevu.utils.urls import canonicalize, seen_set_from_settings, text_fingerprint, url_fingerprint
+
+
+class SeenSetDupeFilter(RFPDupeFilter):
+    """Scrapy's duplicate filter on a compact seen-set (see SEEN_SET).
+
+    RFPDupeFilter keeps a 40-character hex string per request; this keeps a
+    64-bit fingerprint of the canonical URL (or a few bits of a Bloom
+    filter), and URLs differing only in tracking parameters, fragment or
+    query order count as one. Fingerprints are not written to JOBDIR, so a
+    paused crawl that is resumed starts with an empty filter.
+    """
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        dupefilter = cls(debug=crawler.settings.getbool("DUPEFILTER_DEBUG"))
+        dupefilter.fingerprints = seen_set_from_settings(crawler.settings)
+        return dupefilter
+
+    def request_fingerprint(self, request):
+        strip_params = self.fingerprints.strip_params
+        if request.method == "GET" and not request.body:
+            return url_fingerprint(request.url, strip_params)
+        return text_fingerprint(f"{request.method} {canonicalize(request.url, strip_params)} {request.body.hex()}")
+
+    def request_seen(self, request):
+        return not self.fingerprints.add_fingerprint(self.request_fingerprint(request))
@@ -0,0 +1,44 @@
+from itemadapter import ItemAdapter
+from scrapy.exporters import BaseItemExporter
+
+from mandevu.items import PageRecord
+from mandevu.utils.record_feed import MAGIC, encode_items, encode_pages
+
+
+class RecordFeedExporter(BaseItemExporter):
+    """Write the "records" feed format (see mandevu.utils.record_feed).
+
+    Page records are buffered and written a chunk of chunk_size at a time,
+    column by column; other items are written as they come, in chunks of
+    their own. Page dicts (from an older spider or a merge) are converted
+    to PageRecords first. fields_to_export is not supported.
+    """
+
+    def __init__(self, file, chunk_size=256, **kwargs):
+        super().__init__(dont_fail=True, **kwargs)
+        self.file = file
+        self.chunk_size = chunk_size
+        self.pages = []
+
+    def start_exporting(self):
+        self.file.write(MAGIC)
+
+    def export_item(self, item):
+        if not isinstance(item, PageRecord):
+            adapter = ItemAdapter(item)
+            if adapter.get("record_type") != "page":
+                self.flush()
+                self.file.write(encode_items([adapter.asdict()]))
+                return
+            item = PageRecord.from_dict(adapter.asdict())
+        self.pages.append(item)
+        if len(self.pages) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.pages:
+            self.file.write(encode_pages(self.pages))
+            self.pages = []
+
+    def finish_exporting(self):
+        self.flush()
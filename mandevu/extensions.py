@@ -0,0 +1,134 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+from mandevu.utils.timing import StageTimer
+
+
+class StageTimingExtension:
+    """Time feed serialization and log where the audit spent its time.
+
+    The spider, the rule checker and the pipelines add their own stage
+    timings to the stats under stages/. This extension adds feed/export,
+    the time the feed exporter takes to write each item: its item_scraped
+    handler is bracketed by one handler connected before the exporter's
+    (the extension has a lower order than FeedExporter in EXTENSIONS) and
+    one connected after every extension has been created. When the spider
+    closes the stages are logged, slowest first.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.stage_timer = StageTimer()
+        self.export_start = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        extension = cls(crawler)
+        crawler.signals.connect(extension.export_started, signal=signals.item_scraped)
+        crawler.signals.connect(extension.engine_started, signal=signals.engine_started)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        return extension
+
+    def engine_started(self):
+        self.crawler.signals.connect(self.export_finished, signal=signals.item_scraped)
+
+    def export_started(self, item, response, spider):
+        self.export_start = time.perf_counter()
+
+    def export_finished(self, item, response, spider):
+        if self.export_start is not None:
+            self.stage_timer.add("feed/export", time.perf_counter() - self.export_start)
+            self.export_start = None
+
+    def spider_closed(self, spider, reason):
+        stats = self.crawler.stats
+        self.stage_timer.publish(stats)
+
+        stages = {
+            key[len("stages/"):-len("/seconds")]: seconds
+            for key, seconds in stats.get_stats().items()
+            if key.startswith("stages/") and key.endswith("/seconds")
+        }
+        if not stages:
+            return
+        lines = [
+            f"{seconds:10.3f}s {stats.get_value(f'stages/{name}/calls', 0):8d}x  {name}"
+            for name, seconds in sorted(stages.items(), key=lambda stage: stage[1], reverse=True)
+        ]
+        spider.logger.info("Time per stage:\n" + "\n".join(lines))
+
+
+class SamplingProfilerExtension:
+    """Sample the stack of the reactor thread and write it out as folded stacks.
+
+    Enabled by setting PROFILE_PATH. Every PROFILE_INTERVAL seconds a
+    background thread records the call stack the reactor thread is in; at
+    spider close one "frame;frame;frame count" line per distinct stack is
+    written, the input format of flamegraph.pl, speedscope and similar
+    tools. Time the reactor spends waiting for the network shows up under
+    its select/poll call. At the default 100 samples a second the cost is
+    well under one percent of a core.
+    """
+
+    def __init__(self, path, interval=0.01):
+        self.path = path
+        self.interval = interval
+        self.samples = Counter()
+        self.names = {}
+        self.stopping = threading.Event()
+        self.thread = None
+        self.thread_id = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get("PROFILE_PATH")
+        if not path:
+            raise NotConfigured
+        extension = cls(path, crawler.settings.getfloat("PROFILE_INTERVAL", 0.01))
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        return extension
+
+    def spider_opened(self, spider):
+        self.thread_id = threading.get_ident()
+        self.thread = threading.Thread(target=self.sample, name="mandevu-profiler", daemon=True)
+        self.thread.start()
+
+    def sample(self):
+        while not self.stopping.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            # Keyed on code objects; turning them into names is left for the end
+            self.samples[tuple(codes)] += 1
+
+    def frame_name(self, code):
+        name = self.names.get(code)
+        if name is None:
+            module = os.path.splitext(os.path.basename(code.co_filename))[0]
+            name = self.names[code] = f"{module}:{getattr(code, 'co_qualname', code.co_name)}"
+        return name
+
+    def spider_closed(self, spider, reason):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        folded = Counter()
+        for codes, count in self.samples.items():
+            folded[";".join(self.frame_name(code) for code in reversed(codes))] += count
+        with open(self.path, "w", encoding="utf-8") as file:
+            for stack, count in sorted(folded.items()):
+                file.write(f"{stack} {count}\n")
+        spider.logger.info(f"Profile of {sum(folded.values())} samples written to {self.path}")
@@ -3,10 +3,279 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/items.html
 
-import scrapy
+from array import array
+from collections.abc import MutableMapping
+from dataclasses import dataclass
 
+from itemadapter import ItemAdapter
+from itemadapter.adapter import AdapterInterface
 
-class MandevuItem(scrapy.Item):
-    # define the fields for your item here like:
-    # name = scrapy.Field()
-    pass
+from mandevu.utils.extraction import OPEN_GRAPH_PROPERTIES, TWITTER_CARD_NAMES
+from mandevu.utils.timing import TIMING_METRICS
+
+# The fields of a page record, in the order the feeds have always listed them
+PAGE_FIELDS = (
+    "record_type", "url", "meta_title", "meta_description", "canonical", "meta_robots",
+    "h1_tags", "h2_tags", "h3_tags", "h4_tags", "h5_tags", "h6_tags",
+    "internal_links_count", "internal_links", "external_links_count", "external_links",
+    "image_data", "structured_data", "open_graph_data", "twitter_card_data", "hreflang_tags",
+    "viewport", "load_time", "timing", "response_size", "truncated", "redirect_chain",
+    "site_id", "issues_detected", "ai_recommendations",
+)
+
+# Sizes stored for a value that is None, and for a key the record does not have
+NO_SIZE = -1
+ABSENT_SIZE = -2
+
+_interned = {}
+
+
+def intern_value(value):
+    """Return a shared copy of a small repeated value (a status code, a content type).
+
+    A crawl has a handful of distinct statuses and types across millions of
+    links, so each table slot points at one shared object instead of its own.
+    """
+    return _interned.setdefault(value, value)
+
+
+def _joined(urls):
+    # URLs are kept as one newline-separated string; urljoin() never leaves
+    # a newline in a URL, and one that has it anyway is percent-encoded
+    return "\n".join(url.replace("\n", "%0A") for url in urls)
+
+
+class LinkTable:
+    """The checked internal links of a page, as parallel columns rather than one dict per link.
+
+    content_types, sizes and errors are None when no link of the page has one.
+    """
+
+    __slots__ = ("url_text", "statuses", "content_types", "sizes", "errors")
+
+    def __init__(self, url_text="", statuses=(), content_types=None, sizes=None, errors=None):
+        self.url_text = url_text
+        self.statuses = [intern_value(status) for status in statuses]
+        if content_types is not None and any(content_type is not None for content_type in content_types):
+            self.content_types = [None if content_type is None else intern_value(content_type) for content_type in content_types]
+            self.sizes = array("q", sizes)
+        else:
+            self.content_types = self.sizes = None
+        self.errors = list(errors) if errors is not None and any(error is not None for error in errors) else None
+
+    def __len__(self):
+        return len(self.statuses)
+
+    def urls(self):
+        return self.url_text.split("\n") if self.statuses else []
+
+    @classmethod
+    def from_dicts(cls, links):
+        return cls(
+            _joined(link["url"] for link in links),
+            [link.get("status") for link in links],
+            [link.get("content_type") for link in links],
+            [
+                ABSENT_SIZE if "content_type" not in link else NO_SIZE if link.get("size") is None else link["size"]
+                for link in links
+            ],
+            [link.get("error") for link in links],
+        )
+
+    def as_dicts(self):
+        links = [{"url": url, "status": status} for url, status in zip(self.urls(), self.statuses)]
+        if self.content_types is not None:
+            for link, content_type, size in zip(links, self.content_types, self.sizes):
+                if content_type is not None:
+                    link["content_type"] = content_type
+                    link["size"] = None if size == NO_SIZE else size
+        if self.errors is not None:
+            for link, error in zip(links, self.errors):
+                if error is not None:
+                    link["error"] = error
+        return links
+
+
+class ImageTable:
+    """The images of a page, as parallel columns rather than one dict per image."""
+
+    __slots__ = ("src_text", "alts", "sizes", "statuses", "types")
+
+    def __init__(self, src_text="", alts=(), sizes=(), statuses=(), types=()):
+        self.src_text = src_text
+        self.alts = list(alts)
+        self.sizes = array("q", sizes)
+        self.statuses = [intern_value(status) for status in statuses]
+        self.types = [intern_value(kind) for kind in types]
+
+    def __len__(self):
+        return len(self.statuses)
+
+    def srcs(self):
+        return self.src_text.split("\n") if self.statuses else []
+
+    @classmethod
+    def from_dicts(cls, images):
+        return cls(
+            _joined(image["src"] for image in images),
+            [image.get("alt") for image in images],
+            [NO_SIZE if image.get("size") is None else image["size"] for image in images],
+            [image.get("status") for image in images],
+            [image.get("type", "unknown") for image in images],
+        )
+
+    def as_dicts(self):
+        return [
+            {"src": src, "alt": alt, "size": None if size == NO_SIZE else size, "status": status, "type": kind}
+            for src, alt, size, status, kind in zip(self.srcs(), self.alts, self.sizes, self.statuses, self.types)
+        ]
+
+
+def _keyed(keys):
+    return (
+        lambda values: tuple(values.get(key) for key in keys),
+        lambda values: dict(zip(keys, values)),
+    )
+
+
+# Fields stored in a packed form, with the functions packing and unpacking them
+_PACKED = {
+    "internal_links": (LinkTable.from_dicts, LinkTable.as_dicts),
+    "image_data": (ImageTable.from_dicts, ImageTable.as_dicts),
+    "open_graph_data": _keyed(OPEN_GRAPH_PROPERTIES),
+    "twitter_card_data": _keyed(TWITTER_CARD_NAMES),
+    "timing": _keyed(TIMING_METRICS),
+}
+
+# Stored in the slot of a field the record does not have
+ABSENT = object()
+
+
+class PageRecord(MutableMapping):
+    """The audit record of one page, in a compact typed form.
+
+    It reads and writes like the page dict the spider builds (the feeds
+    and pipelines see the same keys and values), but keeps every field in
+    a slot: the links and images are LinkTable and ImageTable columns,
+    statuses and content types are interned, and the fixed-key mappings
+    (Open Graph, Twitter card, timing) are tuples. Reading internal_links
+    or image_data builds a fresh list of dicts, so change them by
+    assignment, not in place. Keys outside PAGE_FIELDS go to extra.
+    """
+
+    __slots__ = PAGE_FIELDS + ("extra",)
+
+    def __init__(self, **fields):
+        for name in PAGE_FIELDS:
+            setattr(self, name, ABSENT)
+        self.extra = None
+        self.update(fields)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def __getitem__(self, key):
+        if key in _FIELD_SET:
+            value = getattr(self, key)
+            if value is ABSENT:
+                raise KeyError(key)
+            if key in _PACKED:
+                return _PACKED[key][1](value)
+            return value
+        if self.extra is None:
+            raise KeyError(key)
+        return self.extra[key]
+
+    def __setitem__(self, key, value):
+        if key in _FIELD_SET:
+            setattr(self, key, _PACKED[key][0](value) if key in _PACKED else value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key):
+        if key in _FIELD_SET:
+            if getattr(self, key) is ABSENT:
+                raise KeyError(key)
+            setattr(self, key, ABSENT)
+        elif self.extra is not None:
+            del self.extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        for name in PAGE_FIELDS:
+            if getattr(self, name) is not ABSENT:
+                yield name
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self):
+        return sum(getattr(self, name) is not ABSENT for name in PAGE_FIELDS) + len(self.extra or ())
+
+    def __contains__(self, key):
+        if key in _FIELD_SET:
+            return getattr(self, key) is not ABSENT
+        return self.extra is not None and key in self.extra
+
+    def __repr__(self):
+        return f"PageRecord(url={getattr(self, 'url', None)!r})"
+
+    def __getstate__(self):
+        # The absent marker is not the same object in another process
+        fields = {name: getattr(self, name) for name in PAGE_FIELDS if getattr(self, name) is not ABSENT}
+        return fields, self.extra
+
+    def __setstate__(self, state):
+        fields, self.extra = state
+        for name in PAGE_FIELDS:
+            setattr(self, name, fields.get(name, ABSENT))
+
+
+_FIELD_SET = frozenset(PAGE_FIELDS)
+
+
+class PageRecordAdapter(AdapterInterface):
+    """Lets Scrapy (feed exporters, ItemAdapter in the pipelines) handle PageRecord items."""
+
+    @classmethod
+    def is_item_class(cls, item_class):
+        return issubclass(item_class, PageRecord)
+
+    @classmethod
+    def get_field_names_from_class(cls, item_class):
+        return list(PAGE_FIELDS)
+
+    def __getitem__(self, field_name):
+        return self.item[field_name]
+
+    def __setitem__(self, field_name, value):
+        self.item[field_name] = value
+
+    def __delitem__(self, field_name):
+        del self.item[field_name]
+
+    def __iter__(self):
+        return iter(self.item)
+
+    def __len__(self):
+        return len(self.item)
+
+
+ItemAdapter.ADAPTER_CLASSES.appendleft(PageRecordAdapter)
+
+
+@dataclass
+class PendingRulesItem:
+    """A page whose checks are done but whose SEO rules still have to run.
+
+    Emitted instead of the page record when the rules run in worker
+    processes (CPU_WORKERS); RuleOffloadPipeline replaces it with the
+    record.
+    """
+
+    page: dict
+    site_record: dict
+    site_issues: list
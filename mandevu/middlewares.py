@@ -3,11 +3,29 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import json
+import logging
+import os
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import scrapy
 from scrapy import signals
+from scrapy.exceptions import DontCloseSpider, NotConfigured, StopDownload
+from twisted.internet import task, threads
+from twisted.python.threadpool import ThreadPool
+
+from mandevu.utils.extraction import is_page_content_type
+from mandevu.utils.frontier import LocalFrontier, SharedResults, open_frontier
+from mandevu.utils.timing import TimingStats, dns_lookups
+from mandevu.utils.urls import seen_set_from_settings
 
 # useful for handling different item types with a single interface
 from itemadapter import is_item, ItemAdapter
 
+logger = logging.getLogger(__name__)
+
 
 class MandevuSpiderMiddleware:
     # Not all methods need to be defined. If a method is not defined,
@@ -36,6 +54,12 @@ class MandevuSpiderMiddleware:
         for i in result:
             yield i
 
+    async def process_spider_output_async(self, response, result, spider):
+        # Same as process_spider_output(), for results produced by an
+        # asynchronous callback.
+        async for i in result:
+            yield i
+
     def process_spider_exception(self, response, exception, spider):
         # Called when a spider or process_spider_input() method
         # (from other spider middleware) raises an exception.
@@ -57,17 +81,72 @@ class MandevuSpiderMiddleware:
 
 
 class MandevuDownloaderMiddleware:
-    # Not all methods need to be defined. If a method is not defined,
-    # scrapy acts as if the downloader middleware does not modify the
-    # passed objects.
+    """Time every download and export the timings.
+
+    The downloader signals mark when a request reached the downloader, when
+    its response headers arrived and when its body was complete; together
+    with the download latency the HTTP handler measures, that splits each
+    download into:
+
+    - queue_wait: waiting for a free download slot (the audit's own limits)
+    - dns: resolving the host name, on the first download from a host
+    - ttfb: from sending the request to the response headers, including
+      the connection and TLS handshake when no pooled connection was free
+    - download: receiving the body
+    - total: ttfb plus download, the time the origin took to serve it
+
+    The timings are put in request.meta["timing"] for the spider, and
+    histograms per URL pattern are written to TIMING_PATH when the spider
+    closes.
+    """
+
+    def __init__(self, stats=None, path=None):
+        self.stats = stats
+        self.path = path
+        self.timings = TimingStats()
 
     @classmethod
     def from_crawler(cls, crawler):
         # This method is used by Scrapy to create your spiders.
-        s = cls()
+        s = cls(crawler.stats, crawler.settings.get("TIMING_PATH"))
         crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(s.request_reached_downloader, signal=signals.request_reached_downloader)
+        crawler.signals.connect(s.headers_received, signal=signals.headers_received)
+        crawler.signals.connect(s.response_downloaded, signal=signals.response_downloaded)
         return s
 
+    def request_reached_downloader(self, request, spider):
+        if not request.url.startswith(("http://", "https://")):
+            return
+        # A redirect copies the meta of the request it replaces, so start afresh
+        request.meta["timing_marks"] = {"queued": time.time()}
+
+    def headers_received(self, headers, body_length, request, spider):
+        request.meta.get("timing_marks", {})["headers"] = time.time()
+
+    def response_downloaded(self, response, request, spider):
+        marks = request.meta.pop("timing_marks", None)
+        if marks is None:
+            return
+        downloaded = time.time()
+        latency = request.meta.get("download_latency")
+        headers = marks.get("headers", downloaded)
+        started = headers - latency if latency is not None else marks["queued"]
+
+        timing = {
+            "queue_wait": round(max(started - marks["queued"], 0.0), 4),
+            "dns": dns_lookups.pop(urlparse(request.url).hostname, None),
+            "ttfb": round(headers - started, 4),
+            "download": round(downloaded - headers, 4),
+            "total": round(downloaded - started, 4),
+            "response_size": len(response.body),
+        }
+        if timing["dns"] is not None:
+            timing["dns"] = round(timing["dns"], 4)
+        request.meta["timing"] = timing
+        self.timings.record(request.method, request.url, timing)
+
     def process_request(self, request, spider):
         # Called for each request that goes through the downloader
         # middleware.
@@ -101,3 +180,524 @@ class MandevuDownloaderMiddleware:
 
     def spider_opened(self, spider):
         spider.logger.info("Spider opened: %s" % spider.name)
+
+    def spider_closed(self, spider):
+        # Lookups no download claimed, e.g. for hosts whose connection failed
+        dns_lookups.clear()
+        summary = self.timings.summary()
+        if self.stats is not None:
+            self.stats.set_value("timing/response_bytes", summary["bytes"])
+            for metric, values in summary["overall"].items():
+                for name in ("p50", "p95", "p99"):
+                    self.stats.set_value(f"timing/{metric}/{name}", values[name])
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as file:
+            json.dump(summary, file, indent=2)
+        spider.logger.info(f"Download timings written to {self.path}")
+
+
+class ConditionalRequestMiddleware:
+    """Send page requests as conditional requests during an incremental audit.
+
+    When the spider has a crawl state, the ETag and Last-Modified stored for
+    a page on the last audit go out as If-None-Match / If-Modified-Since, so
+    unchanged pages come back as an empty 304. The start URL is always
+    fetched in full because the site's security headers are read from it.
+    """
+
+    def process_request(self, request, spider):
+        crawl_state = getattr(spider, "crawl_state", None)
+        if crawl_state is None or request.method != "GET" or request.callback != spider.parse:
+            return None
+        if request.meta.get("security_headers_check"):
+            return None
+
+        # A redirected request keeps the headers of the URL it came from
+        request.headers.pop("If-None-Match", None)
+        request.headers.pop("If-Modified-Since", None)
+
+        validators = crawl_state.validators(request.url)
+        if validators is None:
+            return None
+        etag, last_modified = validators
+        if etag:
+            request.headers["If-None-Match"] = etag
+        if last_modified:
+            request.headers["If-Modified-Since"] = last_modified
+        return None
+
+
+class PageDownloadLimitMiddleware:
+    """Stop downloading page bodies the audit does not need.
+
+    Internal links can point to PDFs, images or archives, which the spider
+    only records as links (status, type and size). For page requests, the
+    download is stopped as soon as the response headers show a Content-Type
+    outside PAGE_CONTENT_TYPES, and an HTML body is cut off after
+    PAGE_MAX_DOWNLOAD_SIZE bytes. Either way the spider gets the response
+    with what was received and the "download_stopped" flag.
+    """
+
+    def __init__(self, stats, content_types, max_size):
+        self.stats = stats
+        self.content_types = content_types
+        self.max_size = max_size
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        middleware = cls(
+            crawler.stats,
+            settings.getlist("PAGE_CONTENT_TYPES"),
+            settings.getint("PAGE_MAX_DOWNLOAD_SIZE"),
+        )
+        crawler.signals.connect(middleware.headers_received, signal=signals.headers_received)
+        if middleware.max_size:
+            crawler.signals.connect(middleware.bytes_received, signal=signals.bytes_received)
+        return middleware
+
+    def is_page_request(self, request, spider):
+        return request.method == "GET" and request.callback == spider.parse
+
+    def headers_received(self, headers, body_length, request, spider):
+        if not self.is_page_request(request, spider):
+            return
+        content_type = headers.get("Content-Type", b"").decode("latin-1")
+        if not is_page_content_type(content_type, self.content_types):
+            self.stats.inc_value("page_download/stopped_not_html")
+            raise StopDownload(fail=False)
+        request.meta["body_received"] = 0
+
+    def bytes_received(self, data, request, spider):
+        received = request.meta.get("body_received")
+        if received is None:
+            return
+        request.meta["body_received"] = received + len(data)
+        if received + len(data) > self.max_size:
+            del request.meta["body_received"]
+            self.stats.inc_value("page_download/stopped_too_large")
+            raise StopDownload(fail=False)
+
+    def process_request(self, request, spider):
+        # A redirect copies the meta of the request it replaces
+        request.meta.pop("body_received", None)
+        return None
+
+
+class FrontierMiddleware:
+    """Hand out the pages of the crawl from a frontier ordered by priority.
+
+    Page requests the spider yields go into the frontier instead of the
+    scheduler, and the frontier's seen-set replaces the duplicate filter for
+    pages. The worker claims the highest-priority queued pages (see
+    page_priority) until it has FRONTIER_PREFETCH of them in progress, and
+    marks them done once the spider has processed them. Keeping the
+    scheduler that short is what lets links found later still reorder the
+    pages waiting in the frontier.
+
+    Without FRONTIER_URL the frontier is a LocalFrontier in this process,
+    refilled as soon as a page is processed. Pages are added to it as the
+    spider yields them, and the link checks of every page it accepts are
+    expected in the spider's link status cache (see StatusCache.expect):
+    the page's own response, or its errback, answers them instead of a
+    HEAD request racing the page download. With FRONTIER_URL (see
+    open_frontier) the crawl of one site is shared between worker
+    processes: each worker refills every FRONTIER_POLL_INTERVAL seconds and
+    the spider is kept open while any worker may still add pages. Every
+    worker still runs the site-wide checks, since its pages need the site
+    record; the start URL is crawled as a page by whichever worker adds it
+    to the frontier first and only read for its headers by the others.
+    The writes to a shared frontier (adding, claiming and finishing pages,
+    shared check results) run in order on a thread of their own, so a
+    frontier locked by another worker never blocks the reactor; only
+    adding the start URL, once, waits for it.
+    """
+
+    def __init__(self, crawler, frontier, worker, prefetch=32, lease=300.0, poll_interval=0.5):
+        self.crawler = crawler
+        self.frontier = frontier
+        self.worker = worker
+        self.prefetch = prefetch
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.in_progress = set()
+        self.finished = []
+        self.poll = None
+        self.pool = None
+        self.refilling = False
+        self.frontier_finished = False
+        self.closed = False
+        self.last_requeue = time.time()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        url = settings.get("FRONTIER_URL")
+        if url:
+            frontier = open_frontier(url, settings.get("FRONTIER_KEY", "mandevu:frontier"))
+        else:
+            frontier = LocalFrontier(seen_set_from_settings(settings))
+        middleware = cls(
+            crawler,
+            frontier,
+            settings.get("FRONTIER_WORKER_ID") or f"{os.uname().nodename}-{os.getpid()}",
+            settings.getint("FRONTIER_PREFETCH", 32),
+            settings.getfloat("FRONTIER_LEASE", 300.0),
+            settings.getfloat("FRONTIER_POLL_INTERVAL", 0.5),
+        )
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def is_page_request(self, request, spider):
+        return isinstance(request, scrapy.Request) and request.callback == spider.parse
+
+    def process_start_requests(self, start_requests, spider):
+        for request in start_requests:
+            if self.is_page_request(request, spider) and request.meta.get("security_headers_check"):
+                if self.frontier.add([request.url], request.priority, claim_for=self.worker, depth=0):
+                    self.expect_pages([request.url], spider)
+                    self.in_progress.add(request.url)
+                    request.meta["frontier_url"] = request.url
+                else:
+                    request.meta["site_checks_only"] = True
+            yield request
+
+    def process_spider_output(self, response, result, spider):
+        pages = {}
+        for request in result:
+            if self.is_page_request(request, spider) and not request.meta.get("security_headers_check"):
+                pages.setdefault((request.priority, request.meta.get("depth", 0)), []).append(request.url)
+                if not self.frontier.shared:
+                    # Before the spider goes on to check the link
+                    self.add_pages(pages)
+                    pages = {}
+            else:
+                yield request
+        self.add_pages(pages)
+        self.page_processed(response.meta.get("frontier_url"))
+
+    async def process_spider_output_async(self, response, result, spider):
+        # Same as process_spider_output(), for asynchronous callbacks
+        pages = {}
+        async for request in result:
+            if self.is_page_request(request, spider) and not request.meta.get("security_headers_check"):
+                pages.setdefault((request.priority, request.meta.get("depth", 0)), []).append(request.url)
+                if not self.frontier.shared:
+                    self.add_pages(pages)
+                    pages = {}
+            else:
+                yield request
+        self.add_pages(pages)
+        self.page_processed(response.meta.get("frontier_url"))
+
+    def process_spider_exception(self, response, exception, spider):
+        self.page_processed(response.meta.get("frontier_url"))
+
+    def add_pages(self, pages):
+        """Add the page URLs a response linked to, grouped by request priority and depth, to the frontier."""
+        for (priority, depth), urls in pages.items():
+            if self.pool is None:
+                self.pages_added(self.frontier.add(urls, priority, depth=depth))
+            else:
+                self.call(self.frontier.add, urls, priority, depth=depth).addCallback(self.pages_added)
+
+    def pages_added(self, added):
+        if added is None:
+            # The frontier call failed and was logged
+            return
+        self.crawler.stats.inc_value("frontier/added", len(added))
+        self.expect_pages(added, self.spider)
+
+    def expect_pages(self, urls, spider):
+        """Let the responses of pages this worker will crawl answer the checks of links to them."""
+        if not self.frontier.shared:
+            # A shared frontier may hand the page to another worker
+            for url in urls:
+                spider.link_statuses.expect(spider.link_statuses.key(url))
+
+    def page_failed(self, failure):
+        self.crawler.stats.inc_value("frontier/failed")
+        self.page_processed(failure.request.meta.get("frontier_url"))
+        return self.spider.handle_page_error(failure)
+
+    def page_processed(self, url):
+        if url in self.in_progress:
+            self.in_progress.discard(url)
+            self.finished.append(url)
+            if not self.frontier.shared:
+                self.refill()
+
+    def spider_opened(self, spider):
+        self.spider = spider
+        if not self.frontier.shared:
+            return
+        self.pool = ThreadPool(1, 1, name="frontier")
+        self.pool.start()
+        # Link and image checks are shared too, or every worker would check
+        # every link it sees
+        spider.link_statuses.shared = SharedResults(self.frontier, "link_status", self.call)
+        spider.image_info.shared = SharedResults(self.frontier, "image_info", self.call)
+        self.poll = task.LoopingCall(self.refill)
+        self.poll.start(self.poll_interval, now=False)
+
+    def call(self, function, *args, **kwargs):
+        """Run a frontier call on the frontier thread; calls run in the order they are made."""
+        from twisted.internet import reactor
+
+        d = threads.deferToThreadPool(reactor, self.pool, function, *args, **kwargs)
+        d.addErrback(self.job_failed, function)
+        return d
+
+    def job_failed(self, failure, function):
+        logger.error("Frontier call %s failed: %s", function.__name__, failure.getErrorMessage())
+
+    def refill(self):
+        """Mark finished pages done and claim new ones up to the prefetch limit."""
+        if self.refilling:
+            return
+        finished, self.finished = self.finished, []
+        requeue = time.time() - self.last_requeue > self.lease / 4
+        if requeue:
+            self.last_requeue = time.time()
+        wanted = self.prefetch - len(self.in_progress)
+        if self.pool is None:
+            self.claimed(self.exchange(finished, requeue, wanted))
+        else:
+            self.refilling = True
+            self.call(self.exchange, finished, requeue, wanted).addCallback(self.claimed)
+
+    def exchange(self, finished, requeue, wanted):
+        """Hand finished pages back to the frontier and take new ones; runs on the frontier thread if shared."""
+        if finished:
+            self.frontier.done(finished)
+        requeued = self.frontier.requeue_expired(self.lease) if requeue else 0
+        pages = self.frontier.claim(self.worker, wanted) if wanted > 0 else []
+        return pages, requeued, self.frontier.finished()
+
+    def claimed(self, result):
+        self.refilling = False
+        if result is None or self.closed:
+            # A failed call was logged and the next refill tries again; pages
+            # claimed as the spider closed go back to the queue when their lease expires
+            return
+        pages, requeued, self.frontier_finished = result
+        if requeued:
+            self.crawler.stats.inc_value("frontier/requeued", requeued)
+        for url, depth in pages:
+            self.in_progress.add(url)
+            self.crawler.engine.crawl(scrapy.Request(
+                url,
+                callback=self.spider.parse,
+                errback=self.page_failed,
+                dont_filter=True,
+                meta={"frontier_url": url, "depth": depth},
+            ))
+        self.crawler.stats.inc_value("frontier/claimed", len(pages))
+
+    def spider_idle(self, spider):
+        # A shared frontier is refilled by the poll. Once finished it stays
+        # finished, as pages are only added while others are claimed, and
+        # the calls still queued on the frontier thread run as it stops
+        if self.pool is None:
+            self.refill()
+        if self.in_progress or not self.frontier_finished:
+            raise DontCloseSpider
+
+    def spider_closed(self, spider):
+        self.closed = True
+        if self.poll is not None and self.poll.running:
+            self.poll.stop()
+        if self.pool is not None:
+            # Runs the frontier calls still queued
+            self.pool.stop()
+        if self.finished:
+            self.frontier.done(self.finished)
+        self.crawler.stats.set_value("frontier/worker", self.worker)
+        self.frontier.close()
+
+
+class AdaptiveConcurrencyMiddleware:
+    """Adapt the concurrency of each host to how well it copes, AIMD style.
+
+    Every host (download slot) starts at ADAPTIVE_CONCURRENCY_START
+    concurrent requests. A response faster than
+    ADAPTIVE_CONCURRENCY_TARGET_LATENCY adds 1/concurrency, so a host that
+    keeps up gains one request per round, up to
+    CONCURRENT_REQUESTS_PER_DOMAIN. A slower response, a timeout or
+    connection error, a 429 or a 503 multiplies it by
+    ADAPTIVE_CONCURRENCY_BACKOFF, down to ADAPTIVE_CONCURRENCY_MIN; only
+    once per round trip, since the answers to one overloaded round arrive
+    together.
+
+    A 429 or 503 also sets a ceiling one below the concurrency it was
+    refused at: the host grows up to it as before, but past it only by one
+    request per ADAPTIVE_CONCURRENCY_PROBE_ROUNDS rounds (twice as many
+    after each refusal just past the ceiling), so a host that rate limits is
+    not refused again every few rounds. It also pauses the host: no request is sent to it for the
+    Retry-After of the response (seconds or an HTTP date), or without one
+    for a backoff that doubles with each refusal in a row, at most
+    ADAPTIVE_CONCURRENCY_MAX_PAUSE seconds. The retry RetryMiddleware
+    schedules waits out the pause in the slot's queue.
+    """
+
+    CONGESTION_STATUSES = (429, 503)
+
+    def __init__(self, crawler, start=4, minimum=1, maximum=16, target_latency=2.0, backoff=0.5, max_pause=60.0,
+                 probe_rounds=10):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.start = start
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.max_pause = max_pause
+        self.probe_rounds = probe_rounds
+        self.hosts = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("ADAPTIVE_CONCURRENCY_ENABLED"):
+            raise NotConfigured
+        maximum = settings.getint("CONCURRENT_REQUESTS_PER_DOMAIN")
+        middleware = cls(
+            crawler,
+            min(settings.getint("ADAPTIVE_CONCURRENCY_START", 4), maximum),
+            settings.getint("ADAPTIVE_CONCURRENCY_MIN", 1),
+            maximum,
+            settings.getfloat("ADAPTIVE_CONCURRENCY_TARGET_LATENCY", 2.0),
+            settings.getfloat("ADAPTIVE_CONCURRENCY_BACKOFF", 0.5),
+            settings.getfloat("ADAPTIVE_CONCURRENCY_MAX_PAUSE", 60.0),
+            settings.getint("ADAPTIVE_CONCURRENCY_PROBE_ROUNDS", 10),
+        )
+        crawler.signals.connect(middleware.request_reached_downloader, signal=signals.request_reached_downloader)
+        crawler.signals.connect(middleware.response_downloaded, signal=signals.response_downloaded)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def host(self, request):
+        """Return the controller state and downloader slot of a request's host."""
+        key = request.meta.get("download_slot")
+        slot = self.crawler.engine.downloader.slots.get(key)
+        # data: and file: requests have a slot without a host
+        if not key or slot is None:
+            return None, None
+        state = self.hosts.get(key)
+        if state is None:
+            state = self.hosts[key] = {
+                "concurrency": float(self.start),
+                "ceiling": self.maximum,
+                "probe_rounds": self.probe_rounds,
+                "decreased_at": 0.0,
+                "latency": 0.0,
+                "refusals": 0,
+                "paused_until": 0.0,
+                "delay": slot.delay,
+                "randomize_delay": slot.randomize_delay,
+            }
+        return state, slot
+
+    def request_reached_downloader(self, request, spider):
+        # The downloader creates a host's slot with CONCURRENT_REQUESTS_PER_DOMAIN
+        # just before this signal, and again after an idle slot is dropped
+        state, slot = self.host(request)
+        if slot is not None:
+            slot.concurrency = int(state["concurrency"])
+
+    def response_downloaded(self, response, request, spider):
+        state, slot = self.host(request)
+        if slot is None:
+            return
+        latency = request.meta.get("download_latency") or 0.0
+        state["latency"] = latency
+        if response.status in self.CONGESTION_STATUSES:
+            self.stats.inc_value(f"adaptive_concurrency/refused/{response.status}")
+            # Refusals of requests sent before the pause are the same overload
+            if time.time() >= state["paused_until"]:
+                if int(state["concurrency"]) <= state["ceiling"] + 1:
+                    # Refused again just past the ceiling: probe half as often
+                    state["probe_rounds"] *= 2
+                state["ceiling"] = max(self.minimum, int(state["concurrency"]) - 1)
+                self.decrease(state, slot, force=True)
+                self.pause(state, slot, self.retry_after(response))
+        elif latency > self.target_latency:
+            self.stats.inc_value("adaptive_concurrency/slow_responses")
+            self.decrease(state, slot)
+        else:
+            state["refusals"] = 0
+            self.increase(state, slot)
+
+    def process_exception(self, request, exception, spider):
+        state, slot = self.host(request)
+        if slot is not None:
+            self.stats.inc_value("adaptive_concurrency/download_errors")
+            self.decrease(state, slot)
+        return None
+
+    def increase(self, state, slot):
+        step = 1 / state["concurrency"]
+        if state["concurrency"] >= state["ceiling"]:
+            step /= state["probe_rounds"]
+        state["concurrency"] = min(self.maximum, state["concurrency"] + step)
+        slot.concurrency = int(state["concurrency"])
+
+    def decrease(self, state, slot, force=False):
+        now = time.monotonic()
+        if not force and now - state["decreased_at"] < state["latency"]:
+            return
+        state["decreased_at"] = now
+        state["concurrency"] = max(self.minimum, state["concurrency"] * self.backoff)
+        slot.concurrency = int(state["concurrency"])
+        self.stats.inc_value("adaptive_concurrency/decreases")
+
+    def retry_after(self, response):
+        """Return the seconds a Retry-After header asks to wait, or None."""
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        value = value.decode("latin-1").strip()
+        if value.isdigit():
+            return float(value)
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def pause(self, state, slot, seconds):
+        """Hold back the host's requests for seconds (a doubling backoff when None)."""
+        if seconds is None:
+            seconds = 2.0 ** state["refusals"]
+        state["refusals"] += 1
+        seconds = min(seconds, self.max_pause)
+        now = time.time()
+        if seconds <= 0 or now + seconds <= state["paused_until"]:
+            return
+        state["paused_until"] = now + seconds
+        self.stats.inc_value("adaptive_concurrency/pauses")
+        self.stats.max_value("adaptive_concurrency/max_pause", round(seconds, 1))
+        # The downloader sends a slot's next request once delay seconds have
+        # passed since it sent the last one, and one at a time while there is
+        # a delay; the normal delay is put back when the pause is over
+        slot.delay = state["paused_until"] - slot.lastseen
+        slot.randomize_delay = False
+
+        from twisted.internet import reactor
+
+        reactor.callLater(seconds, self.resume, state, slot)
+
+    def resume(self, state, slot):
+        if time.time() < state["paused_until"]:
+            return
+        slot.delay = state["delay"]
+        slot.randomize_delay = state["randomize_delay"]
+
+    def spider_closed(self, spider):
+        for key, state in self.hosts.items():
+            spider.logger.info(f"Adaptive concurrency for {key}: {int(state['concurrency'])} at the end of the crawl")
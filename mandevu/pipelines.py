@@ -4,10 +4,394 @@
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 
 
+import json
+import logging
+import os
+import time
+from collections import deque
+
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
+from scrapy.exceptions import NotConfigured
+from twisted.internet import defer, threads
+from twisted.python.threadpool import ThreadPool
+
+from mandevu.items import PendingRulesItem
+from mandevu.utils.audit_store import AuditStore
+from mandevu.utils.generate_report import SITE_SUMMARY_FILE, SiteSummary, render_page, write_site_summary
+from mandevu.utils.offload import evaluate_rules
+from mandevu.utils.site_analysis import SiteAnalyzer
+from mandevu.utils.timing import StageTimer
+from mandevu.utils.together_ai import BACKENDS, RecommendationService
+
+
+logger = logging.getLogger(__name__)
+
+
+class RuleOffloadPipeline:
+    """Run the SEO rules of pages in the spider's worker processes.
+
+    The spider emits a PendingRulesItem instead of the page record when it
+    has a CPU pool; the rules run in a worker and the item is replaced by
+    the completed record. Other items pass straight through.
+    """
+
+    def process_item(self, item, spider):
+        if not isinstance(item, PendingRulesItem):
+            return item
+        d = spider.cpu_pool.submit(evaluate_rules, item.page["seo_data"], item.site_record)
+        d.addCallback(self.complete, item, spider)
+        return d
+
+    def complete(self, result, item, spider):
+        seo_issues, rule_seconds = result
+        for name, seconds in rule_seconds.items():
+            spider.stage_timer.add(name, seconds)
+        return spider.complete_page(item.page, item.site_issues, seo_issues)
+
+
+class AIRecommendationPipeline:
+    """Attach AI recommendations to page items without blocking the crawl.
+
+    Hits in the memory cache are attached straight away. Other issue sets
+    are held for up to AI_BATCH_DELAY seconds, or until AI_BATCH_SIZE
+    distinct ones are waiting, and then looked up together in a worker
+    thread, which reads the disk cache before asking the backend. Items
+    that share an issue set wait on the same lookup.
+    """
+
+    def __init__(self, service, batch_size=8, batch_delay=1.0, stats=None):
+        self.service = service
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.stats = stats
+        self.waiting = {}
+        self.in_flight = {}
+        self.flush_call = None
+        self.stage_timer = StageTimer()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        backend = BACKENDS[settings.get("AI_BACKEND", "together")]()
+        batch_size = settings.getint("AI_BATCH_SIZE", 8)
+        service = RecommendationService(backend, cache_dir=settings.get("AI_CACHE_DIR"), batch_size=batch_size)
+        return cls(service, batch_size, settings.getfloat("AI_BATCH_DELAY", 1.0), crawler.stats)
+
+    def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+        if "issues_detected" not in adapter:
+            return item
+
+        issues = adapter["issues_detected"]
+        key = self.service.cache_key(self.service.canonicalize(issues))
+        cached = self.service.cached(key, disk=False)
+        if cached is not None:
+            adapter["ai_recommendations"] = cached
+            return item
+
+        d = defer.Deferred()
+        d.addCallback(self.attach, item)
+        if key in self.in_flight:
+            self.in_flight[key].append(d)
+            return d
+
+        self.waiting.setdefault(key, (issues, []))[1].append(d)
+        if len(self.waiting) >= self.batch_size:
+            self.flush()
+        elif self.flush_call is None:
+            from twisted.internet import reactor
+            self.flush_call = reactor.callLater(self.batch_delay, self.flush)
+        return d
+
+    def attach(self, result, item):
+        ItemAdapter(item)["ai_recommendations"] = result
+        return item
+
+    def flush(self):
+        """Send every waiting issue set to the backend in one worker-thread call."""
+        if self.flush_call is not None and self.flush_call.active():
+            self.flush_call.cancel()
+        self.flush_call = None
+        if not self.waiting:
+            return
+
+        batch, self.waiting = self.waiting, {}
+        keys = list(batch)
+        for key, (_, deferreds) in batch.items():
+            self.in_flight[key] = deferreds
+
+        d = threads.deferToThread(self.service.recommend_many, [issues for issues, _ in batch.values()])
+        d.addBoth(self.timed, time.perf_counter())
+        d.addCallbacks(self.deliver, self.deliver_error, callbackArgs=(keys,), errbackArgs=(keys,))
+
+    def timed(self, result, start):
+        # Wall time of the lookup in its worker thread, not time the reactor was blocked
+        self.stage_timer.add("ai/lookup", time.perf_counter() - start)
+        return result
+
+    def deliver(self, results, keys):
+        for key, result in zip(keys, results):
+            for d in self.in_flight.pop(key):
+                d.callback(result)
+
+    def deliver_error(self, failure, keys):
+        logger.error("AI recommendation lookup failed: %s", failure.getErrorMessage())
+        error = {"Recommendations": [f"Error: {failure.getErrorMessage()}"]}
+        self.deliver([error] * len(keys), keys)
+
+    def close_spider(self, spider):
+        self.flush()
+        if self.stats is not None:
+            self.stage_timer.publish(self.stats)
+
+
+class SiteAnalysisPipeline:
+    """Run the cross-page site analysis once the crawl is over.
+
+    Each page item adds its links, redirects and text hashes to a compact
+    link graph as it passes through. When the spider closes, orphans, click
+    depth, internal authority, redirect chains, duplicate titles,
+    descriptions and H1s and the sitemap coverage are written to
+    SITE_ANALYSIS_PATH for the report.
+    """
+
+    def __init__(self, path, stats=None):
+        self.path = path
+        self.stats = stats
+        self.analyzer = None
+        self.analysis = None
+        self.stage_timer = StageTimer()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings.get("SITE_ANALYSIS_PATH", "site_analysis.json"), crawler.stats)
+
+    def open_spider(self, spider):
+        self.analyzer = SiteAnalyzer(spider.start_urls[0], getattr(spider, "sitemap_index", None))
+        # For the site summary of ReportPipeline: pipelines close in reverse order, so it asks first
+        spider.analyze_site = self.analyze
+
+    def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+        if adapter.get("record_type") == "page":
+            self.analyzer.add(adapter)
+        return item
+
+    def analyze(self):
+        """Return the site analysis, computing it the first time it is asked for."""
+        if self.analysis is None:
+            with self.stage_timer.stage("site_analysis/analyze"):
+                self.analysis = self.analyzer.analyze()
+        return self.analysis
+
+    def close_spider(self, spider):
+        analysis = self.analyze()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as file:
+            json.dump(analysis, file, indent=2)
+
+        if self.stats is not None:
+            self.stage_timer.publish(self.stats)
+            self.stats.set_value("site_analysis/orphans", len(analysis["orphans"]))
+            self.stats.set_value("site_analysis/redirect_chains", len(analysis["redirect_chains"]))
+            for field, groups in analysis["duplicates"].items():
+                self.stats.set_value(f"site_analysis/duplicate_{field}", len(groups))
+            if analysis["sitemap"] is not None:
+                self.stats.set_value("site_analysis/sitemap_not_crawled", len(analysis["sitemap"]["not_crawled"]))
+                self.stats.set_value("site_analysis/not_in_sitemap", len(analysis["sitemap"]["not_in_sitemap"]))
+        spider.logger.info(
+            f"Site analysis written to {self.path}: {analysis['pages']} pages, "
+            f"{len(analysis['orphans'])} orphans, {len(analysis['redirect_chains'])} redirect chains"
+        )
+
+
+class AuditStorePipeline:
+    """Add each crawl to the audit history at AUDIT_STORE_PATH as a new run.
+
+    Page items are written AUDIT_STORE_BATCH_SIZE at a time in a worker
+    thread, one batch after the other, so the SQLite writes never hold up
+    the reactor. See mandevu.utils.audit_store for the queries.
+    """
+
+    def __init__(self, path, batch_size=200):
+        self.path = path
+        self.batch_size = batch_size
+        self.store = None
+        self.run_id = None
+        self.batch = []
+        self.writing = None
 
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get("AUDIT_STORE_PATH")
+        if not path:
+            raise NotConfigured
+        return cls(path, crawler.settings.getint("AUDIT_STORE_BATCH_SIZE", 200))
+
+    def open_spider(self, spider):
+        self.store = AuditStore(self.path, check_same_thread=False)
+        self.run_id = self.store.start_run(spider.site_record["site_id"], label=spider.start_urls[0])
+        self.writing = defer.succeed(None)
 
-class MandevuPipeline:
     def process_item(self, item, spider):
+        if ItemAdapter(item).get("record_type") == "page":
+            self.batch.append(item)
+            if len(self.batch) >= self.batch_size:
+                self.write(self.store.add_pages, self.run_id, self.batch)
+                self.batch = []
         return item
+
+    def write(self, function, *args):
+        """Run a store call in a worker thread once the previous one is done."""
+        self.writing.addCallback(lambda _: threads.deferToThread(function, *args))
+        self.writing.addErrback(self.write_error)
+
+    def write_error(self, failure):
+        logger.error("Audit store write failed: %s", failure.getErrorMessage())
+
+    def close_spider(self, spider):
+        self.write(self.store.add_pages, self.run_id, self.batch)
+        self.write(self.store.finish_run, self.run_id)
+        self.write(self.store.close)
+        self.batch = []
+        spider.logger.info(f"Audit stored as run {self.run_id} in {self.path}")
+        return self.writing
+
+
+class ReportPipeline:
+    """Render the report of each page while the crawl goes on.
+
+    Page items are rendered (see generate_report.render_page) straight from
+    memory by REPORT_WORKERS threads of their own. At most
+    REPORT_MAX_PENDING pages are queued or rendering; past that,
+    process_item returns a Deferred that fires once one is done, so the
+    item stays in the scraper and, through SCRAPER_SLOT_MAX_ACTIVE_SIZE,
+    downloads slow down to the pace of the renderer. When the spider
+    closes, the queued pages are finished and a site summary (issue counts,
+    slowest pages and the site analysis) is written next to the reports.
+
+    The site analysis is only known at the end, so page reports link to the
+    summary instead of showing their click depth or authority; rendering
+    from the feed with generate_report.py still shows them. Disabled by an
+    empty REPORT_DIR.
+    """
+
+    def __init__(self, results_dir, html_only=False, workers=2, max_pending=64, stats=None):
+        self.results_dir = results_dir
+        self.html_only = html_only
+        self.workers = workers
+        self.max_pending = max_pending
+        self.stats = stats
+        self.pool = None
+        self.pending = 0
+        self.waiting = deque()
+        self.drained = None
+        self.site = {}
+        self.summary = SiteSummary()
+        self.stage_timer = StageTimer()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        results_dir = settings.get("REPORT_DIR")
+        if not results_dir:
+            raise NotConfigured
+        return cls(
+            results_dir,
+            not settings.getbool("REPORT_PDF"),
+            settings.getint("REPORT_WORKERS", 2),
+            settings.getint("REPORT_MAX_PENDING", 64),
+            crawler.stats,
+        )
+
+    def open_spider(self, spider):
+        os.makedirs(self.results_dir, exist_ok=True)
+        self.pool = ThreadPool(1, self.workers, name="reports")
+        self.pool.start()
+
+    def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+        record_type = adapter.get("record_type")
+        if record_type == "site":
+            # The spider holds pages back until their site record is out
+            self.site = {key: adapter.get(key, "Unknown") for key in ("ssl_cert", "security_headers")}
+            self.summary.add_site(adapter)
+            return item
+        if record_type != "page":
+            return item
+
+        self.summary.add_page(adapter)
+        if self.pending < self.max_pending:
+            self.submit(item)
+            return item
+        self.stats.inc_value("report/held_back")
+        d = defer.Deferred()
+        self.waiting.append((item, d))
+        return d
+
+    def submit(self, item):
+        from twisted.internet import reactor
+
+        self.pending += 1
+        d = threads.deferToThreadPool(reactor, self.pool, self.render, item, dict(self.site))
+        d.addCallbacks(self.rendered, self.render_error, errbackArgs=(item,))
+        d.addBoth(self.next)
+
+    def render(self, item, site):
+        # In a report thread; the item is only read, while the feed exporter
+        # may be reading it too
+        entry = {**ItemAdapter(item).asdict(), **site, "site_report": SITE_SUMMARY_FILE}
+        return render_page(entry, self.results_dir, self.html_only)
+
+    def rendered(self, result):
+        self.stats.inc_value("report/pages")
+        for stage, seconds in result["timings"].items():
+            self.stage_timer.add(f"report/{stage}", seconds)
+        if result["pdf_skipped"]:
+            self.stats.inc_value("report/pdf_unchanged")
+
+    def render_error(self, failure, item):
+        self.stats.inc_value("report/errors")
+        logger.error("Report of %s failed: %s", ItemAdapter(item).get("url"), failure.getErrorMessage())
+
+    def next(self, _):
+        self.pending -= 1
+        if self.waiting:
+            item, d = self.waiting.popleft()
+            self.submit(item)
+            d.callback(item)
+        elif not self.pending and self.drained is not None and not self.drained.called:
+            self.drained.callback(None)
+
+    def close_spider(self, spider):
+        from twisted.internet import reactor
+
+        closed_at = time.perf_counter()
+        self.drained = defer.Deferred()
+        if not self.pending:
+            self.drained.callback(None)
+
+        def write_summary(_):
+            self.stage_timer.add("report/drain", time.perf_counter() - closed_at)
+            analyze_site = getattr(spider, "analyze_site", None)
+            context = self.summary.context(analyze_site() if analyze_site is not None else None)
+            return threads.deferToThreadPool(reactor, self.pool, write_site_summary, context, self.results_dir)
+
+        def summary_written(path):
+            spider.logger.info(f"Reports of {self.summary.pages} pages and the site summary written to {path}")
+
+        def summary_error(failure):
+            logger.error("Site summary failed: %s", failure.getErrorMessage())
+
+        def finish(_):
+            self.pool.stop()
+            self.stage_timer.publish(self.stats)
+
+        d = self.drained
+        d.addCallback(write_summary)
+        d.addCallbacks(summary_written, summary_error)
+        d.addBoth(finish)
+        return d
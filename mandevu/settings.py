@@ -7,20 +7,54 @@
 #     https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
 #     https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
 BOT_NAME = "mandevu"
 
 SPIDER_MODULES = ["mandevu.spiders"]
 NEWSPIDER_MODULE = "mandevu.spiders"
 
+# The crawl output is shared with generate_report.py through JSON_FILE_PATH.
+# Its extension picks the format: .json writes one indented JSON array,
+# .jsonl writes JSON Lines (one record per line, readable while the crawl is
+# still running), .jsonl.gz writes gzip-compressed JSON Lines and .records
+# writes the compact binary format of mandevu.utils.record_feed.
+feed_path = os.getenv("JSON_FILE_PATH", "trial.json")
+if feed_path.endswith(".records"):
+    feed_options = {"format": "records"}
+elif feed_path.endswith(".jsonl.gz"):
+    feed_options = {
+        "format": "jsonlines",
+        "postprocessing": ["scrapy.extensions.postprocessing.GzipPlugin"],
+    }
+elif feed_path.endswith(".jsonl"):
+    feed_options = {"format": "jsonlines"}
+else:
+    feed_options = {"format": "json", "indent": 4}
+
+FEED_EXPORTERS = {
+    "records": "mandevu.exporters.RecordFeedExporter",
+}
+
 FEEDS = {
-    "trial.json": {
-        "format": "json",
+    feed_path: {
+        **feed_options,
         "encoding": "utf8",
-        "indent": 4,
         "overwrite": True,
     },
 }
 
+# Cross-page analysis (orphans, click depth, internal authority, redirect
+# chains, duplicate content) written at the end of the crawl, next to the feed
+SITE_ANALYSIS_PATH = os.path.join(os.path.dirname(feed_path), "site_analysis.json")
+
+# Download timing histograms per URL pattern, written when the crawl closes
+TIMING_PATH = os.path.join(os.path.dirname(feed_path), "timing.json")
+
 
 
 # Crawl responsibly by identifying yourself (and your website) on the user-agent
@@ -29,17 +63,99 @@ FEEDS = {
 # Obey robots.txt rules
 ROBOTSTXT_OBEY = True
 
+# Maximum number of link statuses kept in the crawl-wide cache (least recently
+# used entries are evicted first)
+LINK_STATUS_CACHE_SIZE = 10000
+# Same for image sizes and types found by the image inspection requests
+IMAGE_INFO_CACHE_SIZE = 10000
+
+# Seen-set of crawled pages, used by the spider and the duplicate filter:
+# "fingerprints" keeps a 64-bit hash per URL (16-32 bytes each), "bloom" a
+# Bloom filter sized for SEEN_SET_CAPACITY URLs that wrongly skips about
+# SEEN_SET_ERROR_RATE of the pages
+SEEN_SET = "fingerprints"
+SEEN_SET_CAPACITY = 1000000
+SEEN_SET_ERROR_RATE = 0.001
+DUPEFILTER_CLASS = "mandevu.dupefilters.SeenSetDupeFilter"
+# Query parameters dropped when comparing URLs (a trailing * matches any
+# suffix), so tracking variants of a page are crawled once
+URL_STRIP_PARAMS = [
+    "utm_*", "gclid", "gclsrc", "dclid", "fbclid", "msclkid", "yclid", "igshid",
+    "mc_cid", "mc_eid", "_ga", "_gl", "_hsenc", "_hsmi", "mkt_tok",
+]
+
+# Responses audited as pages; for other content types only the status, type
+# and size of the link are recorded and the body is not downloaded. HTML
+# bodies are cut off after PAGE_MAX_DOWNLOAD_SIZE bytes, and only the head
+# plus PAGE_PARSE_WINDOW bytes of the rest are parsed.
+PAGE_CONTENT_TYPES = ["text/html", "application/xhtml+xml"]
+PAGE_MAX_DOWNLOAD_SIZE = 5 * 1024 * 1024
+PAGE_PARSE_WINDOW = 1024 * 1024
+
+# Worker processes parsing pages and running the SEO rules, so the reactor
+# thread only does I/O; 0 runs them on the reactor thread. At most
+# CPU_MAX_PENDING pages are handed to the workers at a time (0: twice the
+# number of workers), and pages waiting for them count towards
+# SCRAPER_SLOT_MAX_ACTIVE_SIZE, which holds back new downloads.
+CPU_WORKERS = 0
+CPU_MAX_PENDING = 0
+
+# Timeout (seconds) for the site-wide TLS handshake, robots.txt and
+# sitemap.xml checks that run alongside the start of the crawl
+PREFLIGHT_TIMEOUT = 10
+
+# SQLite file holding the state of the last audit (validators, content hash,
+# page record and rule issues per URL). When set, re-runs send conditional
+# requests and reuse the stored results for pages that have not changed.
+CRAWL_STATE_PATH = os.getenv("CRAWL_STATE_PATH")
+
+# SQLite history of every audit (see mandevu.utils.audit_store). When set,
+# each crawl is added to it as a new run, AUDIT_STORE_BATCH_SIZE pages per
+# write, for issue queries and diffs across runs.
+AUDIT_STORE_PATH = os.getenv("AUDIT_STORE_PATH")
+AUDIT_STORE_BATCH_SIZE = 200
+
+# Distributed crawl: workers given the same FRONTIER_URL (sqlite:///file.db,
+# redis://host:6379/0 or memory://) share one URL frontier and seen-set.
+# Without it the frontier is kept in this process; either way pages are
+# crawled highest priority first (see mandevu.utils.frontier.page_priority)
+# and FRONTIER_PREFETCH of them are handed to the scheduler at a time.
+FRONTIER_URL = os.getenv("FRONTIER_URL")
+FRONTIER_WORKER_ID = os.getenv("FRONTIER_WORKER_ID")
+FRONTIER_PREFETCH = 32
+FRONTIER_LEASE = 300
+
+# Times uncached DNS lookups so downloads can report them
+DNS_RESOLVER = "mandevu.utils.timing.TimingResolver"
+
 # Configure maximum concurrent requests performed by Scrapy (default: 16)
-#CONCURRENT_REQUESTS = 32
+CONCURRENT_REQUESTS = 32
 
 # Configure a delay for requests for the same website (default: 0)
 # See https://docs.scrapy.org/en/latest/topics/settings.html#download-delay
 # See also autothrottle settings and docs
-#DOWNLOAD_DELAY = 3
-# The download delay setting will honor only one of:
-#CONCURRENT_REQUESTS_PER_DOMAIN = 16
+DOWNLOAD_DELAY = 0
+# The most concurrent requests sent to one host; AdaptiveConcurrencyMiddleware
+# moves each host between ADAPTIVE_CONCURRENCY_MIN and this
+CONCURRENT_REQUESTS_PER_DOMAIN = 16
 #CONCURRENT_REQUESTS_PER_IP = 16
 
+# Per-host concurrency driven by latency, 429/503 responses and Retry-After
+# (see AdaptiveConcurrencyMiddleware): hosts start at
+# ADAPTIVE_CONCURRENCY_START, gain one request per round of responses faster
+# than ADAPTIVE_CONCURRENCY_TARGET_LATENCY seconds and are cut by
+# ADAPTIVE_CONCURRENCY_BACKOFF on slow responses and errors. A 429 or 503
+# pauses the host for its Retry-After, at most ADAPTIVE_CONCURRENCY_MAX_PAUSE,
+# and growth past the concurrency it was refused at then takes
+# ADAPTIVE_CONCURRENCY_PROBE_ROUNDS rounds per request.
+ADAPTIVE_CONCURRENCY_ENABLED = True
+ADAPTIVE_CONCURRENCY_START = 4
+ADAPTIVE_CONCURRENCY_MIN = 1
+ADAPTIVE_CONCURRENCY_TARGET_LATENCY = 2.0
+ADAPTIVE_CONCURRENCY_BACKOFF = 0.5
+ADAPTIVE_CONCURRENCY_MAX_PAUSE = 60.0
+ADAPTIVE_CONCURRENCY_PROBE_ROUNDS = 10
+
 # Disable cookies (enabled by default)
 #COOKIES_ENABLED = False
 
@@ -56,29 +172,67 @@ ROBOTSTXT_OBEY = True
 # See https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 SPIDER_MIDDLEWARES = {
     "mandevu.middlewares.MandevuSpiderMiddleware": 543,
+    "mandevu.middlewares.FrontierMiddleware": 545,
 }
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
 DOWNLOADER_MIDDLEWARES = {
     "mandevu.middlewares.MandevuDownloaderMiddleware": 543,
+    "mandevu.middlewares.PageDownloadLimitMiddleware": 545,
+    "mandevu.middlewares.ConditionalRequestMiddleware": 550,
+    # Closer to the downloader than RetryMiddleware (550), so it sees the
+    # download errors before they are turned into retries
+    "mandevu.middlewares.AdaptiveConcurrencyMiddleware": 580,
 }
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
-#EXTENSIONS = {
-#    "scrapy.extensions.telnet.TelnetConsole": None,
-#}
+EXTENSIONS = {
+    # Ordered before FeedExporter (0) so it can time the feed export
+    "mandevu.extensions.StageTimingExtension": -1,
+    "mandevu.extensions.SamplingProfilerExtension": 500,
+}
+
+# When set, the reactor thread's stack is sampled every PROFILE_INTERVAL
+# seconds and written to this file as folded stacks for a flame graph
+PROFILE_PATH = os.getenv("PROFILE_PATH")
+PROFILE_INTERVAL = 0.01
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 ITEM_PIPELINES = {
-   "mandevu.pipelines.MandevuPipeline": 300,
+   "mandevu.pipelines.RuleOffloadPipeline": 150,
+   "mandevu.pipelines.AIRecommendationPipeline": 200,
+   "mandevu.pipelines.SiteAnalysisPipeline": 250,
+   "mandevu.pipelines.AuditStorePipeline": 260,
+   "mandevu.pipelines.ReportPipeline": 300,
 }
 
+# Reports rendered while the crawl runs (see ReportPipeline): an HTML report
+# per page in REPORT_DIR, plus a PDF of each with REPORT_PDF (needs
+# wkhtmltopdf), by REPORT_WORKERS threads with at most REPORT_MAX_PENDING
+# pages queued, and a site summary when the crawl closes. An empty
+# REPORT_DIR turns them off.
+REPORT_DIR = os.path.join(os.path.dirname(feed_path), "results")
+REPORT_PDF = False
+REPORT_WORKERS = 2
+REPORT_MAX_PENDING = 64
+
+# AI recommendations: backend ("together" or the offline "stub"), on-disk
+# cache directory, and how many distinct issue sets are sent per API call or
+# how long (seconds) to wait for a batch to fill up
+AI_BACKEND = "together"
+AI_CACHE_DIR = ".ai_cache"
+AI_BATCH_SIZE = 8
+AI_BATCH_DELAY = 1.0
+
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
-#AUTOTHROTTLE_ENABLED = True
+# Left off: it throttles with a per-host download delay, which holds every
+# host to about AUTOTHROTTLE_TARGET_CONCURRENCY requests at a time whatever
+# AdaptiveConcurrencyMiddleware allows, and ignores 429s and Retry-After.
+AUTOTHROTTLE_ENABLED = False
 # The initial download delay
 #AUTOTHROTTLE_START_DELAY = 5
 # The maximum download delay to be set in case of high latencies
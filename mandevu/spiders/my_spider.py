@@ -1,90 +1,151 @@
 import scrapy
+import asyncio
 import json
 from scrapy.linkextractors import LinkExtractor
 from mandevu.utils.seo_rules import SEORuleChecker
-from mandevu.utils.together_ai import get_recommendations
+from mandevu.utils.status_cache import StatusCache
+from mandevu.items import PageRecord, PendingRulesItem
+from mandevu.utils.extraction import is_page_content_type
+from mandevu.utils.frontier import page_priority
+from mandevu.utils.offload import ProcessPool, extract_body, extract_response
+from mandevu.utils.sitemap import SitemapIndex, iter_sitemap
+from mandevu.utils.crawl_state import CrawlState
+from mandevu.utils.timing import TIMING_METRICS, StageTimer
+from mandevu.utils.urls import seen_set_from_settings
 import time
-import os
-import subprocess
-import requests
 import ssl
-import socket
 from datetime import datetime
+from urllib.parse import urlparse
+from lxml import etree
+from scrapy.utils.defer import maybe_deferred_to_future
 
 class SEOAuditSpider(scrapy.Spider):
     name = "seo_audit"
     allowed_domains = ["allanwanjiku.tech"]
     start_urls = ["https://allanwanjiku.tech/"]
 
-    handle_httpstatus_list = [404]
-    visited_links = set()
-    all_pages = set()
-    linked_pages = set()
-    results = []
-    seo_data = {"robots_txt": None, "sitemap": None}
-
-    def check_ssl_cert(self, url):
-        """Check SSL certificate validity."""
-        hostname = url.replace("https://", "").replace("http://", "").split("/")[0]
+    handle_httpstatus_list = [304, 404]
+
+    # Link and image checks see every error status, but let RedirectMiddleware follow redirects
+    check_httpstatus_list = list(range(400, 600))
+
+    # Site-wide checks that must finish before page items can be completed
+    site_checks = ("robots_txt", "sitemap", "ssl_cert", "security_headers")
+
+    def __init__(self, start_url=None, *args, **kwargs):
+        """Audit start_url (scrapy crawl seo_audit -a start_url=...) or the default site.
+
+        All crawl state lives on the instance, so several audits can run in
+        one process without sharing anything.
+        """
+        super().__init__(*args, **kwargs)
+        if start_url:
+            # Crawled as given; the site-wide checks use the site root (see site_url)
+            self.start_urls = [start_url if "://" in start_url else f"https://{start_url}"]
+            self.allowed_domains = [urlparse(self.start_urls[0]).hostname]
+
+    def site_url(self, path=""):
+        """Return a URL at the root of the audited site, such as site_url("robots.txt")."""
+        parsed = urlparse(self.start_urls[0])
+        return f"{parsed.scheme}://{parsed.netloc}/{path}"
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.site_record = {
+            "record_type": "site",
+            "site_id": urlparse(spider.start_urls[0]).netloc,
+            **{check: None for check in cls.site_checks},
+            "securityheaders_io_report": None,
+        }
+        spider.site_record_emitted = False
+        # Canonical URL fingerprints of the pages crawled so far (see SEEN_SET)
+        spider.visited_links = seen_set_from_settings(crawler.settings)
+        spider.page_content_types = crawler.settings.getlist("PAGE_CONTENT_TYPES")
+        spider.page_parse_window = crawler.settings.getint("PAGE_PARSE_WINDOW")
+        cpu_workers = crawler.settings.getint("CPU_WORKERS")
+        spider.cpu_pool = ProcessPool(cpu_workers, crawler.settings.getint("CPU_MAX_PENDING")) if cpu_workers else None
+        spider.sitemap_index = SitemapIndex()
+        spider.pages_awaiting_site = []
+        spider.link_statuses = StatusCache(crawler.settings.getint("LINK_STATUS_CACHE_SIZE", 10000))
+        spider.image_info = StatusCache(crawler.settings.getint("IMAGE_INFO_CACHE_SIZE", 10000))
+        crawl_state_path = crawler.settings.get("CRAWL_STATE_PATH")
+        spider.crawl_state = CrawlState(crawl_state_path) if crawl_state_path else None
+        spider.site_key = None
+        spider.stage_timer = StageTimer()
+        return spider
+
+    def closed(self, reason):
+        self.stage_timer.publish(self.crawler.stats)
+        if self.cpu_pool is not None:
+            self.cpu_pool.close()
+        if self.crawl_state is not None:
+            self.crawl_state.close()
+        self.sitemap_index.close()
+
+    async def check_ssl_cert(self, url, timeout=10):
+        """Check SSL certificate validity with a TLS handshake on the event loop."""
+        hostname = urlparse(url).hostname
 
         try:
             ctx = ssl.create_default_context()
-            with socket.create_connection((hostname, 443)) as sock:
-                with ctx.wrap_socket(sock, server_hostname=hostname) as ssock:
-                    cert = ssock.getpeercert()
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(hostname, 443, ssl=ctx, server_hostname=hostname),
+                timeout,
+            )
+            try:
+                cert = writer.get_extra_info("peercert")
+            finally:
+                writer.close()
 
 
-                    subject = dict(x[0] for x in cert["subject"])
-                    issuer = dict(x[0] for x in cert["issuer"])
-                    valid_until = cert["notAfter"]
+            subject = dict(x[0] for x in cert["subject"])
+            issuer = dict(x[0] for x in cert["issuer"])
+            valid_until = cert["notAfter"]
 
 
-                    expiration_date = datetime.strptime(valid_until, "%b %d %H:%M:%S %Y %Z")
-                    if datetime.now() > expiration_date:
-                        return {"error": "Certificate is expired."}
+            expiration_date = datetime.strptime(valid_until, "%b %d %H:%M:%S %Y %Z")
+            if datetime.now() > expiration_date:
+                return {"error": "Certificate is expired."}
 
-                    return {
-                        "subject": subject,
-                        "issuer": issuer,
-                        "valid_until": valid_until,
-                        "is_valid": True
-                    }
+            return {
+                "subject": subject,
+                "issuer": issuer,
+                "valid_until": valid_until,
+                "is_valid": True
+            }
+        except asyncio.TimeoutError:
+            return {"error": f"TLS handshake timed out after {timeout} seconds."}
         except ssl.SSLError as e:
             return {"error": f"SSL error: {str(e)}"}
         except Exception as e:
             return {"error": str(e)}
 
-    def check_security_headers(self, url):
-        """Fetch and filter common security headers."""
-        try:
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-
-            headers = response.headers
-            common_security_headers = [
-                "Content-Security-Policy",
-                "Strict-Transport-Security",
-                "X-Frame-Options",
-                "X-Content-Type-Options",
-                "Referrer-Policy",
-                "Permissions-Policy",
-                "X-XSS-Protection",
-                "Expect-CT",
-                "Feature-Policy",
-            ]
-
-
-            security_headers = {
-                header: headers.get(header, "Not Set")
-                for header in common_security_headers
-            }
+    def extract_security_headers(self, response):
+        """Filter common security headers from the start URL response."""
+        if response.status >= 400:
+            return {"error": f"Request error: {response.status} Error for url: {response.url}"}
+
+        headers = response.headers
+        common_security_headers = [
+            "Content-Security-Policy",
+            "Strict-Transport-Security",
+            "X-Frame-Options",
+            "X-Content-Type-Options",
+            "Referrer-Policy",
+            "Permissions-Policy",
+            "X-XSS-Protection",
+            "Expect-CT",
+            "Feature-Policy",
+        ]
 
-            return security_headers
 
-        except requests.exceptions.RequestException as e:
-            return {"error": f"Request error: {str(e)}"}
-        except Exception as e:
-            return {"error": str(e)}
+        security_headers = {
+            header: headers.get(header).decode("latin-1") if header in headers else "Not Set"
+            for header in common_security_headers
+        }
+
+        return security_headers
 
     def check_securityheaders_io(self, url):
         """Check security headers using SecurityHeaders.io."""
@@ -119,101 +180,265 @@ class SEOAuditSpider(scrapy.Spider):
         return issues
 
     def start_requests(self):
-        """Start by checking SSL certificate and security headers, then proceed to crawl the website."""
-
-        ssl_result = self.check_ssl_cert(self.start_urls[0])
-        self.seo_data["ssl_cert"] = ssl_result
-
-
-        if ssl_result.get("is_valid"):
-            self.logger.info("SSL certificate is valid.")
-        else:
-            self.logger.warning(f"SSL certificate issue: {ssl_result.get('error')}")
-
-
-        security_headers = self.check_security_headers(self.start_urls[0])
-        self.seo_data["security_headers"] = security_headers
-
-
-        if "error" in security_headers:
-            self.logger.warning(f"Security headers check failed: {security_headers['error']}")
-        else:
-            self.logger.info(f"Security headers found: {list(security_headers.keys())}")
+        """Start the site-wide checks and the crawl of the start URL at the same time.
 
+        The TLS handshake, robots.txt and sitemap.xml checks run concurrently
+        with PREFLIGHT_TIMEOUT as their limit, and the security headers are
+        read from the start URL response, so none of them delay the first page.
+        """
+        timeout = self.settings.getfloat("PREFLIGHT_TIMEOUT", 10)
 
         securityheaders_io_report = self.check_securityheaders_io(self.start_urls[0])
-        self.seo_data["securityheaders_io_report"] = securityheaders_io_report
+        self.site_record["securityheaders_io_report"] = securityheaders_io_report
 
 
         self.logger.info(f"SecurityHeaders.io report: {securityheaders_io_report}")
 
 
+        # The data: URL downloads instantly; it only gives the engine a
+        # callback in which the TLS handshake can be awaited
+        yield scrapy.Request("data:,", callback=self.parse_ssl_cert, dont_filter=True)
+
         yield scrapy.Request(
-            url=f"{self.start_urls[0]}robots.txt",
+            url=self.site_url("robots.txt"),
             callback=self.parse_robots,
             errback=self.handle_missing_robots,
             dont_filter=True,
+            meta={"download_timeout": timeout},
         )
 
         yield scrapy.Request(
-            url=f"{self.start_urls[0]}sitemap.xml",
+            url=self.site_url("sitemap.xml"),
             callback=self.parse_sitemap,
             errback=self.handle_missing_sitemap,
             dont_filter=True,
+            meta={"download_timeout": timeout},
         )
 
         yield scrapy.Request(
-            url=self.start_urls[0], callback=self.parse, dont_filter=True
+            url=self.start_urls[0],
+            callback=self.parse,
+            errback=self.handle_start_url_error,
+            dont_filter=True,
+            meta={"security_headers_check": True},
         )
 
+    async def parse_ssl_cert(self, response):
+        """Record the SSL certificate check on the site record."""
+        ssl_result = await self.check_ssl_cert(self.start_urls[0], self.settings.getfloat("PREFLIGHT_TIMEOUT", 10))
+        self.site_record["ssl_cert"] = ssl_result
+
+
+        if ssl_result.get("is_valid"):
+            self.logger.info("SSL certificate is valid.")
+        else:
+            self.logger.warning(f"SSL certificate issue: {ssl_result.get('error')}")
+
+        for item in self.site_check_done():
+            yield item
+
+    def record_security_headers(self, security_headers):
+        """Record the security headers check on the site record."""
+        self.site_record["security_headers"] = security_headers
+
+
+        if "error" in security_headers:
+            self.logger.warning(f"Security headers check failed: {security_headers['error']}")
+        else:
+            self.logger.info(f"Security headers found: {list(security_headers.keys())}")
+
+        yield from self.site_check_done()
+
+    def handle_start_url_error(self, failure):
+        """Record a failed security headers check when the start URL cannot be fetched."""
+        yield from self.record_security_headers({"error": f"Request error: {failure.getErrorMessage()}"})
+        yield from self.handle_page_error(failure)
+
     def parse_robots(self, response):
         """Parse robots.txt file."""
         if response.status == 200:
-            self.seo_data["robots_txt"] = response.text
+            self.site_record["robots_txt"] = response.text
             self.logger.info("Robots.txt file found and processed.")
         else:
-            self.seo_data["robots_txt"] = "Missing"
+            self.site_record["robots_txt"] = "Missing"
             self.logger.warning("Robots.txt file not found.")
+        yield from self.site_check_done()
 
     def handle_missing_robots(self, failure):
         """Handle missing robots.txt gracefully."""
-        self.seo_data["robots_txt"] = "Missing"
+        self.site_record["robots_txt"] = "Missing"
         self.logger.warning("Robots.txt file not found (handled gracefully).")
+        yield from self.site_check_done()
 
     def parse_sitemap(self, response):
-        """Parse sitemap.xml file."""
+        """Parse sitemap.xml and seed the crawl with the pages it lists."""
         if response.status == 200:
-            self.seo_data["sitemap"] = response.text
+            counts = yield from self.seed_from_sitemap(response)
+            self.site_record["sitemap"] = {"url": response.url, **counts}
+            self.site_record["sitemap_url"] = response.url
             self.logger.info("Sitemap.xml file found and processed.")
         else:
-            self.seo_data["sitemap"] = "Missing"
+            self.site_record["sitemap"] = "Missing"
             self.logger.warning("Sitemap.xml file not found.")
+        yield from self.site_check_done()
+
+    def parse_child_sitemap(self, response):
+        """Seed the crawl from a sitemap listed in a sitemap index."""
+        if response.status == 200:
+            yield from self.seed_from_sitemap(response)
+
+    def seed_from_sitemap(self, response):
+        """Queue every page listed in a sitemap and follow nested sitemaps.
+
+        The sitemap is parsed as a stream; page URLs go straight to the
+        scheduler, prioritized by their sitemap priority, and into the
+        sitemap index. Returns how many pages and child sitemaps were found.
+        """
+        counts = {"urls": 0, "sitemaps": 0}
+        self.sitemap_index.sitemap_count += 1
+        try:
+            for kind, loc, lastmod, priority in iter_sitemap(response.body):
+                if not loc.startswith(("http://", "https://")):
+                    continue
+                if kind == "sitemap":
+                    counts["sitemaps"] += 1
+                    yield scrapy.Request(loc, callback=self.parse_child_sitemap)
+                    continue
+
+                counts["urls"] += 1
+                self.sitemap_index.add(loc)
+                yield scrapy.Request(
+                    loc,
+                    callback=self.parse,
+                    priority=page_priority(1, priority),
+                    meta={"sitemap_lastmod": lastmod, "sitemap_priority": priority},
+                )
+        except (etree.XMLSyntaxError, OSError, EOFError) as e:
+            self.logger.warning(f"Could not parse sitemap {response.url}: {e}")
+
+        self.crawler.stats.inc_value("sitemap/urls", counts["urls"])
+        self.crawler.stats.inc_value("sitemap/sitemaps", 1)
+        return counts
 
     def handle_missing_sitemap(self, failure):
         """Handle missing sitemap.xml gracefully."""
-        self.seo_data["sitemap"] = "Missing"
+        self.site_record["sitemap"] = "Missing"
         self.logger.warning("Sitemap.xml file not found (handled gracefully).")
+        yield from self.site_check_done()
+
+    def site_check_done(self):
+        """Emit the site record once every site-wide check has finished.
+
+        Pages that completed their own checks earlier were held back until
+        now, because their SSL, security header and robots.txt issues depend
+        on the site record.
+        """
+        if self.site_record_emitted:
+            return
+        if any(self.site_record[check] is None for check in self.site_checks):
+            return
+
+        self.site_record_emitted = True
+        self.site_key = CrawlState.site_key(self.site_record)
+        yield self.site_record
+
+        pages, self.pages_awaiting_site = self.pages_awaiting_site, []
+        for page in pages:
+            yield self.finalize_page(page)
+
+    async def parse(self, response):
+        """Extracts SEO data and follows internal links.
+
+        With CPU_WORKERS set, the page is parsed in a worker process while
+        the reactor goes on with other downloads.
+        """
+        if response.meta.get("security_headers_check") and self.site_record["security_headers"] is None:
+            for item in self.record_security_headers(self.extract_security_headers(response)):
+                yield item
+        # Another worker of a distributed crawl audits the start page
+        if response.meta.get("site_checks_only"):
+            return
+
+        # The response answers the checks of links to this page (and to
+        # every URL that redirected here) before anything else can return
+        content_type = self.header_value(response, "Content-Type") or ""
+        is_page = is_page_content_type(content_type, self.page_content_types)
+        if is_page:
+            # A 304 only comes back for a conditional request, i.e. a page
+            # that was fine on the last audit
+            link_status = {"status": 200 if response.status == 304 else response.status}
+        else:
+            link_status = {
+                "status": response.status,
+                "content_type": content_type.partition(";")[0].strip(),
+                "size": self.body_size(response),
+            }
+        for url in response.meta.get("redirect_urls", []) + [response.url]:
+            for item in self.resolve_link_status(self.link_statuses.key(url), link_status):
+                yield item
 
-    def parse(self, response):
-        """Extracts SEO data and follows internal links."""
-        if response.url in self.visited_links:
+        if not self.visited_links.add(response.url):
+            return
+
+        if not is_page:
+            # A linked file (PDF, image, ...) is audited as a link only; its
+            # body was not downloaded (see PageDownloadLimitMiddleware)
+            self.crawler.stats.inc_value("pages_skipped/not_html")
             return
-        self.visited_links.add(response.url)
-        self.all_pages.add(response.url)
         self.crawler.stats.inc_value('pages_crawled', 1)
 
-        all_links = set(response.css("a::attr(href)").getall())
+        validators = {
+            "etag": self.header_value(response, "ETag"),
+            "last_modified": self.header_value(response, "Last-Modified"),
+            "content_hash": None,
+        }
+        if self.crawl_state is not None:
+            with self.stage_timer.stage("parse/crawl_state"):
+                cached = self.crawl_state.get(response.url)
+                if response.status != 304:
+                    validators["content_hash"] = CrawlState.content_hash(response.body)
+            if response.status == 304:
+                if cached is None:
+                    self.logger.warning(f"Not Modified response without a stored record: {response.url}")
+                    return
+                self.crawler.stats.inc_value("incremental/not_modified")
+                for item in self.reuse_cached_page(cached, validators, response.meta.get("depth", 0)):
+                    yield item
+                return
+
+            if cached is not None and cached["content_hash"] == validators["content_hash"]:
+                self.crawler.stats.inc_value("incremental/unchanged")
+                for item in self.reuse_cached_page(cached, validators, response.meta.get("depth", 0)):
+                    yield item
+                return
+
+        # Only the head and the start of the body of a huge page are parsed
+        if self.cpu_pool is None:
+            with self.stage_timer.stage("parse/extract"):
+                page_data, truncated = extract_response(response, self.page_parse_window)
+        else:
+            page_data, truncated, seconds = await maybe_deferred_to_future(self.cpu_pool.submit(
+                extract_body, response.url, response.body, response.encoding, self.page_parse_window,
+            ))
+            self.stage_timer.add("parse/extract", seconds)
+        if truncated:
+            self.crawler.stats.inc_value("pages_truncated")
+        truncated = truncated or "download_stopped" in response.flags
+
+        build_start = time.perf_counter()
+        all_links = set(page_data["hrefs"])
+        site_root = self.site_url()
 
         internal_links = {
             response.urljoin(link)
             for link in all_links
-            if (link.startswith("/") or link.startswith(self.start_urls[0]) or not link.startswith("http")) and not link.startswith("mailto:")
+            if (link.startswith("/") or link.startswith(site_root) or not link.startswith("http")) and not link.startswith("mailto:")
         }
 
         external_links = [
             link for link in all_links
             if not link.startswith("/")
-            and not link.startswith(self.start_urls[0])
+            and not link.startswith(site_root)
             and not link.startswith("#")
             and not link.startswith("mailto:")
             and not link.startswith("tel:")
@@ -221,134 +446,335 @@ class SEOAuditSpider(scrapy.Spider):
             and (link.startswith("http://") or link.startswith("https://"))
         ]
 
-        self.linked_pages.update(internal_links)
-
-        meta_title = response.xpath("normalize-space(//title/text())").get(default="No Title Tag")
-        meta_description = response.xpath("normalize-space(//meta[@name='description']/@content)").get(default="No Description Available")
-        canonical = response.xpath("normalize-space(//link[@rel='canonical']/@href)").get(default="No Canonical Tag")
-        meta_robots = response.xpath("normalize-space(//meta[@name='robots']/@content)").get(default="No Robots Tag")
-
-        h1_tags = [tag.strip() for tag in response.xpath("//h1//text()").getall()]
-        h2_tags = [tag.strip() for tag in response.xpath("//h2//text()").getall()]
-        h3_tags = [tag.strip() for tag in response.xpath("//h3//text()").getall()]
-        h4_tags = [tag.strip() for tag in response.xpath("//h4//text()").getall()]
-        h5_tags = [tag.strip() for tag in response.xpath("//h5//text()").getall()]
-        h6_tags = [tag.strip() for tag in response.xpath("//h6//text()").getall()]
-
-        image_data = []
-        for img in response.xpath("//img/@src").getall():
-            img_url = response.urljoin(img)
-            alt_text = response.xpath(f"//img[@src='{img}']/@alt").get(default="No Alt Text")
-            status = response.xpath(f"//img[@src='{img}']/@status").get(default=200)
-
-            try:
-                img_response = requests.get(img_url)
-                img_response.raise_for_status()
-                img_size = len(img_response.content)
-                img_type = img_response.headers.get("Content-Type", "unknown").split("/")[-1]  # Extract file type
-
-            except requests.RequestException:
-                img_size = 0
-                img_type = "unknown"
-
-            image_data.append({
-                "src": img_url,
-                "alt": alt_text,
-                "size": img_size,
-                "status": status,
-                "type": img_type
-            })
-
-        structured_data = response.xpath("//script[@type='application/ld+json']/text()").getall()
-        open_graph_data = {
-            "og:title": response.xpath("//meta[@property='og:title']/@content").get(default=""),
-            "og:description": response.xpath("//meta[@property='og:description']/@content").get(default=""),
-            "og:image": response.xpath("//meta[@property='og:image']/@content").get(default=""),
-            "og:url": response.xpath("//meta[@property='og:url']/@content").get(default="")
-        }
-        twitter_card_data = {
-            "twitter:title": response.xpath("//meta[@name='twitter:title']/@content").get(default=""),
-            "twitter:description": response.xpath("//meta[@name='twitter:description']/@content").get(default=""),
-            "twitter:image": response.xpath("//meta[@name='twitter:image']/@content").get(default=""),
-            "twitter:url": response.xpath("//meta[@name='twitter:url']/@content").get(default="")
-        }
-        hreflang_tags = response.xpath("//link[@rel='alternate']/@hreflang").getall()
-        viewport = response.xpath("//meta[@name='viewport']/@content").get(default="")
-
-        start_time = time.time()
-        response.follow(response.url)
-        load_time = time.time() - start_time
+        image_data = [
+            {
+                "src": response.urljoin(img["src"]),
+                "alt": img["alt"],
+                "size": 0,
+                "status": img["status"],
+                "type": "unknown"
+            }
+            for img in page_data["images"]
+        ]
 
-        internal_links_status = self.check_links_status(internal_links)
+        # Measured by MandevuDownloaderMiddleware; absent for responses
+        # that did not come from the network
+        timing = response.meta.get("timing", {})
 
         seo_data = {
+            "record_type": "page",
             "url": response.url,
-            "meta_title": meta_title,
-            "meta_description": meta_description,
-            "canonical": canonical,
-            "meta_robots": meta_robots,
-            "h1_tags": h1_tags,
-            "h2_tags": h2_tags,
-            "h3_tags": h3_tags,
-            "h4_tags": h4_tags,
-            "h5_tags": h5_tags,
-            "h6_tags": h6_tags,
+            "meta_title": page_data["meta_title"],
+            "meta_description": page_data["meta_description"],
+            "canonical": page_data["canonical"],
+            "meta_robots": page_data["meta_robots"],
+            "h1_tags": page_data["h1_tags"],
+            "h2_tags": page_data["h2_tags"],
+            "h3_tags": page_data["h3_tags"],
+            "h4_tags": page_data["h4_tags"],
+            "h5_tags": page_data["h5_tags"],
+            "h6_tags": page_data["h6_tags"],
             "internal_links_count": len(internal_links),
-            "internal_links": internal_links_status,
+            "internal_links": [],
             "external_links_count": len(external_links),
             "external_links": external_links,
             "image_data": image_data,
-            "structured_data": structured_data,
-            "open_graph_data": open_graph_data,
-            "twitter_card_data": twitter_card_data,
-            "hreflang_tags": hreflang_tags,
-            "viewport": viewport,
-            "load_time": load_time,
-            "robots_txt": self.seo_data.get("robots_txt", "Unknown"),
-            "sitemap": self.seo_data.get("sitemap", "Unknown"),
-            "ssl_cert": self.seo_data.get("ssl_cert", "Unknown"),
-            "security_headers": self.seo_data.get("security_headers", "Unknown"),
-            "securityheaders_io_report": self.seo_data.get("securityheaders_io_report", "Unknown"),
+            "structured_data": page_data["structured_data"],
+            "open_graph_data": page_data["open_graph_data"],
+            "twitter_card_data": page_data["twitter_card_data"],
+            "hreflang_tags": page_data["hreflang_tags"],
+            "viewport": page_data["viewport"],
+            "load_time": timing.get("total", 0),
+            "timing": {metric: timing.get(metric) for metric in TIMING_METRICS},
+            "response_size": timing.get("response_size", len(response.body)),
+            "truncated": truncated,
+            "redirect_chain": response.meta.get("redirect_urls", []),
+            "site_id": self.site_record["site_id"],
+        }
+
+        self.stage_timer.add("parse/build_record", time.perf_counter() - build_start)
+
+        link_priority = page_priority(response.meta.get("depth", 0) + 1)
+        for link in internal_links:
+            if link not in self.visited_links:
+                yield scrapy.Request(link, callback=self.parse, priority=link_priority)
+
+        page = {"seo_data": seo_data, "pending": len(internal_links) + len(image_data), **validators}
+        if page["pending"] == 0:
+            for item in self.page_checks_done(page):
+                yield item
+            return
+
+        for link in internal_links:
+            for item in self.check_link_status(page, link):
+                yield item
+        for image in image_data:
+            for item in self.inspect_image(page, image):
+                yield item
+
+    def header_value(self, response, name):
+        value = response.headers.get(name)
+        return value.decode("latin-1") if value else None
+
+    def body_size(self, response):
+        """Return the size of a response body, from Content-Length if the download was stopped."""
+        if "download_stopped" not in response.flags:
+            return len(response.body)
+        length = self.header_value(response, "Content-Length")
+        return int(length) if length and length.isdigit() else None
+
+    def reuse_cached_page(self, cached, validators, depth):
+        """Re-emit the record stored for a page that has not changed since the last audit.
+
+        Extraction and the link and image checks are skipped; the links the
+        page had are still followed so the rest of the site is reached.
+        """
+        seo_data = dict(cached["record"])
+        internal_links = [link["url"] for link in seo_data["internal_links"]]
+        link_priority = page_priority(depth + 1)
+        for link in internal_links:
+            if link not in self.visited_links:
+                yield scrapy.Request(link, callback=self.parse, priority=link_priority)
+
+        page = {
+            "seo_data": seo_data,
+            "pending": 0,
+            "etag": validators["etag"] or cached["etag"],
+            "last_modified": validators["last_modified"] or cached["last_modified"],
+            "content_hash": cached["content_hash"],
+            "rule_issues": cached["rule_issues"],
+            "site_key": cached["site_key"],
         }
+        yield from self.page_checks_done(page)
+
+    def check_link_status(self, page, link):
+        """Resolve a link status from the crawl-wide cache or schedule a HEAD request for it."""
+        key = self.link_statuses.key(link)
+        cached = self.link_statuses.get(key)
+        if cached is not None:
+            self.crawler.stats.inc_value("link_status/cache_hit")
+            yield from self.record_link_status(page, link, cached)
+            return
 
-        ssl_issues = self.extract_ssl_issues(self.seo_data.get("ssl_cert", {}))
-        security_header_issues = self.extract_security_header_issues(self.seo_data.get("security_headers", {}))
+        if not self.link_statuses.wait(key, (page, link)):
+            # Answered by a check already running, or by the page's own response
+            self.crawler.stats.inc_value("link_status/from_page" if key in self.link_statuses.expected else "link_status/shared")
+            return
 
+        try:
+            request = scrapy.Request(
+                link,
+                method="HEAD",
+                callback=self.parse_link_status,
+                errback=self.handle_link_error,
+                dont_filter=True,
+                meta={"handle_httpstatus_list": self.check_httpstatus_list, "link_status_key": key},
+            )
+        except ValueError as e:
+            yield from self.resolve_link_status(key, {"status": "error", "error": str(e)})
+            return
+        self.crawler.stats.inc_value("link_status/requested")
+        yield request
+
+    def parse_link_status(self, response):
+        """Record the final status of a checked link, after redirects, and the type and size of a linked file."""
+        result = self.head_link_status(response)
+        key = response.meta["link_status_key"]
+        yield from self.resolve_link_status(key, result)
+        # Every URL of a redirect chain ends at the same response
+        for url in response.meta.get("redirect_urls", [])[1:] + [response.url]:
+            if self.link_statuses.key(url) != key:
+                yield from self.resolve_link_status(self.link_statuses.key(url), result)
+
+    def head_link_status(self, response):
+        """Return the link status read from the headers of a response: its status, and the type and size of a file."""
+        result = {"status": response.status}
+        content_type = self.header_value(response, "Content-Type") or ""
+        if not is_page_content_type(content_type, self.page_content_types):
+            length = self.header_value(response, "Content-Length")
+            result["content_type"] = content_type.partition(";")[0].strip()
+            result["size"] = int(length) if length and length.isdigit() else None
+        return result
+
+    def handle_page_error(self, failure):
+        """Record the status of a page whose request failed for the links waiting on it."""
+        response = getattr(failure.value, "response", None)
+        if response is not None:
+            # An HttpError: the page answered with a status the spider does not parse
+            result = self.head_link_status(response)
+        else:
+            result = {"status": "error", "error": failure.getErrorMessage()}
+        request = failure.request
+        for url in request.meta.get("redirect_urls", []) + [request.url]:
+            yield from self.resolve_link_status(self.link_statuses.key(url), result)
+
+    def handle_link_error(self, failure):
+        """Record a link whose check failed before a response was received."""
+        key = failure.request.meta["link_status_key"]
+        yield from self.resolve_link_status(key, {"status": "error", "error": failure.getErrorMessage()})
+
+    def resolve_link_status(self, key, result):
+        """Cache a link status and hand it to every page waiting on it."""
+        for page, link in self.link_statuses.resolve(key, result):
+            yield from self.record_link_status(page, link, result)
+
+    def record_link_status(self, page, link, result):
+        """Store a link status and finish the page once all its links are checked."""
+        page["seo_data"]["internal_links"].append({"url": link, **result})
+        yield from self.complete_check(page)
+
+    def inspect_image(self, page, image):
+        """Resolve image size and type from the crawl-wide cache or schedule a HEAD request for it."""
+        key = self.image_info.key(image["src"])
+        cached = self.image_info.get(key)
+        if cached is not None:
+            self.crawler.stats.inc_value("image_info/cache_hit")
+            yield from self.record_image_info(page, image, cached)
+            return
 
-        rule_checker = SEORuleChecker(seo_data)
-        seo_issues = rule_checker.analyze()
-        all_issues = ssl_issues + security_header_issues + seo_issues
+        if not self.image_info.wait(key, (page, image)):
+            self.crawler.stats.inc_value("image_info/shared")
+            return
 
+        try:
+            request = scrapy.Request(
+                image["src"],
+                method="HEAD",
+                callback=self.parse_image_head,
+                errback=self.handle_image_error,
+                dont_filter=True,
+                meta={"handle_httpstatus_list": self.check_httpstatus_list, "image_info_key": key},
+            )
+        except ValueError:
+            yield from self.resolve_image_info(key, {"size": 0, "type": "unknown"})
+            return
+        self.crawler.stats.inc_value("image_info/requested")
+        yield request
+
+    def parse_image_head(self, response):
+        """Read image size and type from the final HEAD response, after redirects, falling back to a ranged GET."""
+        key = response.meta["image_info_key"]
+        result = self.read_image_info(self.image_head_info, response)
+        if result is None:
+            self.crawler.stats.inc_value("image_info/range_requested")
+            yield response.request.replace(
+                method="GET",
+                headers={"Range": "bytes=0-0"},
+                callback=self.parse_image_range,
+            )
+        else:
+            yield from self.resolve_image_info(key, result)
+
+    def image_head_info(self, response):
+        """Return the image details a HEAD response gives, or None if a ranged GET has to find the size."""
+        length = self.header_value(response, "Content-Length")
+        content_length = int(length) if length and length.isdigit() else 0
+
+        # A zero length on a HEAD usually means the server did not send one
+        if 200 <= response.status < 300 and content_length > 0:
+            return {"size": content_length, "type": self.image_type(response), "status": response.status}
+        if 200 <= response.status < 300 or response.status in (405, 501):
+            return None
+        return {"size": 0, "type": "unknown", "status": response.status}
+
+    def parse_image_range(self, response):
+        """Read the full image size from a ranged GET response."""
+        key = response.meta["image_info_key"]
+        yield from self.resolve_image_info(key, self.read_image_info(self.image_range_info, response))
+
+    def image_range_info(self, response):
+        """Return the image details a ranged GET response gives."""
+        if response.status == 206:
+            content_range = response.headers.get("Content-Range", b"").decode("latin-1")
+            total = content_range.rpartition("/")[2]
+            size = int(total) if total.isdigit() else 0
+        elif 200 <= response.status < 300:
+            size = len(response.body)
+        else:
+            return {"size": 0, "type": "unknown", "status": response.status}
 
-        seo_data["issues_detected"] = all_issues
-        seo_data["ai_recommendations"] = get_recommendations(all_issues)
+        # A partial response still means the full image is reachable
+        return {
+            "size": size,
+            "type": self.image_type(response),
+            "status": 200 if response.status == 206 else response.status,
+        }
 
-        self.results.append(seo_data)
+    def read_image_info(self, read, response):
+        """Return read(response), or unknown details if the response cannot be read.
 
-        yield seo_data
-        for link in internal_links:
-            if link not in self.visited_links:
-                yield scrapy.Request(link, callback=self.parse)
+        The image key must be resolved whatever the response holds: every
+        page waiting on the image, and every later page using it, would
+        otherwise never be finished.
+        """
+        try:
+            return read(response)
+        except Exception as e:
+            self.logger.warning(f"Could not read image details from {response.url}: {e}")
+            self.crawler.stats.inc_value("image_info/unreadable")
+            return {"size": 0, "type": "unknown"}
+
+    def image_type(self, response):
+        """Extract the file type from an image response's Content-Type."""
+        return response.headers.get("Content-Type", b"unknown").decode("latin-1").split("/")[-1]
+
+    def handle_image_error(self, failure):
+        """Record an image whose inspection failed before a response was received."""
+        yield from self.resolve_image_info(failure.request.meta["image_info_key"], {"size": 0, "type": "unknown"})
+
+    def resolve_image_info(self, key, result):
+        """Cache image details and hand them to every page waiting on them."""
+        for page, image in self.image_info.resolve(key, result):
+            yield from self.record_image_info(page, image, result)
+
+    def record_image_info(self, page, image, result):
+        """Store image details and finish the page once all its checks are done."""
+        image.update(result)
+        yield from self.complete_check(page)
+
+    def complete_check(self, page):
+        """Count down a page's outstanding checks and finish it after the last one."""
+        page["pending"] -= 1
+        if page["pending"] == 0:
+            yield from self.page_checks_done(page)
+
+    def page_checks_done(self, page):
+        """Finish a page now, or hold it until the site-wide checks are done."""
+        if self.site_record_emitted:
+            yield self.finalize_page(page)
+        else:
+            self.pages_awaiting_site.append(page)
+
+    def finalize_page(self, page):
+        """Run the SEO rules on a page whose own and site-wide checks are all done.
+
+        Rule issues stored for an unchanged page are reused as long as the
+        site-wide inputs to the rules are the same as when they were stored.
+        """
+        seo_data = page["seo_data"]
+        ssl_issues = self.extract_ssl_issues(self.site_record["ssl_cert"])
+        security_header_issues = self.extract_security_header_issues(self.site_record["security_headers"])
+        site_issues = ssl_issues + security_header_issues
+
+        if page.get("rule_issues") is not None and page.get("site_key") == self.site_key:
+            return self.complete_page(page, site_issues, page["rule_issues"])
+        seo_data.pop("issues_detected", None)
+        if self.cpu_pool is not None:
+            # RuleOffloadPipeline runs the rules in the pool and completes the page
+            return PendingRulesItem(page, self.site_record, site_issues)
+        rule_checker = SEORuleChecker(seo_data, self.site_record)
+        return self.complete_page(page, site_issues, rule_checker.analyze(self.stage_timer))
+
+    def complete_page(self, page, site_issues, seo_issues):
+        """Store the rule issues of a page in the crawl state and return its record as a PageRecord."""
+        seo_data = page["seo_data"]
+        all_issues = site_issues + seo_issues
+        if self.crawl_state is not None:
+            with self.stage_timer.stage("finalize/crawl_state"):
+                self.crawl_state.save(
+                    seo_data["url"], page["etag"], page["last_modified"], page["content_hash"],
+                    seo_data, seo_issues, self.site_key,
+                )
 
-    def check_links_status(self, links):
-        """Check the status of links and return a list with status codes."""
-        links_status = []
-        for link in links:
-            try:
-                response = requests.head(link, allow_redirects=True)
-                links_status.append({"url": link, "status": response.status_code})
-            except requests.RequestException as e:
-                links_status.append({"url": link, "status": "error", "error": str(e)})
-        return links_status
-
-    def close_spider(self, spider):
-        """Runs the report generator after Scrapy finishes crawling."""
-        print("Scrapy crawl complete. Generating SEO report...")
-
-        orphan_pages = self.all_pages - self.linked_pages
-        if orphan_pages:
-            print(f"Orphan pages detected: {orphan_pages}")
-
-        script_dir = os.path.dirname(__file__)
-        script_path = os.path.join(script_dir, "..", "utils", "generate_report.py")
-        subprocess.run(["python3", script_path])
\ No newline at end of file
+        seo_data["issues_detected"] = all_issues
+        return PageRecord.from_dict(seo_data)
@@ -0,0 +1,352 @@
+"""A history of audits in one SQLite database, for queries across runs.
+
+    python -m mandevu.utils.audit_store ingest crawl.jsonl --db audits.sqlite
+    python -m mandevu.utils.audit_store issues --db audits.sqlite [--run 3]
+    python -m mandevu.utils.audit_store pages "Missing canonical tag." --db audits.sqlite
+    python -m mandevu.utils.audit_store trend --db audits.sqlite [--site example.com] [--issue TYPE]
+    python -m mandevu.utils.audit_store diff 2 3 --db audits.sqlite
+
+Every crawl is a run of a site. For each run the store keeps the pages
+(URL, issue count, the record as JSON) and their issues, each with an
+issue type: the issue text with the URLs, numbers and quoted values
+blanked out, so "Broken internal link found: https://..." on every page is
+one type. URLs and issue types are stored once and referred to by ID.
+Queries by run, URL and issue type use indexes, and a diff between two
+runs is computed in SQLite and streamed, so neither run is loaded whole.
+Crawls write to the store as they go through AuditStorePipeline
+(AUDIT_STORE_PATH); stored feeds are added with ingest.
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+
+# Run as a script, the project root is not on the import path yet
+if not __package__:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+_URL = re.compile(r"https?://\S+")
+_QUOTED = re.compile(r"'[^']*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    site_id TEXT,
+    label TEXT,
+    started_at REAL,
+    finished_at REAL,
+    pages INTEGER DEFAULT 0,
+    issues INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS runs_by_site ON runs (site_id, run_id);
+
+CREATE TABLE IF NOT EXISTS urls (url_id INTEGER PRIMARY KEY, url TEXT UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS issue_types (type_id INTEGER PRIMARY KEY, issue_type TEXT UNIQUE NOT NULL);
+
+CREATE TABLE IF NOT EXISTS pages (
+    run_id INTEGER NOT NULL,
+    url_id INTEGER NOT NULL,
+    issue_count INTEGER NOT NULL,
+    record TEXT,
+    PRIMARY KEY (run_id, url_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS pages_by_url ON pages (url_id, run_id);
+
+CREATE TABLE IF NOT EXISTS issues (
+    run_id INTEGER NOT NULL,
+    url_id INTEGER NOT NULL,
+    type_id INTEGER NOT NULL,
+    issue TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS issues_by_page ON issues (run_id, url_id, type_id);
+CREATE INDEX IF NOT EXISTS issues_by_type ON issues (type_id, run_id);
+"""
+
+
+def issue_type(issue):
+    """Return the type of an issue: its text with URLs, quoted values and numbers blanked out."""
+    text = " ".join(issue.split())
+    text = _URL.sub("<url>", text)
+    text = _QUOTED.sub("'<text>'", text)
+    return _NUMBER.sub("<n>", text)
+
+
+class AuditStore:
+    """Pages and issues of every audit run, in a SQLite database at path.
+
+    Writes are buffered and committed in one short transaction every
+    batch_size pages, and when a run finishes. With check_same_thread
+    false the store can be used from another thread, one at a time.
+    """
+
+    def __init__(self, path, batch_size=200, check_same_thread=True):
+        self.connection = sqlite3.connect(path, check_same_thread=check_same_thread)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA busy_timeout=10000")
+        self.connection.executescript(SCHEMA)
+        self.batch_size = batch_size
+        self.pending = []
+        self.type_ids = {}
+
+    def start_run(self, site_id=None, label=None, started_at=None):
+        """Create a run and return its ID."""
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO runs (site_id, label, started_at) VALUES (?, ?, ?)",
+                (site_id, label, started_at or time.time()),
+            )
+        return cursor.lastrowid
+
+    def set_site(self, run_id, site_id):
+        with self.connection:
+            self.connection.execute("UPDATE runs SET site_id = ? WHERE run_id = ?", (site_id, run_id))
+
+    def url_id(self, url):
+        self.connection.execute("INSERT OR IGNORE INTO urls (url) VALUES (?)", (url,))
+        return self.connection.execute("SELECT url_id FROM urls WHERE url = ?", (url,)).fetchone()[0]
+
+    def type_id(self, issue):
+        # A crawl has a few dozen issue types, so their IDs are kept
+        text = issue_type(issue)
+        type_id = self.type_ids.get(text)
+        if type_id is None:
+            self.connection.execute("INSERT OR IGNORE INTO issue_types (issue_type) VALUES (?)", (text,))
+            type_id = self.connection.execute("SELECT type_id FROM issue_types WHERE issue_type = ?", (text,)).fetchone()[0]
+            self.type_ids[text] = type_id
+        return type_id
+
+    def add_page(self, run_id, record):
+        """Add a page record (a dict or PageRecord with url and issues_detected) to a run."""
+        issues = list(dict.fromkeys(record.get("issues_detected") or []))
+        self.pending.append((run_id, record["url"], issues, json.dumps(dict(record), ensure_ascii=False)))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def add_pages(self, run_id, records):
+        """Add page records to a run and write them."""
+        for record in records:
+            self.add_page(run_id, record)
+        self.flush()
+
+    def flush(self):
+        """Write the buffered pages in one transaction."""
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, []
+        try:
+            with self.connection:
+                for run_id, url, issues, record in pending:
+                    url_id = self.url_id(url)
+                    # A page stored twice in a run (a distributed crawl
+                    # re-crawling after a lease ran out) keeps its last record
+                    self.connection.execute("DELETE FROM issues WHERE run_id = ? AND url_id = ?", (run_id, url_id))
+                    self.connection.execute(
+                        "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)", (run_id, url_id, len(issues), record)
+                    )
+                    self.connection.executemany(
+                        "INSERT INTO issues VALUES (?, ?, ?, ?)",
+                        [(run_id, url_id, self.type_id(issue), issue) for issue in issues],
+                    )
+        except sqlite3.Error:
+            # Type IDs inserted by the rolled back transaction are gone
+            self.type_ids.clear()
+            raise
+
+    def finish_run(self, run_id, finished_at=None):
+        """Write what is buffered and record the end of the run and its totals."""
+        self.flush()
+        with self.connection:
+            self.connection.execute(
+                """
+                UPDATE runs SET finished_at = ?,
+                    pages = (SELECT COUNT(*) FROM pages WHERE run_id = ?),
+                    issues = (SELECT COUNT(*) FROM issues WHERE run_id = ?)
+                WHERE run_id = ?
+                """,
+                (finished_at or time.time(), run_id, run_id, run_id),
+            )
+
+    def ingest(self, entries, label=None):
+        """Store a whole crawl (the items of a feed) as a new run and return its ID."""
+        run_id = self.start_run(label=label)
+        site_id = None
+        for entry in entries:
+            if entry.get("record_type") == "site":
+                if site_id is None:
+                    site_id = entry.get("site_id")
+                    self.set_site(run_id, site_id)
+            elif "url" in entry:
+                if site_id is None and entry.get("site_id"):
+                    site_id = entry["site_id"]
+                    self.set_site(run_id, site_id)
+                self.add_page(run_id, entry)
+        self.finish_run(run_id)
+        return run_id
+
+    def runs(self, site_id=None):
+        """Return (run_id, site_id, label, started_at, finished_at, pages, issues) rows, oldest first."""
+        query = "SELECT run_id, site_id, label, started_at, finished_at, pages, issues FROM runs"
+        if site_id is not None:
+            return self.connection.execute(query + " WHERE site_id = ? ORDER BY run_id", (site_id,)).fetchall()
+        return self.connection.execute(query + " ORDER BY run_id").fetchall()
+
+    def latest_runs(self, count=2, site_id=None):
+        return [row[0] for row in self.runs(site_id)[-count:]]
+
+    def issue_counts(self, run_id):
+        """Return (issue_type, pages, issues) for a run, most widespread first."""
+        return self.connection.execute(
+            """
+            SELECT t.issue_type, COUNT(DISTINCT i.url_id), COUNT(*)
+            FROM issues i JOIN issue_types t USING (type_id)
+            WHERE i.run_id = ?
+            GROUP BY i.type_id ORDER BY 2 DESC, 1
+            """,
+            (run_id,),
+        ).fetchall()
+
+    def pages_with_issue(self, run_id, type_or_issue):
+        """Yield (url, issue) for the pages of a run with an issue of the given type (or text)."""
+        type_id = self.connection.execute(
+            "SELECT type_id FROM issue_types WHERE issue_type = ?", (issue_type(type_or_issue),)
+        ).fetchone()
+        if type_id is None:
+            return
+        yield from self.connection.execute(
+            """
+            SELECT u.url, i.issue FROM issues i JOIN urls u USING (url_id)
+            WHERE i.type_id = ? AND i.run_id = ? ORDER BY u.url
+            """,
+            (type_id[0], run_id),
+        )
+
+    def trend(self, site_id=None, type_or_issue=None):
+        """Return (run_id, started_at, pages, pages with the issue or with any issue) for each run."""
+        site_filter = "WHERE r.site_id = ?" if site_id is not None else ""
+        parameters = [site_id] if site_id is not None else []
+        if type_or_issue is None:
+            affected = "SELECT COUNT(*) FROM pages p WHERE p.run_id = r.run_id AND p.issue_count > 0"
+        else:
+            affected = (
+                "SELECT COUNT(DISTINCT i.url_id) FROM issues i WHERE i.run_id = r.run_id AND i.type_id ="
+                " (SELECT type_id FROM issue_types WHERE issue_type = ?)"
+            )
+            parameters.insert(0, issue_type(type_or_issue))
+        return self.connection.execute(
+            f"SELECT r.run_id, r.started_at, r.pages, ({affected}) FROM runs r {site_filter} ORDER BY r.run_id",
+            parameters,
+        ).fetchall()
+
+    def page_history(self, url):
+        """Return (run_id, issue_count) for every run that audited url."""
+        return self.connection.execute(
+            """
+            SELECT p.run_id, p.issue_count FROM pages p JOIN urls u USING (url_id)
+            WHERE u.url = ? ORDER BY p.run_id
+            """,
+            (url,),
+        ).fetchall()
+
+    def page_record(self, run_id, url):
+        row = self.connection.execute(
+            "SELECT p.record FROM pages p JOIN urls u USING (url_id) WHERE p.run_id = ? AND u.url = ?",
+            (run_id, url),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def diff(self, old_run, new_run):
+        """Yield (change, url, issue) for what changed from old_run to new_run.
+
+        change is "page_added" or "page_removed" (issue is None), or
+        "issue_added" or "issue_resolved" for pages audited in both runs.
+        Rows are streamed from SQLite, grouped by change.
+        """
+        yield from self.connection.execute(
+            """
+            SELECT 'page_added', u.url, NULL FROM pages p JOIN urls u USING (url_id)
+            WHERE p.run_id = :new AND NOT EXISTS (SELECT 1 FROM pages o WHERE o.run_id = :old AND o.url_id = p.url_id)
+            ORDER BY u.url
+            """,
+            {"old": old_run, "new": new_run},
+        )
+        yield from self.connection.execute(
+            """
+            SELECT 'page_removed', u.url, NULL FROM pages p JOIN urls u USING (url_id)
+            WHERE p.run_id = :old AND NOT EXISTS (SELECT 1 FROM pages n WHERE n.run_id = :new AND n.url_id = p.url_id)
+            ORDER BY u.url
+            """,
+            {"old": old_run, "new": new_run},
+        )
+        for change, this, other in (("issue_added", new_run, old_run), ("issue_resolved", old_run, new_run)):
+            yield from self.connection.execute(
+                f"""
+                SELECT '{change}', u.url, i.issue FROM issues i JOIN urls u USING (url_id)
+                WHERE i.run_id = :this
+                AND EXISTS (SELECT 1 FROM pages p WHERE p.run_id = :other AND p.url_id = i.url_id)
+                AND NOT EXISTS (
+                    SELECT 1 FROM issues o
+                    WHERE o.run_id = :other AND o.url_id = i.url_id AND o.type_id = i.type_id AND o.issue = i.issue
+                )
+                ORDER BY u.url
+                """,
+                {"this": this, "other": other},
+            )
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+
+def print_rows(rows):
+    for row in rows:
+        print("\t".join("" if value is None else str(value) for value in row))
+
+
+def main(argv=None):
+    from mandevu.utils.generate_report import iter_entries
+
+    parser = argparse.ArgumentParser(description="Store audits and query them across runs.")
+    parser.add_argument("--db", default=os.getenv("AUDIT_STORE_PATH", "audits.sqlite"), help="the store (default: AUDIT_STORE_PATH)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest = commands.add_parser("ingest", help="add a crawl feed as a new run")
+    ingest.add_argument("feed")
+    ingest.add_argument("--label")
+    commands.add_parser("runs", help="list the runs")
+    issues = commands.add_parser("issues", help="count the issues of a run by type")
+    issues.add_argument("--run", type=int, help="default: the latest run")
+    pages = commands.add_parser("pages", help="list the pages of a run with an issue type")
+    pages.add_argument("issue", help="an issue type or the text of an issue")
+    pages.add_argument("--run", type=int, help="default: the latest run")
+    trend = commands.add_parser("trend", help="pages with issues in every run")
+    trend.add_argument("--site")
+    trend.add_argument("--issue", help="only count this issue type")
+    diff = commands.add_parser("diff", help="what changed between two runs (default: the latest two)")
+    diff.add_argument("runs", type=int, nargs="*")
+    args = parser.parse_args(argv)
+
+    store = AuditStore(args.db)
+    try:
+        if args.command == "ingest":
+            run_id = store.ingest(iter_entries(args.feed), args.label or os.path.basename(args.feed))
+            print(f"Stored run {run_id}")
+        elif args.command == "runs":
+            print_rows(store.runs())
+        elif args.command == "issues":
+            print_rows(store.issue_counts(args.run or store.latest_runs(1)[0]))
+        elif args.command == "pages":
+            print_rows(store.pages_with_issue(args.run or store.latest_runs(1)[0], args.issue))
+        elif args.command == "trend":
+            print_rows(store.trend(args.site, args.issue))
+        elif args.command == "diff":
+            old_run, new_run = args.runs if len(args.runs) == 2 else store.latest_runs(2)
+            print_rows(store.diff(old_run, new_run))
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
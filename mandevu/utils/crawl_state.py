@@ -0,0 +1,82 @@
+import hashlib
+import json
+import sqlite3
+import time
+
+
+class CrawlState:
+    """Persistent per-URL state kept between audits of the same site.
+
+    For every page it stores the HTTP validators (ETag / Last-Modified), a
+    hash of the body, the finished page record and the rule issues found on
+    it, so a later run can send conditional requests and reuse the results
+    for pages that have not changed. Rule issues also depend on the site's
+    robots.txt and sitemap, so the key of those inputs is stored with them.
+
+    Every save commits on its own, so the write lock is only held for one
+    row and the workers of a distributed crawl can share the file; a worker
+    that finds it locked waits up to timeout seconds.
+    """
+
+    def __init__(self, path, timeout=30.0):
+        self.connection = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.connection.execute(f"PRAGMA busy_timeout = {int(timeout * 1000)}")
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                content_hash TEXT,
+                record TEXT,
+                rule_issues TEXT,
+                site_key TEXT,
+                updated_at REAL
+            )
+            """
+        )
+
+    def get(self, url):
+        """Return the stored state for a URL, or None if it was never audited."""
+        row = self.connection.execute(
+            "SELECT etag, last_modified, content_hash, record, rule_issues, site_key FROM pages WHERE url = ?",
+            (url,),
+        ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, content_hash, record, rule_issues, site_key = row
+        return {
+            "etag": etag,
+            "last_modified": last_modified,
+            "content_hash": content_hash,
+            "record": json.loads(record),
+            "rule_issues": json.loads(rule_issues),
+            "site_key": site_key,
+        }
+
+    def validators(self, url):
+        """Return the (etag, last_modified) pair stored for a URL, or None."""
+        return self.connection.execute(
+            "SELECT etag, last_modified FROM pages WHERE url = ?", (url,)
+        ).fetchone()
+
+    def save(self, url, etag, last_modified, content_hash, record, rule_issues, site_key):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (url, etag, last_modified, content_hash, json.dumps(record), json.dumps(rule_issues), site_key, time.time()),
+        )
+
+    @staticmethod
+    def content_hash(body):
+        return hashlib.sha256(body).hexdigest()
+
+    @staticmethod
+    def site_key(site_record):
+        """Hash the site-wide fields the page rules read."""
+        inputs = [site_record.get("robots_txt"), site_record.get("sitemap_url")]
+        return hashlib.sha256(json.dumps(inputs).encode("utf-8")).hexdigest()
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,145 @@
+import re
+
+HEADING_TAGS = ("h1", "h2", "h3", "h4", "h5", "h6")
+OPEN_GRAPH_PROPERTIES = ("og:title", "og:description", "og:image", "og:url")
+TWITTER_CARD_NAMES = ("twitter:title", "twitter:description", "twitter:image", "twitter:url")
+
+# Content types the spider audits as pages; anything else is only a link
+PAGE_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+
+_XML_WHITESPACE = re.compile(r"[ \t\r\n]+")
+_HEAD_END = re.compile(rb"</head\s*>", re.IGNORECASE)
+
+
+def normalize_space(text):
+    """Collapse whitespace the same way XPath normalize-space() does."""
+    return _XML_WHITESPACE.sub(" ", text).strip(" ")
+
+
+def is_page_content_type(content_type, page_types=PAGE_CONTENT_TYPES):
+    """Whether a Content-Type header value is one of the page types; a missing one counts as a page."""
+    media_type = content_type.partition(";")[0].strip().lower()
+    return not media_type or media_type in page_types
+
+
+def parse_window(body, window):
+    """Return how many bytes of an HTML body to parse: the head plus window bytes of the rest.
+
+    The result is len(body) when the body fits.
+    """
+    if len(body) <= window:
+        return len(body)
+    head_end = _HEAD_END.search(body)
+    return min(len(body), (head_end.end() if head_end else 0) + window)
+
+
+def _text_children(element):
+    """Yield the text nodes that are direct children of an element, in document order."""
+    if element.text is not None:
+        yield element.text
+    for child in element:
+        if child.tail is not None:
+            yield child.tail
+
+
+def extract_page(root):
+    """Extract every SEO field from a parsed HTML tree in a single walk.
+
+    Returns the same values the per-field XPath queries in parse used to
+    produce, so the result can be dropped into the page item unchanged.
+    Image sources and link hrefs are returned as written in the document;
+    joining them against the page URL is left to the caller.
+    """
+    title = None
+    meta = {}
+    canonical = None
+    headings = {tag: [] for tag in HEADING_TAGS}
+    hrefs = []
+    image_srcs = []
+    image_alts = {}
+    image_statuses = {}
+    structured_data = []
+    open_graph_data = {}
+    hreflang_tags = []
+
+    for element in root.iter():
+        tag = element.tag
+        if not isinstance(tag, str):
+            continue
+
+        if tag == "a":
+            href = element.get("href")
+            if href is not None:
+                hrefs.append(href)
+
+        elif tag == "img":
+            src = element.get("src")
+            if src is not None:
+                image_srcs.append(src)
+                alt = element.get("alt")
+                if alt is not None:
+                    image_alts.setdefault(src, alt)
+                status = element.get("status")
+                if status is not None:
+                    image_statuses.setdefault(src, status)
+
+        elif tag == "meta":
+            content = element.get("content")
+            if content is None:
+                continue
+            name = element.get("name")
+            if name in ("description", "robots", "viewport") or name in TWITTER_CARD_NAMES:
+                meta.setdefault(name, content)
+            prop = element.get("property")
+            if prop in OPEN_GRAPH_PROPERTIES:
+                open_graph_data.setdefault(prop, content)
+
+        elif tag == "link":
+            rel = element.get("rel")
+            if rel == "canonical" and canonical is None:
+                canonical = element.get("href")
+            elif rel == "alternate":
+                hreflang = element.get("hreflang")
+                if hreflang is not None:
+                    hreflang_tags.append(hreflang)
+
+        elif tag in headings:
+            # Text of a heading nested in a heading of the same level is
+            # already part of the outer heading's text
+            if next(element.iterancestors(tag), None) is None:
+                headings[tag].extend(text.strip() for text in element.itertext())
+
+        elif tag == "title":
+            if title is None:
+                title = next(_text_children(element), None)
+
+        elif tag == "script":
+            if element.get("type") == "application/ld+json":
+                structured_data.extend(_text_children(element))
+
+    return {
+        "meta_title": normalize_space(title or ""),
+        "meta_description": normalize_space(meta.get("description", "")),
+        "canonical": normalize_space(canonical or ""),
+        "meta_robots": normalize_space(meta.get("robots", "")),
+        "h1_tags": headings["h1"],
+        "h2_tags": headings["h2"],
+        "h3_tags": headings["h3"],
+        "h4_tags": headings["h4"],
+        "h5_tags": headings["h5"],
+        "h6_tags": headings["h6"],
+        "hrefs": hrefs,
+        "images": [
+            {
+                "src": src,
+                "alt": image_alts.get(src, "No Alt Text"),
+                "status": image_statuses.get(src, 200),
+            }
+            for src in image_srcs
+        ],
+        "structured_data": structured_data,
+        "open_graph_data": {prop: open_graph_data.get(prop, "") for prop in OPEN_GRAPH_PROPERTIES},
+        "twitter_card_data": {name: meta.get(name, "") for name in TWITTER_CARD_NAMES},
+        "hreflang_tags": hreflang_tags,
+        "viewport": meta.get("viewport", ""),
+    }
@@ -0,0 +1,481 @@
+import heapq
+import itertools
+import json
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+
+def page_priority(depth, sitemap_priority=None):
+    """Score a page for the crawl order; higher scores are crawled first.
+
+    Each click away from the start page costs 10 points and the sitemap
+    priority (0.0-1.0, 0.5 when not listed) is worth up to 10, so pages
+    near the home page that the site itself marks as important come first.
+    Frontiers add a point for every further link to a queued page, so pages
+    many others link to move up the queue. A crawl cut off part way has
+    audited the pages that matter most.
+    """
+    return round((0.5 if sitemap_priority is None else sitemap_priority) * 10) - 10 * depth
+
+
+class SQLiteFrontier:
+    """A URL frontier and seen-set shared by crawl workers through one SQLite file.
+
+    Every URL ever added is a row, so the table doubles as the seen-set:
+    adding a URL that is already there does nothing. A queued URL is handed
+    to exactly one worker by claim(), which moves it to claimed inside an
+    immediate transaction, and to done once the worker has processed it.
+    Adding a queued URL again counts as a link to it and raises its
+    priority by one.
+    Claims older than a lease are put back in the queue, so the pages of a
+    worker that died are crawled by another one. Works across processes on
+    one machine; use a Redis frontier across machines.
+
+    Each thread gets its own connection, so writes can run on a thread of
+    their own while the reactor thread reads (which never waits for the
+    write lock in WAL mode).
+    """
+
+    QUEUED, CLAIMED, DONE = 0, 1, 2
+    shared = True
+
+    def __init__(self, path, timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        self.local = threading.local()
+        self.connections = []
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS frontier (
+                url TEXT PRIMARY KEY,
+                state INTEGER NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                claimed_at REAL,
+                depth INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        with self.transaction():
+            # Frontier files written before pages kept their depth
+            columns = {row[1] for row in self.connection.execute("PRAGMA table_info(frontier)")}
+            if "depth" not in columns:
+                self.connection.execute("ALTER TABLE frontier ADD COLUMN depth INTEGER NOT NULL DEFAULT 0")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS frontier_queue ON frontier (state, priority DESC) WHERE state < 2"
+        )
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS shared_results (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                result TEXT NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+            """
+        )
+
+    @property
+    def connection(self):
+        """The connection of the calling thread."""
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            connection.execute(f"PRAGMA busy_timeout = {int(self.timeout * 1000)}")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+            self.connections.append(connection)
+        return connection
+
+    def transaction(self):
+        """Run a write transaction that holds the database lock from the start."""
+        return _ImmediateTransaction(self.connection)
+
+    def add(self, urls, priority=0, claim_for=None, depth=0):
+        """Add the URLs that were never seen before and return them.
+
+        URLs that are still queued get one more point of priority. With
+        claim_for, the new URLs are claimed for that worker straight away
+        instead of being queued.
+        """
+        state, claimed_at = (self.CLAIMED, time.time()) if claim_for else (self.QUEUED, None)
+        added = []
+        with self.transaction():
+            for url in urls:
+                cursor = self.connection.execute(
+                    "INSERT OR IGNORE INTO frontier (url, state, priority, worker, claimed_at, depth)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (url, state, priority, claim_for, claimed_at, depth),
+                )
+                if cursor.rowcount:
+                    added.append(url)
+                else:
+                    self.connection.execute(
+                        "UPDATE frontier SET priority = priority + 1 WHERE url = ? AND state = ?", (url, self.QUEUED)
+                    )
+        return added
+
+    def claim(self, worker, count):
+        """Take up to count queued URLs, highest priority first, for one worker.
+
+        Returns (url, depth) pairs.
+        """
+        with self.transaction():
+            pages = self.connection.execute(
+                "SELECT url, depth FROM frontier WHERE state = ? ORDER BY priority DESC LIMIT ?",
+                (self.QUEUED, count),
+            ).fetchall()
+            now = time.time()
+            self.connection.executemany(
+                "UPDATE frontier SET state = ?, worker = ?, claimed_at = ? WHERE url = ?",
+                [(self.CLAIMED, worker, now, url) for url, _ in pages],
+            )
+        return pages
+
+    def done(self, urls):
+        with self.transaction():
+            self.connection.executemany(
+                "UPDATE frontier SET state = ? WHERE url = ?", [(self.DONE, url) for url in urls]
+            )
+
+    def requeue_expired(self, lease):
+        """Put back in the queue the URLs claimed more than lease seconds ago; return how many."""
+        with self.transaction():
+            cursor = self.connection.execute(
+                "UPDATE frontier SET state = ?, worker = NULL WHERE state = ? AND claimed_at < ?",
+                (self.QUEUED, self.CLAIMED, time.time() - lease),
+            )
+        return cursor.rowcount
+
+    def get_result(self, namespace, key):
+        row = self.connection.execute(
+            "SELECT result FROM shared_results WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_result(self, namespace, key, result):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO shared_results VALUES (?, ?, ?)", (namespace, key, json.dumps(result))
+        )
+
+    def counts(self):
+        """Return the number of queued, claimed and done URLs."""
+        counts = dict(self.connection.execute("SELECT state, COUNT(*) FROM frontier GROUP BY state"))
+        return {
+            "queued": counts.get(self.QUEUED, 0),
+            "claimed": counts.get(self.CLAIMED, 0),
+            "done": counts.get(self.DONE, 0),
+        }
+
+    def finished(self):
+        """Whether every URL added so far has been processed."""
+        return self.connection.execute("SELECT 1 FROM frontier WHERE state < 2 LIMIT 1").fetchone() is None
+
+    def close(self):
+        for connection in self.connections:
+            connection.close()
+
+
+class _ImmediateTransaction:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.connection.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+class RedisFrontier:
+    """The same frontier on Redis, for workers on several machines.
+
+    The seen-set is a Redis set, the queue a sorted set of URLs scored by
+    priority (with their depths in a hash), and the claims a hash of URL
+    to "worker claimed_at depth priority". SADD and ZPOPMAX are atomic, so
+    a URL is queued once and claimed by one worker, highest priority
+    first; a link to a queued page adds a point to its score with ZADD XX
+    INCR, which leaves pages that were claimed meanwhile alone. Only those
+    commands are used, so the client can be a redis.Redis created with
+    decode_responses=True or a LocalRedis.
+    """
+
+    shared = True
+
+    def __init__(self, client, prefix="mandevu:frontier"):
+        self.client = client
+        self.prefix = prefix
+        self.seen_key = f"{prefix}:seen"
+        self.queue_key = f"{prefix}:queue"
+        self.depths_key = f"{prefix}:depths"
+        self.claims_key = f"{prefix}:claims"
+        self.done_key = f"{prefix}:done"
+
+    def add(self, urls, priority=0, claim_for=None, depth=0):
+        added = []
+        now = time.time()
+        for url in urls:
+            if not self.client.sadd(self.seen_key, url):
+                self.client.zadd(self.queue_key, {url: 1}, xx=True, incr=True)
+                continue
+            added.append(url)
+            if claim_for:
+                self.client.hset(self.claims_key, url, f"{claim_for} {now} {depth} {priority}")
+            else:
+                # The depth first, so a claimed page always has one
+                self.client.hset(self.depths_key, url, depth)
+                self.client.zadd(self.queue_key, {url: priority})
+        return added
+
+    def claim(self, worker, count):
+        pages = []
+        now = time.time()
+        for url, priority in self.client.zpopmax(self.queue_key, count):
+            depth = int(self.client.hget(self.depths_key, url) or 0)
+            self.client.hset(self.claims_key, url, f"{worker} {now} {depth} {int(priority)}")
+            self.client.hdel(self.depths_key, url)
+            pages.append((url, depth))
+        return pages
+
+    def done(self, urls):
+        for url in urls:
+            if self.client.hdel(self.claims_key, url):
+                self.client.incr(self.done_key)
+
+    def requeue_expired(self, lease):
+        cutoff = time.time() - lease
+        requeued = 0
+        for url, claim in self.client.hgetall(self.claims_key).items():
+            # Only the worker whose HDEL removed the claim puts the URL back
+            _, claimed_at, depth, priority = claim.rsplit(" ", 3)
+            if float(claimed_at) < cutoff and self.client.hdel(self.claims_key, url):
+                self.client.hset(self.depths_key, url, depth)
+                self.client.zadd(self.queue_key, {url: int(priority)})
+                requeued += 1
+        return requeued
+
+    def get_result(self, namespace, key):
+        result = self.client.hget(f"{self.prefix}:results:{namespace}", key)
+        return json.loads(result) if result is not None else None
+
+    def put_result(self, namespace, key, result):
+        self.client.hset(f"{self.prefix}:results:{namespace}", key, json.dumps(result))
+
+    def counts(self):
+        return {
+            "queued": self.client.zcard(self.queue_key),
+            "claimed": self.client.hlen(self.claims_key),
+            "done": int(self.client.get(self.done_key) or 0),
+        }
+
+    def finished(self):
+        return self.client.zcard(self.queue_key) == 0 and self.client.hlen(self.claims_key) == 0
+
+    def close(self):
+        pass
+
+
+class LocalFrontier:
+    """The frontier of a crawl run by a single process, kept in memory.
+
+    Queued pages wait in a heap ordered by priority, then by the order they
+    were found; a link to a page that is still queued adds a point to its
+    priority, which pushes a new heap entry and leaves the old one to be
+    skipped when it comes up. Whether a URL was seen is answered by a
+    seen-set (see SEEN_SET), so tracking variants of a page are queued
+    once. Claims are never lost, so there is no lease to expire.
+    """
+
+    shared = False
+
+    def __init__(self, seen):
+        self.seen = seen
+        self.queued = {}
+        self.heap = []
+        self.order = itertools.count()
+        self.claimed = set()
+        self.done_count = 0
+
+    def add(self, urls, priority=0, claim_for=None, depth=0):
+        added = []
+        for url in urls:
+            entry = self.queued.get(url)
+            if entry is not None:
+                entry[0] += 1
+                heapq.heappush(self.heap, (-entry[0], next(self.order), url))
+                continue
+            if not self.seen.add(url):
+                continue
+            added.append(url)
+            if claim_for:
+                self.claimed.add(url)
+            else:
+                self.queued[url] = [priority, depth]
+                heapq.heappush(self.heap, (-priority, next(self.order), url))
+        if len(self.heap) > 2 * len(self.queued) + 1024:
+            # Drop the entries left behind by priority changes
+            self.heap = [item for item in self.heap if self.queued.get(item[2], (None,))[0] == -item[0]]
+            heapq.heapify(self.heap)
+        return added
+
+    def claim(self, worker, count):
+        pages = []
+        while self.heap and len(pages) < count:
+            negative_priority, _, url = heapq.heappop(self.heap)
+            entry = self.queued.get(url)
+            if entry is None or entry[0] != -negative_priority:
+                continue
+            del self.queued[url]
+            self.claimed.add(url)
+            pages.append((url, entry[1]))
+        return pages
+
+    def done(self, urls):
+        for url in urls:
+            if url in self.claimed:
+                self.claimed.discard(url)
+                self.done_count += 1
+
+    def requeue_expired(self, lease):
+        return 0
+
+    def counts(self):
+        return {"queued": len(self.queued), "claimed": len(self.claimed), "done": self.done_count}
+
+    def finished(self):
+        return not self.queued and not self.claimed
+
+    def close(self):
+        pass
+
+
+class LocalRedis:
+    """An in-process stand-in for the few Redis commands RedisFrontier uses.
+
+    It is shared by the threads of one process only, which is enough to run
+    and test the Redis frontier without a server.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data = {}
+
+    def sadd(self, key, *values):
+        with self.lock:
+            members = self.data.setdefault(key, set())
+            added = len(set(values) - members)
+            members.update(values)
+            return added
+
+    def zadd(self, key, mapping, xx=False, incr=False):
+        with self.lock:
+            scores = self.data.setdefault(key, {})
+            if incr:
+                # Like Redis, INCR takes a single member and returns its new score
+                (member, increment), = mapping.items()
+                if xx and member not in scores:
+                    return None
+                scores[member] = scores.get(member, 0) + increment
+                return scores[member]
+            added = 0
+            for member, score in mapping.items():
+                if xx and member not in scores:
+                    continue
+                added += member not in scores
+                scores[member] = score
+            return added
+
+    def zpopmax(self, key, count=1):
+        with self.lock:
+            scores = self.data.get(key, {})
+            # Ties go to the greater member, as in Redis
+            popped = sorted(scores.items(), key=lambda item: (item[1], item[0]), reverse=True)[:count]
+            for member, _ in popped:
+                del scores[member]
+            return [(member, float(score)) for member, score in popped]
+
+    def zcard(self, key):
+        with self.lock:
+            return len(self.data.get(key, {}))
+
+    def hset(self, key, field, value):
+        with self.lock:
+            fields = self.data.setdefault(key, {})
+            added = field not in fields
+            fields[field] = value
+            return int(added)
+
+    def hget(self, key, field):
+        with self.lock:
+            return self.data.get(key, {}).get(field)
+
+    def hdel(self, key, *fields):
+        with self.lock:
+            existing = self.data.get(key, {})
+            return sum(existing.pop(field, None) is not None for field in fields)
+
+    def hgetall(self, key):
+        with self.lock:
+            return dict(self.data.get(key, {}))
+
+    def hlen(self, key):
+        with self.lock:
+            return len(self.data.get(key, {}))
+
+    def incr(self, key):
+        with self.lock:
+            self.data[key] = int(self.data.get(key, 0)) + 1
+            return self.data[key]
+
+    def get(self, key):
+        with self.lock:
+            value = self.data.get(key)
+            return None if value is None else str(value)
+
+
+class SharedResults:
+    """One namespace of check results kept in a frontier, in the shape StatusCache expects.
+
+    With run (such as FrontierMiddleware.call), results are written through
+    it instead of by the calling thread.
+    """
+
+    def __init__(self, frontier, namespace, run=None):
+        self.frontier = frontier
+        self.namespace = namespace
+        self.run = run
+
+    def get(self, key):
+        return self.frontier.get_result(self.namespace, key)
+
+    def put(self, key, result):
+        if self.run is not None:
+            self.run(self.frontier.put_result, self.namespace, key, result)
+        else:
+            self.frontier.put_result(self.namespace, key, result)
+
+
+def open_frontier(url, prefix="mandevu:frontier"):
+    """Open the frontier a FRONTIER_URL points to.
+
+    sqlite:///frontier.db (sqlite:////abs/path.db for an absolute path),
+    redis://host:port/db (needs the redis package) or memory:// for a
+    LocalRedis kept in this process.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme == "sqlite":
+        # sqlite:///relative.db and sqlite:////absolute.db, as in SQLAlchemy
+        path = url[len("sqlite://"):]
+        return SQLiteFrontier(path[1:] if path.startswith("/") else path)
+    if parsed.scheme in ("redis", "rediss"):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("A redis:// frontier needs the redis package: pip install redis")
+        return RedisFrontier(redis.Redis.from_url(url, decode_responses=True), prefix)
+    if parsed.scheme == "memory":
+        return RedisFrontier(LocalRedis(), prefix)
+    raise ValueError(f"Unsupported frontier URL: {url}")
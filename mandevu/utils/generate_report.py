@@ -1,51 +1,64 @@
+import argparse
+import gzip
+import hashlib
+import heapq
 import json
 import time
 import os
+import sys
 import pdfkit
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from jinja2 import Environment, FileSystemLoader
 from dotenv import load_dotenv
 from urllib.parse import urlparse
 
-load_dotenv()
-
-json_file = os.getenv("JSON_FILE_PATH")
-
-if not json_file:
-    raise ValueError("JSON_FILE_PATH is not set in .env file!")
-
-
-while not os.path.exists(json_file):
-    print("⏳ Waiting for trial.json to be created...")
-    time.sleep(2)
+# Run as a script (python mandevu/utils/generate_report.py), the project
+# root is not on the import path yet
+if not __package__:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
 
-with open(json_file, "r", encoding="utf-8") as file:
-    data = json.load(file)
+from mandevu.utils.audit_store import issue_type
+from mandevu.utils.record_feed import iter_records
+from mandevu.utils.site_analysis import node_key, page_views
 
-if not isinstance(data, list):
-    data = [data]
+load_dotenv()
 
-env = Environment(loader=FileSystemLoader(os.path.join(os.path.dirname(__file__), "templates")))
-template = env.get_template("report_template.html")
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), "templates")
 
+# Written next to the page reports, which link to it
+SITE_SUMMARY_FILE = "SEO_Audit_Site_Summary.html"
 
-results_dir = os.path.join(os.path.dirname(json_file), "results")
-os.makedirs(results_dir, exist_ok=True)
+_templates = {}
 
-for index, entry in enumerate(data, start=1):
-    print(f"Processing Entry {index}/{len(data)}...")
 
-    url = entry.get("url", "N/A")
+def get_template(name="report_template.html"):
+    """Compile a report template once per process and reuse it."""
+    template = _templates.get(name)
+    if template is None:
+        env = Environment(loader=FileSystemLoader(TEMPLATE_DIR))
+        template = _templates[name] = env.get_template(name)
+    return template
 
 
+def page_name_for(url):
+    """Turn a page URL into a safe file name fragment."""
     parsed_url = urlparse(url)
     page_name = parsed_url.path.strip("/").replace("/", "_") or "index"
 
 
     page_name = page_name.split("?")[0].split("#")[0]
-    page_name = "".join(c if c.isalnum() or c in ["_", "-"] else "_" for c in page_name)
+    return "".join(c if c.isalnum() or c in ["_", "-"] else "_" for c in page_name)
+
+
+def report_file_name(url):
+    return f"SEO_Audit_Report_{page_name_for(url)}.html"
+
 
-    context = {
-        "url": url,
+def build_context(entry):
+    """Map a crawled page record to the variables used by the report template."""
+    return {
+        "url": entry.get("url", "N/A"),
         "meta_title": entry.get("meta_title", "N/A"),
         "meta_description": entry.get("meta_description", "N/A"),
         "canonical": entry.get("canonical", ""),
@@ -67,26 +80,378 @@ for index, entry in enumerate(data, start=1):
         "hreflang_tags": entry.get("hreflang_tags", []),
         "viewport": entry.get("viewport", ""),
         "load_time": entry.get("load_time", 0),
+        "timing": entry.get("timing", {}),
+        "response_size": entry.get("response_size"),
+        "truncated": entry.get("truncated", False),
         "ssl_cert":entry.get("ssl_cert", "Unknown"),
         "security_headers": entry.get("security_headers", "Unknown"),
         "issues_detected": entry.get("issues_detected", []),
         "ai_recommendations": entry.get("ai_recommendations", {}).get("ai_recommendations", []),
+        "site_analysis": entry.get("site_analysis"),
+        "site_report": entry.get("site_report"),
     }
 
 
-    html_file_path = os.path.join(results_dir, f"SEO_Audit_Report_{page_name}.html")
-    pdf_file_path = os.path.join(results_dir, f"SEO_Audit_Report_{page_name}.pdf")
+def render_page(entry, results_dir, html_only=False):
+    """Render one page's HTML report and, unless html_only is set, its PDF.
 
+    A PDF is only regenerated when the HTML it is built from has changed
+    since the last run; the HTML digest is kept next to the PDF.
+    Returns the output paths and the time spent in each stage.
+    """
+    html_file_path = os.path.join(results_dir, report_file_name(entry.get("url", "N/A")))
+    pdf_file_path = f"{html_file_path[:-len('.html')]}.pdf"
+    timings = {"render": 0.0, "pdf": 0.0}
 
-    html_output = template.render(context)
+    start = time.perf_counter()
+    html_output = get_template().render(build_context(entry))
     with open(html_file_path, "w", encoding="utf-8") as html_file:
         html_file.write(html_output)
+    timings["render"] = time.perf_counter() - start
 
-    print(f"✅ HTML Report Generated: {html_file_path}")
+    result = {"html": html_file_path, "pdf": None, "pdf_skipped": False, "timings": timings}
+    if html_only:
+        return result
 
+    digest = hashlib.sha256(html_output.encode("utf-8")).hexdigest()
+    digest_path = f"{pdf_file_path}.sha256"
+    result["pdf"] = pdf_file_path
+    if os.path.exists(pdf_file_path) and os.path.exists(digest_path):
+        with open(digest_path, "r", encoding="utf-8") as digest_file:
+            if digest_file.read().strip() == digest:
+                result["pdf_skipped"] = True
+                return result
 
+    start = time.perf_counter()
     pdfkit.from_file(html_file_path, pdf_file_path)
+    with open(digest_path, "w", encoding="utf-8") as digest_file:
+        digest_file.write(digest)
+    timings["pdf"] = time.perf_counter() - start
+    return result
+
+
+class SiteSummary:
+    """Site-wide figures for the summary report, gathered one record at a time.
+
+    Only counters and a few top-N lists are kept, so memory does not grow
+    with the crawl. Issues are counted by type (see audit_store.issue_type),
+    so "Broken internal link found: <url>" is one line however many links
+    are broken.
+    """
+
+    TOP = 20
+
+    def __init__(self):
+        self.site = {}
+        self.pages = 0
+        self.load_time = 0.0
+        self.issue_types = Counter()
+        self.most_issues = []
+        self.slowest = []
+
+    def add_site(self, record):
+        self.site = {key: record.get(key) for key in ("site_id", "ssl_cert", "security_headers", "robots_txt", "sitemap")}
+
+    def add_page(self, entry):
+        url = entry.get("url", "N/A")
+        issues = entry.get("issues_detected") or []
+        load_time = entry.get("load_time") or 0.0
+        self.pages += 1
+        self.load_time += load_time
+        self.issue_types.update({issue_type(issue) for issue in issues})
+        self.keep(self.most_issues, (len(issues), url))
+        self.keep(self.slowest, (load_time, url))
+
+    def keep(self, heap, entry):
+        if len(heap) < self.TOP:
+            heapq.heappush(heap, entry)
+        else:
+            heapq.heappushpop(heap, entry)
+
+    def track(self, entries):
+        """Yield the records of a feed unchanged, adding each to the summary."""
+        for entry in entries:
+            if entry.get("record_type") == "site":
+                self.add_site(entry)
+            elif "url" in entry:
+                self.add_page(entry)
+            yield entry
+
+    def context(self, analysis=None):
+        """Return the variables of the summary template; analysis is the site analysis, if there is one."""
+        return {
+            "site": self.site,
+            "pages": self.pages,
+            "average_load_time": self.load_time / self.pages if self.pages else 0.0,
+            "issue_types": self.issue_types.most_common(),
+            "most_issues": [
+                {"url": url, "issues": count, "report": report_file_name(url)}
+                for count, url in sorted(self.most_issues, reverse=True) if count
+            ],
+            "slowest": [
+                {"url": url, "load_time": load_time, "report": report_file_name(url)}
+                for load_time, url in sorted(self.slowest, reverse=True)
+            ],
+            "analysis": summarize_site_analysis(analysis, self.TOP) if analysis else None,
+        }
+
+
+def summarize_site_analysis(analysis, limit, group_limit=5):
+    """Cut a site analysis down to counts and the first few URLs of each list."""
+
+    def first(items):
+        return {"count": len(items), "items": items[:limit]}
+
+    def group(urls):
+        return {"count": len(urls), "urls": urls[:group_limit]}
+
+    metrics = analysis.get("page_metrics", {})
+    authority = heapq.nlargest(limit, metrics, key=lambda url: metrics[url]["internal_authority"])
+    sitemap = analysis.get("sitemap")
+    return {
+        "pages": analysis.get("pages", 0),
+        "links": analysis.get("links", 0),
+        "orphans": first(analysis.get("orphans", [])),
+        "unreachable": first(analysis.get("unreachable", [])),
+        "redirect_chains": first(analysis.get("redirect_chains", [])),
+        "duplicates": {
+            field: {
+                "count": len(groups),
+                "items": [{"value": entry["value"], **group(entry["urls"])} for entry in groups[:limit]],
+            }
+            for field, groups in analysis.get("duplicates", {}).items() if groups
+        },
+        "near_duplicates": {
+            field: {"count": len(groups), "items": [group(urls) for urls in groups[:limit]]}
+            for field, groups in analysis.get("near_duplicates", {}).items() if groups
+        },
+        "top_authority": [
+            {"url": url, **metrics[url], "report": report_file_name(url)} for url in authority
+        ],
+        "sitemap": {
+            "urls": sitemap["urls"],
+            "not_crawled": first(sitemap["not_crawled"]),
+            "not_in_sitemap": first(sitemap["not_in_sitemap"]),
+        } if sitemap else None,
+    }
+
+
+def write_site_summary(context, results_dir):
+    """Render the site summary report and return its path."""
+    path = os.path.join(results_dir, SITE_SUMMARY_FILE)
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(get_template("site_summary_template.html").render(context))
+    return path
+
+
+def load_analysis(path):
+    """Return the site analysis a crawl wrote, or None."""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def wait_for_file(path):
+    while not os.path.exists(path):
+        print(f"⏳ Waiting for {os.path.basename(path)} to be created...")
+        time.sleep(2)
+
+
+def iter_json_lines(file, follow=False, idle_timeout=30.0, poll_interval=0.5):
+    """Yield one record per line of a JSON Lines stream.
+
+    With follow set, keep reading as the crawl appends to the file and stop
+    once no complete line has arrived for idle_timeout seconds.
+    """
+    buffer = ""
+    last_record = time.monotonic()
+    while True:
+        line = file.readline()
+        if line:
+            buffer += line
+            if not buffer.endswith("\n"):
+                continue
+            if buffer.strip():
+                yield json.loads(buffer)
+                last_record = time.monotonic()
+            buffer = ""
+            continue
+        if not follow or time.monotonic() - last_record > idle_timeout:
+            break
+        time.sleep(poll_interval)
+    if buffer.strip():
+        yield json.loads(buffer)
+
+
+def iter_entries(path, follow=False, idle_timeout=30.0):
+    """Yield crawl records from a .json, .jsonl, .jsonl.gz or .records feed one at a time.
+
+    JSON Lines and records feeds are read as a stream, so memory stays flat
+    however large the crawl is; pages from a records feed come as
+    PageRecords. A plain .json feed is a single array and has to be loaded
+    whole.
+    """
+    wait_for_file(path)
+
+    if path.endswith(".records"):
+        with open(path, "rb") as file:
+            yield from iter_records(file)
+    elif path.endswith(".gz"):
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            yield from iter_json_lines(file)
+    elif path.endswith(".jsonl"):
+        with open(path, "r", encoding="utf-8") as file:
+            yield from iter_json_lines(file, follow, idle_timeout)
+    else:
+        with open(path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+
+        if not isinstance(data, list):
+            data = [data]
+        yield from data
+
+
+def resolve_site_records(entries):
+    """Yield page records with the fields they share through their site record filled in.
+
+    Site records are kept (one per site) rather than yielded. Pages that
+    arrive before the site record they refer to are held until it does.
+    """
+    sites = {}
+    waiting = {}
+    for entry in entries:
+        if entry.get("record_type") == "site":
+            site = {key: entry.get(key, "Unknown") for key in ("ssl_cert", "security_headers")}
+            sites[entry["site_id"]] = site
+            for page in waiting.pop(entry["site_id"], []):
+                yield {**page, **site}
+        elif "site_id" not in entry:
+            yield entry
+        elif entry["site_id"] in sites:
+            yield {**entry, **sites[entry["site_id"]]}
+        else:
+            waiting.setdefault(entry["site_id"], []).append(entry)
+
+    for pages in waiting.values():
+        yield from pages
+
+
+def load_site_analysis(path):
+    """Return the site analysis indexed by page URL, or None if the crawl did not write one."""
+    analysis = load_analysis(path)
+    return page_views(analysis) if analysis is not None else None
+
+
+def attach_site_analysis(entries, views):
+    """Yield page records with the part of the site analysis that concerns them attached."""
+    for entry in entries:
+        if views and "url" in entry:
+            entry = {**entry, "site_analysis": views.get(node_key(entry["url"]))}
+        yield entry
+
+
+def report_result(result, totals, quiet=False):
+    """Print what was produced for one page, unless quiet, and add its timings to the totals."""
+    if not quiet:
+        print(f"✅ HTML Report Generated: {result['html']}")
+    if result["pdf_skipped"]:
+        if not quiet:
+            print(f"⏭️  PDF unchanged, skipped: {result['pdf']}")
+        totals["pdf_skipped"] += 1
+    elif result["pdf"] and not quiet:
+        print(f"📑 PDF Report Generated: {result['pdf']}")
+    for stage, seconds in result["timings"].items():
+        totals[stage] += seconds
+    totals["pages"] += 1
+
+
+def generate_reports(entries, results_dir, workers=1, html_only=False, merge_pdf=False, quiet=False):
+    """Render reports for every entry, across a pool of worker processes if workers > 1.
+
+    entries can be any iterable; each page is rendered as soon as it is read.
+    Unless quiet, a line is printed for every report written.
+    """
+    os.makedirs(results_dir, exist_ok=True)
+    totals = {"pages": 0, "render": 0.0, "pdf": 0.0, "pdf_skipped": 0, "merge": 0.0}
+    html_paths = []
+    start = time.perf_counter()
+
+    def collect(result):
+        if merge_pdf:
+            html_paths.append(result["html"])
+        report_result(result, totals, quiet)
+
+    if workers > 1:
+        # Keep a bounded number of pages in flight so entries can be streamed
+        # in without the whole feed ever being held in memory
+        max_in_flight = workers * 2
+        with ProcessPoolExecutor(max_workers=workers, initializer=get_template) as executor:
+            in_flight = set()
+            for entry in entries:
+                if len(in_flight) >= max_in_flight:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(future.result())
+                in_flight.add(executor.submit(render_page, entry, results_dir, html_only))
+            for future in wait(in_flight).done:
+                collect(future.result())
+    else:
+        for index, entry in enumerate(entries, start=1):
+            if not quiet:
+                print(f"Processing Entry {index}...")
+            collect(render_page(entry, results_dir, html_only))
+
+    if merge_pdf and html_paths:
+        merge_start = time.perf_counter()
+        merged_path = os.path.join(results_dir, "SEO_Audit_Report_site.pdf")
+        pdfkit.from_file(sorted(html_paths), merged_path)
+        totals["merge"] = time.perf_counter() - merge_start
+        if not quiet:
+            print(f"📚 Site PDF Report Generated: {merged_path}")
+
+    totals["wall"] = time.perf_counter() - start
+    return totals
+
+
+def print_timings(totals, workers):
+    print(
+        f"⏱️  {totals['pages']} pages with {workers} worker(s) in {totals['wall']:.2f}s "
+        f"(template render {totals['render']:.2f}s, PDF {totals['pdf']:.2f}s, "
+        f"merged PDF {totals['merge']:.2f}s, {totals['pdf_skipped']} unchanged PDFs skipped)"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate SEO audit reports from the crawl output.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="number of worker processes rendering reports (default: number of CPUs)")
+    parser.add_argument("--html-only", action="store_true", help="only write HTML reports, skip PDF generation")
+    parser.add_argument("--merge-pdf", action="store_true", help="also write one PDF covering every page")
+    parser.add_argument("--follow", action="store_true",
+                        help="render pages from a .jsonl feed as the crawl writes them")
+    parser.add_argument("--idle-timeout", type=float, default=30.0,
+                        help="with --follow, stop after this many seconds without a new record")
+    args = parser.parse_args(argv)
+
+    json_file = os.getenv("JSON_FILE_PATH")
+
+    if not json_file:
+        raise ValueError("JSON_FILE_PATH is not set in .env file!")
+
+
+    summary = SiteSummary()
+    entries = resolve_site_records(summary.track(iter_entries(json_file, args.follow, args.idle_timeout)))
+    # Written when the crawl finishes, so a --follow run may start without it
+    analysis = load_analysis(os.path.join(os.path.dirname(json_file), "site_analysis.json"))
+    entries = attach_site_analysis(entries, page_views(analysis) if analysis is not None else None)
+
+    results_dir = os.path.join(os.path.dirname(json_file), "results")
+    totals = generate_reports(entries, results_dir, args.workers, args.html_only, args.merge_pdf)
+    print_timings(totals, args.workers)
+    print(f"📊 Site Summary Generated: {write_site_summary(summary.context(analysis), results_dir)}")
+    print("🎉 All reports generated successfully!")
 
-    print(f"📑 PDF Report Generated: {pdf_file_path}")
 
-print("🎉 All reports generated successfully!")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from scrapy.http import HtmlResponse
+from twisted.internet import defer
+from twisted.python.failure import Failure
+
+from mandevu.utils.extraction import extract_page, parse_window
+from mandevu.utils.seo_rules import SEORuleChecker
+from mandevu.utils.timing import StageTimer
+
+
+class ProcessPool:
+    """Run CPU-bound audit work in worker processes, with results delivered as Deferreds.
+
+    At most max_pending tasks are in the worker processes at a time; the
+    rest wait in a queue on the reactor side. Callers that wait on the
+    Deferreds (an async spider callback, an item pipeline) keep their
+    response or item in Scrapy's scraper slot meanwhile, so the engine
+    stops taking new responses once SCRAPER_SLOT_MAX_ACTIVE_SIZE is
+    reached; that is the backpressure on the downloads.
+    """
+
+    def __init__(self, workers, max_pending=None):
+        # A fresh interpreter per worker: forking a process with a running reactor is unsafe
+        self.executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+        self.max_pending = max_pending or 2 * workers
+        self.pending = 0
+        self.waiting = deque()
+
+    def submit(self, function, *args):
+        """Run function(*args) in a worker process; return a Deferred firing with its result."""
+        result = defer.Deferred()
+        self.waiting.append((function, args, result))
+        self.start_waiting()
+        return result
+
+    def start_waiting(self):
+        from twisted.internet import reactor
+
+        while self.waiting and self.pending < self.max_pending:
+            function, args, result = self.waiting.popleft()
+            self.pending += 1
+            future = self.executor.submit(function, *args)
+            # Done callbacks run in the executor's thread
+            future.add_done_callback(lambda future, result=result: reactor.callFromThread(self.done, future, result))
+
+    def done(self, future, result):
+        self.pending -= 1
+        self.start_waiting()
+        try:
+            value = future.result()
+        except Exception as e:
+            result.errback(Failure(e))
+        else:
+            result.callback(value)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def extract_response(response, window):
+    """Extract the SEO fields of a page response, parsing only its head plus window bytes of the rest.
+
+    Returns the extracted fields and whether the page was cut short.
+    """
+    parsed = parse_window(response.body, window)
+    if parsed < len(response.body):
+        return extract_page(response.replace(body=response.body[:parsed]).selector.root), True
+    return extract_page(response.selector.root), False
+
+
+def extract_body(url, body, encoding, window):
+    """Worker process side of extract_response(); also returns the seconds spent."""
+    start = time.perf_counter()
+    page_data, truncated = extract_response(HtmlResponse(url, body=body, encoding=encoding), window)
+    return page_data, truncated, time.perf_counter() - start
+
+
+def evaluate_rules(seo_data, site_record):
+    """Worker process side of the SEO rules; returns the issues and the time spent per rule."""
+    timer = StageTimer()
+    issues = SEORuleChecker(seo_data, site_record).analyze(timer)
+    return issues, timer.seconds
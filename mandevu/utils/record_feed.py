@@ -0,0 +1,219 @@
+"""The binary "records" feed format.
+
+A records feed is a magic line followed by length-prefixed chunks. A chunk
+holds up to a few hundred consecutive page records stored column by column:
+one column per field, with the link and image tables of every page in the
+chunk flattened into shared columns plus offsets. Text columns are JSON
+arrays; sizes and offsets are raw integer arrays; statuses, content types
+and image types are indexes into a small table of the distinct values in
+the chunk. Items that are not page records (the site record) go in chunks
+of their own, as JSON, so the feed keeps the order items were exported in.
+
+    chunk   := length:u32 header_length:u32 header:JSON column*
+    header  := {"kind": "pages" | "items", "count": n, "values": [...], "columns": [[name, type, length], ...]}
+"""
+import json
+import struct
+from array import array
+
+from mandevu.items import ABSENT, ABSENT_SIZE, PAGE_FIELDS, ImageTable, LinkTable, PageRecord
+
+MAGIC = b"MANDEVU-RECORDS 1\n"
+
+_LENGTH = struct.Struct("<I")
+
+# Page fields written as one JSON array each; the tables have columns of their own
+_JSON_FIELDS = tuple(name for name in PAGE_FIELDS if name not in ("internal_links", "image_data"))
+
+
+class _Values:
+    """The distinct small values (statuses, types) of a chunk, numbered in order of appearance."""
+
+    def __init__(self):
+        self.values = []
+        self.index = {}
+
+    def number(self, value):
+        key = (type(value), value)
+        number = self.index.get(key)
+        if number is None:
+            number = self.index[key] = len(self.values)
+            self.values.append(value)
+        return number
+
+
+def encode_pages(records):
+    """Encode page records as the payload of one "pages" chunk."""
+    values = _Values()
+    columns = []
+
+    def add(name, kind, data):
+        columns.append((name, kind, data))
+
+    absent = []
+    for name in _JSON_FIELDS:
+        column = []
+        for record in records:
+            value = getattr(record, name)
+            if value is ABSENT:
+                absent.append((len(column), name))
+                value = None
+            column.append(value)
+        add(name, "json", column)
+    add("absent", "json", absent)
+    add("extra", "json", [record.extra for record in records])
+
+    link_offsets = array("I", [0])
+    image_offsets = array("I", [0])
+    link_urls, link_statuses, link_types, link_sizes, link_errors = [], array("H"), array("H"), array("q"), []
+    image_srcs, image_alts, image_sizes, image_statuses, image_types = [], [], array("q"), array("H"), array("H")
+    number = values.number
+    tables = []
+    for record in records:
+        links = record.internal_links
+        images = record.image_data
+        tables.append((links is ABSENT, images is ABSENT))
+        if links is not ABSENT:
+            count = len(links)
+            link_urls.append(links.url_text)
+            link_statuses.extend(number(status) for status in links.statuses)
+            if links.content_types is None:
+                link_types.extend([number(None)] * count)
+                link_sizes.extend([ABSENT_SIZE] * count)
+            else:
+                link_types.extend(number(content_type) for content_type in links.content_types)
+                link_sizes.extend(links.sizes)
+            link_errors.extend(links.errors or [None] * count)
+        else:
+            link_urls.append("")
+        link_offsets.append(len(link_statuses))
+        if images is not ABSENT:
+            image_srcs.append(images.src_text)
+            image_alts.extend(images.alts)
+            image_sizes.extend(images.sizes)
+            image_statuses.extend(number(status) for status in images.statuses)
+            image_types.extend(number(kind) for kind in images.types)
+        else:
+            image_srcs.append("")
+        image_offsets.append(len(image_statuses))
+
+    add("tables_absent", "json", tables if any(links or images for links, images in tables) else None)
+    add("link_offsets", "I", link_offsets)
+    add("link_urls", "json", link_urls)
+    add("link_statuses", "H", link_statuses)
+    add("link_types", "H", link_types)
+    add("link_sizes", "q", link_sizes)
+    add("link_errors", "json", link_errors if any(error is not None for error in link_errors) else None)
+    add("image_offsets", "I", image_offsets)
+    add("image_srcs", "json", image_srcs)
+    add("image_alts", "json", image_alts)
+    add("image_sizes", "q", image_sizes)
+    add("image_statuses", "H", image_statuses)
+    add("image_types", "H", image_types)
+    return _pack("pages", len(records), values.values, columns)
+
+
+def encode_items(items):
+    """Encode other items (plain dicts) as the payload of one "items" chunk."""
+    return _pack("items", len(items), [], [("items", "json", items)])
+
+
+def _pack(kind, count, values, columns):
+    blobs = []
+    layout = []
+    for name, column_type, data in columns:
+        if column_type == "json":
+            blob = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        else:
+            blob = data.tobytes()
+        layout.append([name, column_type, len(blob)])
+        blobs.append(blob)
+    header = json.dumps({"kind": kind, "count": count, "values": values, "columns": layout}).encode("utf-8")
+    payload = b"".join([_LENGTH.pack(len(header)), header, *blobs])
+    return _LENGTH.pack(len(payload)) + payload
+
+
+def _unpack(payload):
+    (header_length,) = _LENGTH.unpack_from(payload)
+    position = _LENGTH.size + header_length
+    header = json.loads(payload[_LENGTH.size:position])
+    columns = {}
+    for name, column_type, length in header["columns"]:
+        blob = payload[position:position + length]
+        position += length
+        if column_type == "json":
+            columns[name] = json.loads(blob)
+        else:
+            column = array(column_type)
+            column.frombytes(blob)
+            columns[name] = column
+    return header, columns
+
+
+def decode_pages(header, columns):
+    """Yield the PageRecords of a decoded "pages" chunk."""
+    values = header["values"]
+    absent = {}
+    for index, name in columns["absent"]:
+        absent.setdefault(index, []).append(name)
+    link_offsets, image_offsets = columns["link_offsets"], columns["image_offsets"]
+    link_errors = columns["link_errors"]
+    tables_absent = columns["tables_absent"]
+    field_columns = [(name, columns[name]) for name in _JSON_FIELDS]
+
+    for index in range(header["count"]):
+        record = PageRecord.__new__(PageRecord)
+        for name, column in field_columns:
+            setattr(record, name, column[index])
+        # Tuples on the way in, JSON arrays on the way out
+        for name in ("open_graph_data", "twitter_card_data", "timing"):
+            value = getattr(record, name)
+            if value is not None:
+                setattr(record, name, tuple(value))
+        for name in absent.get(index, ()):
+            setattr(record, name, ABSENT)
+        record.extra = columns["extra"][index]
+
+        start, end = link_offsets[index], link_offsets[index + 1]
+        links = LinkTable(
+            columns["link_urls"][index],
+            [values[number] for number in columns["link_statuses"][start:end]],
+            [values[number] for number in columns["link_types"][start:end]],
+            columns["link_sizes"][start:end],
+            link_errors[start:end] if link_errors is not None else None,
+        )
+
+        start, end = image_offsets[index], image_offsets[index + 1]
+        images = ImageTable(
+            columns["image_srcs"][index],
+            columns["image_alts"][start:end],
+            columns["image_sizes"][start:end],
+            [values[number] for number in columns["image_statuses"][start:end]],
+            [values[number] for number in columns["image_types"][start:end]],
+        )
+
+        links_absent, images_absent = tables_absent[index] if tables_absent else (False, False)
+        record.internal_links = ABSENT if links_absent else links
+        record.image_data = ABSENT if images_absent else images
+        yield record
+
+
+def iter_records(file):
+    """Yield the items of a records feed opened in binary mode: PageRecords for pages, dicts for the rest."""
+    magic = file.read(len(MAGIC))
+    if magic != MAGIC:
+        raise ValueError("Not a records feed")
+    while True:
+        prefix = file.read(_LENGTH.size)
+        if len(prefix) < _LENGTH.size:
+            return
+        (length,) = _LENGTH.unpack(prefix)
+        payload = file.read(length)
+        if len(payload) < length:
+            # The last chunk of a feed that is still being written, or was cut off
+            return
+        header, columns = _unpack(payload)
+        if header["kind"] == "pages":
+            yield from decode_pages(header, columns)
+        else:
+            yield from columns["items"]
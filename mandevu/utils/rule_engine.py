@@ -0,0 +1,533 @@
+import argparse
+import os
+from collections import Counter
+
+HEADING_LEVELS = ("h1", "h2", "h3", "h4", "h5", "h6")
+OPEN_GRAPH_FIELDS = ("og:title", "og:description", "og:image", "og:url")
+TWITTER_CARD_FIELDS = ("twitter:title", "twitter:description", "twitter:image", "twitter:url")
+GENERIC_ALT_TEXTS = {"image", "photo", "screenshot", "picture", "graphic"}
+
+# Defaults match the limits hard-coded in SEORuleChecker
+DEFAULT_THRESHOLDS = {
+    "title_min_length": 30,
+    "title_max_length": 60,
+    "description_min_length": 50,
+    "description_max_length": 160,
+    "min_internal_links": 3,
+    "large_image_bytes": 100000,
+    "max_load_time": 3,
+}
+
+# Issue code -> message template, filled in from the issue's parameters
+ISSUE_MESSAGES = {
+    "title_missing": "Missing title tag.",
+    "title_length": "Title tag length should be between {min}-{max} characters.",
+    "description_missing": "Missing meta description.",
+    "description_length": "Meta description length ({length} characters) should be between {min}-{max} characters.",
+    "canonical_missing": "Missing canonical tag.",
+    "robots_meta_missing": "No robots meta tag found.",
+    "robots_meta_noindex": "Page is set to noindex (won't appear in search results).",
+    "h1_missing": "No H1 tag found on the page. Each page should have one main H1 tag for SEO.",
+    "h1_multiple": "Multiple H1 tags found ({count}). Ensure only one main H1 for clarity.",
+    "heading_skipped": "Heading structure issue: Found {level} without an H{previous} above it.",
+    "internal_links_low": "Low internal linking. Consider adding more internal links.",
+    "external_links_missing": "No external links found. Consider linking to relevant sources.",
+    "internal_link_broken": " Broken internal link found: {link}",
+    "image_alt_missing": "Image missing alt text: {src}",
+    "image_alt_generic": "Non-descriptive alt text: '{alt}' for {src}",
+    "image_alt_duplicate": "Duplicate alt text: '{alt}' used on {count} images.",
+    "image_large": " Large image file: {src} ({size} bytes)",
+    "image_broken": "Broken image found: {src}",
+    "sitemap_missing": "No sitemap.xml detected. A sitemap helps search engines crawl your site efficiently.",
+    "sitemap_not_in_robots": "Sitemap.xml is missing from robots.txt. Consider adding it for better indexing.",
+    "robots_txt_missing": "No robots.txt file found. This file helps control how search engines crawl your site.",
+    "robots_txt_no_default_agent": "robots.txt is missing a default User-agent directive.",
+    "robots_txt_blocks_all": "robots.txt is blocking all search engines from crawling the site. Review your settings.",
+    "not_https": "Page is not served over HTTPS.",
+    "structured_data_missing": "Missing structured data.",
+    "og_title_missing": "Missing Open Graph title.",
+    "og_description_missing": "Missing Open Graph description.",
+    "og_image_missing": "Missing Open Graph image.",
+    "og_url_missing": "Missing Open Graph URL.",
+    "twitter_title_missing": "Missing Twitter Card title.",
+    "twitter_description_missing": "Missing Twitter Card description.",
+    "twitter_image_missing": "Missing Twitter Card image.",
+    "twitter_url_missing": "Missing Twitter Card URL.",
+    "hreflang_missing": "Missing hreflang tags.",
+    "viewport_missing": "Missing meta viewport tag.",
+    "load_time_high": "Page load time is too high: {load_time:.2f} seconds.",
+}
+
+
+def format_issue(code, params=None):
+    """Turn a structured issue into the message SEORuleChecker would have produced."""
+    message = ISSUE_MESSAGES[code]
+    return message.format(**params) if params else message
+
+
+class PageBatch:
+    """Page records stored column-wise, one list per field the rules read.
+
+    Images and internal links are flattened into parallel columns with the
+    index of the page they belong to, so rules over them run as a single
+    pass over the whole batch. Site-wide fields are read from the page
+    record if present and otherwise from its site record in sites.
+    """
+
+    def __init__(self, records, sites=None):
+        sites = sites or {}
+        self.size = 0
+        self.url = []
+        self.title = []
+        self.description = []
+        self.canonical = []
+        self.meta_robots = []
+        self.h1_count = []
+        self.heading_mask = []
+        self.internal_links_count = []
+        self.external_links_count = []
+        self.robots_txt = []
+        self.sitemap_url = []
+        self.has_structured_data = []
+        self.open_graph = {field: [] for field in OPEN_GRAPH_FIELDS}
+        self.twitter_card = {field: [] for field in TWITTER_CARD_FIELDS}
+        self.has_hreflang = []
+        self.viewport = []
+        self.load_time = []
+
+        self.link_page = []
+        self.link = []
+        self.image_page = []
+        self.image_src = []
+        self.image_alt = []
+        self.image_size = []
+        self.image_status = []
+
+        for record in records:
+            self.append(record, sites.get(record.get("site_id"), {}))
+
+    def append(self, record, site):
+        row = self.size
+        self.size += 1
+        self.url.append(record.get("url", ""))
+        self.title.append(record.get("meta_title", ""))
+        self.description.append(record.get("meta_description", ""))
+        self.canonical.append(record.get("canonical", ""))
+        self.meta_robots.append(record.get("meta_robots", ""))
+
+        mask = 0
+        for bit, level in enumerate(HEADING_LEVELS):
+            if record.get(f"{level}_tags"):
+                mask |= 1 << bit
+        self.h1_count.append(len(record.get("h1_tags", [])))
+        self.heading_mask.append(mask)
+
+        self.internal_links_count.append(record.get("internal_links_count", 0))
+        self.external_links_count.append(record.get("external_links_count", 0))
+        self.robots_txt.append((record["robots_txt"] if "robots_txt" in record else site.get("robots_txt", "")) or "")
+        self.sitemap_url.append(record["sitemap_url"] if "sitemap_url" in record else site.get("sitemap_url", ""))
+        self.has_structured_data.append(bool(record.get("structured_data", [])))
+        open_graph = record.get("open_graph_data", {})
+        for field in OPEN_GRAPH_FIELDS:
+            self.open_graph[field].append(bool(open_graph.get(field)))
+        twitter_card = record.get("twitter_card_data", {})
+        for field in TWITTER_CARD_FIELDS:
+            self.twitter_card[field].append(bool(twitter_card.get(field)))
+        self.has_hreflang.append(bool(record.get("hreflang_tags", [])))
+        self.viewport.append(bool(record.get("viewport", "")))
+        self.load_time.append(record.get("load_time", 0))
+
+        for link in record.get("internal_links", []):
+            self.link_page.append(row)
+            self.link.append(link)
+        for image in record.get("image_data", []):
+            self.image_page.append(row)
+            self.image_src.append(image["src"])
+            self.image_alt.append(image.get("alt", "").strip())
+            self.image_size.append(image.get("size", 0))
+            self.image_status.append(image.get("status", 200))
+
+
+class IssueTable:
+    """Issues found over a batch, stored as blocks of parallel columns.
+
+    A block holds the page index of each issue a rule found and their codes
+    (one code for the whole block, or one per issue). Parameters are either
+    absent, one dict shared by the whole block, or built on demand: the
+    block then keeps one reference per issue (usually an index into the
+    batch columns) and a function turning a reference into the parameter
+    dict. Nothing is built or formatted until by_page() or format() is
+    called, so re-scoring a batch only produces codes and integers.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.blocks = []
+
+    def add_block(self, pages, codes, params=None, refs=None):
+        """Add the issues a rule found; codes is one code or a list aligned with pages.
+
+        params is None, a dict shared by every issue, or, with refs, a
+        function called with each issue's reference to build its parameters.
+        """
+        if pages:
+            self.blocks.append((pages, codes, params, refs))
+
+    def __len__(self):
+        return sum(len(block[0]) for block in self.blocks)
+
+    def counts(self):
+        """Return how many times each issue code was found across the batch."""
+        counts = Counter()
+        for pages, codes, _, _ in self.blocks:
+            if isinstance(codes, str):
+                counts[codes] += len(pages)
+            else:
+                counts.update(codes)
+        return counts
+
+    def iter_block(self, block):
+        """Yield (page, code, params) for each issue in a block."""
+        pages, codes, params, refs = block
+        if isinstance(codes, str):
+            codes = [codes] * len(pages)
+        if refs is None:
+            return zip(pages, codes, [params] * len(pages))
+        return zip(pages, codes, map(params, refs))
+
+    def by_page(self):
+        """Return a list, per page, of its (code, params) issues in rule order."""
+        pages = [[] for _ in range(self.size)]
+        for block in self.blocks:
+            for page, code, params in self.iter_block(block):
+                pages[page].append((code, params))
+        return pages
+
+    def format(self):
+        """Return a list, per page, of its issue messages, in rule order."""
+        pages = [[] for _ in range(self.size)]
+        append = [messages.append for messages in pages]
+        for block in self.blocks:
+            block_pages, codes, params, refs = block
+            if isinstance(codes, str) and refs is None:
+                message = ISSUE_MESSAGES[codes]
+                if params:
+                    message = message.format_map(params)
+                for page in block_pages:
+                    append[page](message)
+            elif refs is None:
+                for page, code in zip(block_pages, codes):
+                    append[page](ISSUE_MESSAGES[code])
+            else:
+                for page, code, values in self.iter_block(block):
+                    append[page](ISSUE_MESSAGES[code].format_map(values))
+        return pages
+
+
+def _heading_issues(mask):
+    """Return the heading hierarchy issues for one combination of heading levels present."""
+    issues = []
+    last_level = 0
+    for bit, level in enumerate(HEADING_LEVELS):
+        if mask & (1 << bit):
+            if last_level and bit + 1 > last_level + 1:
+                issues.append({"level": level, "previous": last_level})
+            last_level = bit + 1
+    return issues
+
+
+# Only 64 combinations of heading levels exist, so their issues are worked out once
+HEADING_ISSUES = [_heading_issues(mask) for mask in range(1 << len(HEADING_LEVELS))]
+
+
+class RuleEngine:
+    """Evaluate the SEORuleChecker rules over a PageBatch, one rule at a time.
+
+    Each rule works through whole columns and records its issues as
+    blocks, so a stored crawl can be re-scored against new thresholds
+    without re-crawling or building per-page objects. Rules run in the same
+    order as SEORuleChecker.analyze, so each page's issues come out in the
+    same order too.
+    """
+
+    def __init__(self, thresholds=None):
+        self.thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+        self.rules = [
+            self.check_meta_tags,
+            self.check_canonical_tag,
+            self.check_meta_robots,
+            self.check_headings,
+            self.check_internal_links,
+            self.check_external_links,
+            self.check_broken_links,
+            self.check_image_optimization,
+            self.check_large_images,
+            self.check_broken_images,
+            self.check_sitemap,
+            self.check_robots_txt,
+            self.check_https,
+            self.check_structured_data,
+            self.check_open_graph,
+            self.check_twitter_cards,
+            self.check_hreflang,
+            self.check_viewport,
+            self.check_load_time,
+        ]
+
+    def evaluate(self, batch, timer=None):
+        """Run every rule over the batch and return the issues as an IssueTable.
+
+        With a StageTimer, the time spent in each rule is added to it.
+        """
+        issues = IssueTable(batch.size)
+        for rule in self.rules:
+            if timer is None:
+                rule(batch, issues)
+            else:
+                with timer.stage(f"rules/{rule.__name__}"):
+                    rule(batch, issues)
+        return issues
+
+    def check_meta_tags(self, batch, issues):
+        t = self.thresholds
+        title_min, title_max = t["title_min_length"], t["title_max_length"]
+        description_min, description_max = t["description_min_length"], t["description_max_length"]
+
+        issues.add_block(
+            [page for page, title in enumerate(batch.title) if not title or title == "No Title Tag"],
+            "title_missing",
+        )
+        issues.add_block(
+            [page for page, title in enumerate(batch.title)
+             if title and not title_min <= len(title) <= title_max and title != "No Title Tag"],
+            "title_length",
+            {"min": title_min, "max": title_max},
+        )
+
+        issues.add_block(
+            [page for page, description in enumerate(batch.description)
+             if not description or description == "No Description Available"],
+            "description_missing",
+        )
+        too_short_or_long = [
+            page for page, description in enumerate(batch.description)
+            if description and not description_min <= len(description) <= description_max
+            and description != "No Description Available"
+        ]
+        issues.add_block(
+            too_short_or_long,
+            "description_length",
+            lambda page: {"length": len(batch.description[page]), "min": description_min, "max": description_max},
+            too_short_or_long,
+        )
+
+    def check_canonical_tag(self, batch, issues):
+        issues.add_block([page for page, canonical in enumerate(batch.canonical) if not canonical], "canonical_missing")
+
+    def check_meta_robots(self, batch, issues):
+        pages, codes = [], []
+        for page, robots in enumerate(batch.meta_robots):
+            if not robots or robots == "No Robots Tag":
+                pages.append(page)
+                codes.append("robots_meta_missing")
+            elif "noindex" in robots:
+                pages.append(page)
+                codes.append("robots_meta_noindex")
+        issues.add_block(pages, codes)
+
+    def check_headings(self, batch, issues):
+        issues.add_block([page for page, count in enumerate(batch.h1_count) if count == 0], "h1_missing")
+        multiple = [page for page, count in enumerate(batch.h1_count) if count > 1]
+        issues.add_block(multiple, "h1_multiple", lambda page: {"count": batch.h1_count[page]}, multiple)
+
+        pages, refs = [], []
+        for page, mask in enumerate(batch.heading_mask):
+            for values in HEADING_ISSUES[mask]:
+                pages.append(page)
+                refs.append(values)
+        issues.add_block(pages, "heading_skipped", dict, refs)
+
+    def check_internal_links(self, batch, issues):
+        minimum = self.thresholds["min_internal_links"]
+        issues.add_block(
+            [page for page, count in enumerate(batch.internal_links_count) if count < minimum],
+            "internal_links_low",
+        )
+
+    def check_external_links(self, batch, issues):
+        issues.add_block(
+            [page for page, count in enumerate(batch.external_links_count) if count == 0],
+            "external_links_missing",
+        )
+
+    def check_broken_links(self, batch, issues):
+        broken = [index for index, link in enumerate(batch.link) if "404" in link]
+        issues.add_block(
+            [batch.link_page[index] for index in broken],
+            "internal_link_broken",
+            lambda index: {"link": batch.link[index]},
+            broken,
+        )
+
+    def check_image_optimization(self, batch, issues):
+        # Alt texts repeat a lot across a site, so each distinct one is classified once
+        kinds = {}
+        for alt_text in set(batch.image_alt):
+            lowered = alt_text.lower()
+            if not alt_text or lowered == "no alt text":
+                kinds[alt_text] = "image_alt_missing"
+            elif lowered in GENERIC_ALT_TEXTS or alt_text.endswith((".jpg", ".png", ".gif", ".webp")):
+                kinds[alt_text] = "image_alt_generic"
+            else:
+                kinds[alt_text] = None
+
+        image_kinds = [kinds[alt_text] for alt_text in batch.image_alt]
+        flagged = [index for index, kind in enumerate(image_kinds) if kind is not None]
+        issues.add_block(
+            [batch.image_page[index] for index in flagged],
+            [image_kinds[index] for index in flagged],
+            lambda index: {"alt": batch.image_alt[index], "src": batch.image_src[index]},
+            flagged,
+        )
+
+        # Duplicates come after a page's other image issues, in order of first use
+        pages, refs = [], []
+        current_page = None
+        first_use = {}
+        for index, (page, alt_text) in enumerate(zip(batch.image_page, batch.image_alt)):
+            if page != current_page:
+                for first, count in first_use.values():
+                    if count > 1:
+                        pages.append(current_page)
+                        refs.append((first, count))
+                current_page = page
+                first_use = {}
+            if image_kinds[index] == "image_alt_missing":
+                continue
+            if alt_text in first_use:
+                first_use[alt_text][1] += 1
+            else:
+                first_use[alt_text] = [index, 1]
+        for first, count in first_use.values():
+            if count > 1:
+                pages.append(current_page)
+                refs.append((first, count))
+        issues.add_block(
+            pages,
+            "image_alt_duplicate",
+            lambda ref: {"alt": batch.image_alt[ref[0]], "count": ref[1]},
+            refs,
+        )
+
+    def check_large_images(self, batch, issues):
+        limit = self.thresholds["large_image_bytes"]
+        large = [index for index, size in enumerate(batch.image_size) if size > limit]
+        issues.add_block(
+            [batch.image_page[index] for index in large],
+            "image_large",
+            lambda index: {"src": batch.image_src[index], "size": batch.image_size[index]},
+            large,
+        )
+
+    def check_broken_images(self, batch, issues):
+        broken = [index for index, status in enumerate(batch.image_status) if status == 404]
+        issues.add_block(
+            [batch.image_page[index] for index in broken],
+            "image_broken",
+            lambda index: {"src": batch.image_src[index]},
+            broken,
+        )
+
+    def check_sitemap(self, batch, issues):
+        issues.add_block([page for page, sitemap_url in enumerate(batch.sitemap_url) if not sitemap_url], "sitemap_missing")
+        issues.add_block(
+            [page for page, (sitemap_url, robots_txt) in enumerate(zip(batch.sitemap_url, batch.robots_txt))
+             if sitemap_url and "Sitemap:" not in robots_txt],
+            "sitemap_not_in_robots",
+        )
+
+    def check_robots_txt(self, batch, issues):
+        # Pages of one site share a robots.txt, so each distinct file is checked once
+        checks = (
+            ("robots_txt_missing", lambda robots_txt: not robots_txt),
+            ("robots_txt_no_default_agent", lambda robots_txt: "User-agent: *" not in robots_txt),
+            ("robots_txt_blocks_all", lambda robots_txt: "Disallow: /" in robots_txt),
+        )
+        distinct = set(batch.robots_txt)
+        for code, check in checks:
+            failing = {robots_txt for robots_txt in distinct if check(robots_txt)}
+            if failing:
+                issues.add_block([page for page, robots_txt in enumerate(batch.robots_txt) if robots_txt in failing], code)
+
+    def check_https(self, batch, issues):
+        issues.add_block([page for page, url in enumerate(batch.url) if not url.startswith("https://")], "not_https")
+
+    def check_structured_data(self, batch, issues):
+        issues.add_block(
+            [page for page, present in enumerate(batch.has_structured_data) if not present],
+            "structured_data_missing",
+        )
+
+    def check_open_graph(self, batch, issues):
+        self.check_fields(batch, issues, batch.open_graph)
+
+    def check_twitter_cards(self, batch, issues):
+        self.check_fields(batch, issues, batch.twitter_card)
+
+    def check_fields(self, batch, issues, columns):
+        """Report each missing field of a group, one block per field so fields keep their order."""
+        for field, present in columns.items():
+            issues.add_block(
+                [page for page, is_present in enumerate(present) if not is_present],
+                f"{field.replace(':', '_')}_missing",
+            )
+
+    def check_hreflang(self, batch, issues):
+        issues.add_block([page for page, present in enumerate(batch.has_hreflang) if not present], "hreflang_missing")
+
+    def check_viewport(self, batch, issues):
+        issues.add_block([page for page, present in enumerate(batch.viewport) if not present], "viewport_missing")
+
+    def check_load_time(self, batch, issues):
+        limit = self.thresholds["max_load_time"]
+        slow = [page for page, load_time in enumerate(batch.load_time) if load_time > limit]
+        issues.add_block(slow, "load_time_high", lambda page: {"load_time": batch.load_time[page]}, slow)
+
+
+def main(argv=None):
+    from mandevu.utils.generate_report import iter_entries
+
+    parser = argparse.ArgumentParser(description="Re-score a stored crawl against the SEO rules.")
+    parser.add_argument("--threshold", action="append", default=[], metavar="NAME=VALUE",
+                        help=f"override a rule threshold; one of {', '.join(DEFAULT_THRESHOLDS)}")
+    args = parser.parse_args(argv)
+
+    thresholds = {}
+    for override in args.threshold:
+        name, _, value = override.partition("=")
+        if name not in DEFAULT_THRESHOLDS:
+            parser.error(f"unknown threshold: {name}")
+        value = float(value)
+        thresholds[name] = int(value) if value.is_integer() else value
+
+    json_file = os.getenv("JSON_FILE_PATH")
+    if not json_file:
+        raise ValueError("JSON_FILE_PATH is not set in .env file!")
+
+    # Pages go into the columns as they are read, so the feed is never held in memory
+    sites = {}
+    batch = PageBatch([])
+    for entry in iter_entries(json_file):
+        if entry.get("record_type") == "site":
+            sites[entry["site_id"]] = entry
+        else:
+            batch.append(entry, sites.get(entry.get("site_id"), {}))
+
+    issues = RuleEngine(thresholds).evaluate(batch)
+    print(f"{batch.size} pages, {len(issues)} issues")
+    for code, count in issues.counts().most_common():
+        print(f"{count:8d}  {code}")
+
+
+if __name__ == "__main__":
+    main()
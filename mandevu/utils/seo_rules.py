@@ -1,9 +1,18 @@
+import time
+
 
 class SEORuleChecker:
-    def __init__(self, seo_data):
+    def __init__(self, seo_data, site=None):
         self.seo_data = seo_data
+        self.site = site or {}
         self.issues = []
 
+    def site_value(self, key, default=""):
+        """Read a site-wide field from the page record or, failing that, from its site record."""
+        if key in self.seo_data:
+            return self.seo_data[key]
+        return self.site.get(key, default)
+
     def check_meta_tags(self):
         """Check if meta title and description are missing or not optimal in length."""
         title = self.seo_data.get("meta_title", "")
@@ -105,7 +114,6 @@ class SEORuleChecker:
         for alt_text, sources in alt_texts.items():
             if len(sources) > 1:
                 self.issues.append(f"Duplicate alt text: '{alt_text}' used on {len(sources)} images.")
-                print(f"Duplicate alt text detected: '{alt_text}' used on {len(sources)} images.")  # Debug print statement
 
     def check_large_images(self):
         """Check for large image files."""
@@ -127,8 +135,8 @@ class SEORuleChecker:
 
     def check_sitemap(self):
         """Check if a sitemap exists and is referenced in robots.txt."""
-        sitemap_url = self.seo_data.get("sitemap_url", "")
-        robots_txt = self.seo_data.get("robots_txt", "")
+        sitemap_url = self.site_value("sitemap_url")
+        robots_txt = self.site_value("robots_txt")
 
         if not sitemap_url:
             self.issues.append("No sitemap.xml detected. A sitemap helps search engines crawl your site efficiently.")
@@ -139,7 +147,7 @@ class SEORuleChecker:
 
     def check_robots_txt(self):
         """Check if robots.txt exists and has proper directives."""
-        robots_txt = self.seo_data.get("robots_txt", "")
+        robots_txt = self.site_value("robots_txt")
 
         if not robots_txt:
             self.issues.append("No robots.txt file found. This file helps control how search engines crawl your site.")
@@ -199,25 +207,43 @@ class SEORuleChecker:
         if load_time > 3:
             self.issues.append(f"Page load time is too high: {load_time:.2f} seconds.")
 
-    def analyze(self):
-        """Run all SEO checks and return a list of issues."""
-        self.check_meta_tags()
-        self.check_canonical_tag()
-        self.check_meta_robots()
-        self.check_headings()
-        self.check_internal_links()
-        self.check_external_links()
-        self.check_broken_links()
-        self.check_image_optimization()
-        self.check_large_images()
-        self.check_broken_images()
-        self.check_sitemap()
-        self.check_robots_txt()
-        self.check_https()
-        self.check_structured_data()
-        self.check_open_graph()
-        self.check_twitter_cards()
-        self.check_hreflang()
-        self.check_viewport()
-        self.check_load_time()
-        return self.issues
\ No newline at end of file
+    def checks(self):
+        """Return the checks analyze() runs, in order."""
+        return [
+            self.check_meta_tags,
+            self.check_canonical_tag,
+            self.check_meta_robots,
+            self.check_headings,
+            self.check_internal_links,
+            self.check_external_links,
+            self.check_broken_links,
+            self.check_image_optimization,
+            self.check_large_images,
+            self.check_broken_images,
+            self.check_sitemap,
+            self.check_robots_txt,
+            self.check_https,
+            self.check_structured_data,
+            self.check_open_graph,
+            self.check_twitter_cards,
+            self.check_hreflang,
+            self.check_viewport,
+            self.check_load_time,
+        ]
+
+    def analyze(self, timer=None):
+        """Run all SEO checks and return a list of issues.
+
+        With a StageTimer, the time spent in each check is added to it.
+        """
+        if timer is None:
+            for check in self.checks():
+                check()
+            return self.issues
+
+        clock = time.perf_counter
+        for check in self.checks():
+            start = clock()
+            check()
+            timer.add(f"rules/{check.__name__}", clock() - start)
+        return self.issues
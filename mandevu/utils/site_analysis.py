@@ -0,0 +1,385 @@
+import hashlib
+import re
+from array import array
+from collections import Counter, deque
+from itertools import groupby
+
+from mandevu.utils.extraction import normalize_space
+from mandevu.utils.urls import FingerprintSet
+
+# Page fields compared across the site for duplicate content
+DUPLICATE_FIELDS = ("meta_title", "meta_description", "h1")
+
+_WORD = re.compile(r"\w+")
+
+
+def node_key(url):
+    """Return the form of an absolute URL the link graph is keyed on (fragment dropped)."""
+    return url.partition("#")[0]
+
+
+def text_hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def word_sketch(text, size):
+    """Return the smallest word hashes of a text, a bottom-k MinHash sketch of its word set."""
+    return sorted({text_hash(word) for word in _WORD.findall(text)})[:size]
+
+
+def sketch_similarity(a, b, size):
+    """Estimate the Jaccard similarity of two word sets from their sketches (exact for short texts)."""
+    a, b = set(a), set(b)
+    union = sorted(a | b)[:size]
+    if not union:
+        return 0.0
+    return len((a & b).intersection(union)) / len(union)
+
+
+class LinkGraph:
+    """The internal link graph of a crawl, with URLs interned to integer IDs.
+
+    Edges are appended to two flat arrays as pages arrive and are turned
+    into a compressed sparse row adjacency (an offsets array plus one
+    targets array) once the crawl is over, so a million-edge graph takes a
+    few megabytes. URLs that redirected are aliased to the page they ended
+    on.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.urls = []
+        self.crawled = bytearray()
+        self.sources = array("I")
+        self.targets = array("I")
+        self.alias = {}
+        self.redirect_chains = []
+
+    def __len__(self):
+        return len(self.urls)
+
+    def intern(self, url):
+        url = node_key(url)
+        node = self.ids.get(url)
+        if node is None:
+            node = self.ids[url] = len(self.urls)
+            self.urls.append(url)
+            self.crawled.append(0)
+        return node
+
+    def add_page(self, url, links, redirect_chain=()):
+        """Add a crawled page, the internal links on it and the redirects that led to it."""
+        page = self.intern(url)
+        self.crawled[page] = 1
+        if redirect_chain:
+            self.redirect_chains.append((page, [self.intern(hop) for hop in redirect_chain]))
+            for hop in redirect_chain:
+                self.alias[self.intern(hop)] = page
+        for link in links:
+            target = self.intern(link)
+            if target != page:
+                self.sources.append(page)
+                self.targets.append(target)
+        return page
+
+    def resolve(self, node):
+        """Follow redirect aliases to the node a link actually ends on."""
+        seen = 0
+        while node in self.alias and seen < 20:
+            node = self.alias[node]
+            seen += 1
+        return node
+
+    def to_csr(self):
+        """Return (offsets, targets) with the outgoing edges of node n in targets[offsets[n]:offsets[n + 1]]."""
+        size = len(self.urls)
+        resolved = array("I", (self.resolve(target) for target in self.targets)) if self.alias else self.targets
+        offsets = array("I", bytes(4 * (size + 1)))
+        for source in self.sources:
+            offsets[source + 1] += 1
+        for node in range(size):
+            offsets[node + 1] += offsets[node]
+
+        targets = array("I", bytes(4 * len(resolved)))
+        position = array("I", offsets)
+        for source, target in zip(self.sources, resolved):
+            targets[position[source]] = target
+            position[source] += 1
+        return offsets, targets
+
+
+def in_degrees(offsets, targets, size):
+    """Count the distinct pages linking to each node, ignoring self links."""
+    degrees = array("I", bytes(4 * size))
+    for source in range(size):
+        for target in set(targets[offsets[source]:offsets[source + 1]]):
+            if target != source:
+                degrees[target] += 1
+    return degrees
+
+
+def click_depths(offsets, targets, start):
+    """Return the number of clicks from the start page to each node, -1 where unreachable."""
+    depths = array("i", [-1]) * (len(offsets) - 1)
+    depths[start] = 0
+    queue = deque([start])
+    while queue:
+        node = queue.popleft()
+        depth = depths[node] + 1
+        for target in targets[offsets[node]:offsets[node + 1]]:
+            if depths[target] < 0:
+                depths[target] = depth
+                queue.append(target)
+    return depths
+
+
+def pagerank(offsets, targets, damping=0.85, iterations=50, tolerance=1e-6):
+    """Return the PageRank of each node by power iteration over the CSR graph.
+
+    The rank of pages without outgoing links is spread evenly over every
+    page, so the scores always sum to one.
+    """
+    size = len(offsets) - 1
+    if size == 0:
+        return array("d")
+    rank = [1.0 / size] * size
+    for _ in range(iterations):
+        incoming = [0.0] * size
+        dangling = 0.0
+        for node in range(size):
+            start, end = offsets[node], offsets[node + 1]
+            if start == end:
+                dangling += rank[node]
+                continue
+            share = rank[node] / (end - start)
+            for target in targets[start:end]:
+                incoming[target] += share
+        base = (1.0 - damping + damping * dangling) / size
+        updated = [base + damping * value for value in incoming]
+        delta = sum(abs(new - old) for new, old in zip(updated, rank))
+        rank = updated
+        if delta < tolerance:
+            break
+    return array("d", rank)
+
+
+class DuplicateIndex:
+    """Find pages sharing the same, or nearly the same, value of a text field.
+
+    Exact duplicates are found through a hash index of the normalized text;
+    only a hash per distinct value and the IDs of pages sharing it are kept.
+    Near duplicates are pages whose word sets have an estimated Jaccard
+    similarity of at least threshold, using a fixed-size MinHash sketch per
+    page. Candidates are found by locality-sensitive hashing: in each of
+    a few bands, pages get a key made of the minimum of their word hashes
+    under two XOR permutations, and pages with equal keys are compared.
+    Words on more than max_shared pages (the ones every template repeats)
+    are left out of the keys, and each page is compared with at most window
+    others per key, which keeps templated sites from making it quadratic.
+    """
+
+    def __init__(self, threshold=0.7, sketch_size=16, bands=4, window=10, max_shared=1000):
+        self.threshold = threshold
+        self.sketch_size = sketch_size
+        self.salts = [(text_hash(f"band {band} a"), text_hash(f"band {band} b")) for band in range(bands)]
+        self.window = window
+        self.max_shared = max_shared
+        self.first_page = {}
+        self.groups = {}
+        self.pages = array("I")
+        self.sketches = array("Q")
+        self.sketch_lengths = array("B")
+
+    def add(self, page, text):
+        text = normalize_space(text).lower()
+        if not text:
+            return
+        key = text_hash(text)
+        first = self.first_page.setdefault(key, page)
+        if first != page:
+            self.groups.setdefault(key, {"value": text, "pages": [first]})["pages"].append(page)
+            return
+
+        sketch = word_sketch(text, self.sketch_size)
+        # Too few words to tell a near duplicate from a coincidence
+        if len(sketch) < 3:
+            return
+        self.pages.append(page)
+        self.sketch_lengths.append(len(sketch))
+        self.sketches.extend(sketch + [0] * (self.sketch_size - len(sketch)))
+
+    def sketch(self, index):
+        start = index * self.sketch_size
+        return self.sketches[start:start + self.sketch_lengths[index]]
+
+    def exact(self):
+        """Return groups of pages with the same value, as {"value", "pages"} dicts."""
+        return list(self.groups.values())
+
+    def near(self):
+        """Return groups of page IDs whose values differ only slightly, exact duplicates excluded."""
+        count = len(self.pages)
+        parent = list(range(count))
+
+        def find(index):
+            while parent[index] != index:
+                parent[index] = parent[parent[index]]
+                index = parent[index]
+            return index
+
+        frequency = Counter(value for index in range(count) for value in self.sketch(index))
+        keys = []
+        for index in range(count):
+            distinctive = [value for value in self.sketch(index) if frequency[value] <= self.max_shared]
+            if not distinctive:
+                continue
+            for band, (first, second) in enumerate(self.salts):
+                key = (band, min(value ^ first for value in distinctive), min(value ^ second for value in distinctive))
+                keys.append((key, index))
+        keys.sort()
+
+        for _, run in groupby(keys, key=lambda key: key[0]):
+            run = [index for _, index in run]
+            for position, a in enumerate(run):
+                for b in run[position + 1:position + 1 + self.window]:
+                    if find(a) != find(b) and sketch_similarity(self.sketch(a), self.sketch(b), self.sketch_size) >= self.threshold:
+                        parent[find(a)] = find(b)
+
+        members = {}
+        for index in range(count):
+            members.setdefault(find(index), []).append(self.pages[index])
+        return [pages for pages in members.values() if len(pages) > 1]
+
+
+class SiteAnalyzer:
+    """Collect what the site-wide analysis needs from page records as they are crawled.
+
+    Only interned link graph edges, redirect hops and text hashes are kept
+    per page, not the records themselves. When the crawl read a sitemap,
+    its SitemapIndex is compared with the pages crawled.
+    """
+
+    def __init__(self, start_url=None, sitemap=None):
+        self.start_url = start_url
+        self.sitemap = sitemap
+        self.graph = LinkGraph()
+        self.duplicates = {field: DuplicateIndex() for field in DUPLICATE_FIELDS}
+
+    def add(self, record):
+        links = [link["url"] if isinstance(link, dict) else link for link in record.get("internal_links", [])]
+        page = self.graph.add_page(record["url"], links, record.get("redirect_chain", []))
+        self.duplicates["meta_title"].add(page, record.get("meta_title", ""))
+        self.duplicates["meta_description"].add(page, record.get("meta_description", ""))
+        self.duplicates["h1"].add(page, " ".join(record.get("h1_tags", [])))
+
+    def analyze(self):
+        """Compute the site analysis as a JSON-serializable dict."""
+        graph = self.graph
+        urls = graph.urls
+        # Interned first: a worker of a distributed crawl may not have crawled the start page
+        start = graph.resolve(graph.intern(self.start_url)) if self.start_url else None
+        offsets, targets = graph.to_csr()
+        size = len(graph)
+        pages = [node for node in range(size) if graph.crawled[node]]
+        if start is None and pages:
+            start = pages[0]
+
+        degrees = in_degrees(offsets, targets, size)
+        depths = click_depths(offsets, targets, start) if start is not None else array("i", [-1]) * size
+        ranks = pagerank(offsets, targets)
+
+        return {
+            "pages": len(pages),
+            "links": len(targets),
+            "start_url": urls[start] if start is not None else None,
+            "orphans": [urls[node] for node in pages if degrees[node] == 0 and node != start],
+            "unreachable": [urls[node] for node in pages if depths[node] < 0],
+            "redirect_chains": [
+                {"url": urls[hops[0]], "final_url": urls[page], "hops": len(hops), "chain": [urls[hop] for hop in hops]}
+                for page, hops in graph.redirect_chains
+            ],
+            "duplicates": {
+                field: [
+                    {"value": group["value"], "urls": [urls[page] for page in group["pages"]]}
+                    for group in index.exact()
+                ]
+                for field, index in self.duplicates.items()
+            },
+            "near_duplicates": {
+                field: [[urls[page] for page in group] for group in index.near()]
+                for field, index in self.duplicates.items()
+            },
+            "page_metrics": {
+                urls[node]: {
+                    "click_depth": depths[node] if depths[node] >= 0 else None,
+                    "inlinks": degrees[node],
+                    "internal_authority": round(ranks[node] * len(pages), 4),
+                }
+                for node in pages
+            },
+            "sitemap": self.sitemap_coverage(pages),
+        }
+
+    def sitemap_coverage(self, pages):
+        """Compare the sitemap with the crawl: sitemap URLs never crawled and crawled pages it does not list."""
+        sitemap = self.sitemap
+        if sitemap is None or not sitemap.sitemap_count:
+            return None
+        graph = self.graph
+        # A sitemap URL that redirected to a crawled page counts as crawled
+        crawled = FingerprintSet(len(pages) + len(graph.alias))
+        for node in pages:
+            crawled.add(graph.urls[node])
+        for node in graph.alias:
+            crawled.add(graph.urls[node])
+        return {
+            "urls": len(sitemap),
+            "not_crawled": [url for url in sitemap if url not in crawled],
+            "not_in_sitemap": [graph.urls[node] for node in pages if graph.urls[node] not in sitemap],
+        }
+
+
+def page_views(analysis, group_limit=10):
+    """Index a site analysis by page URL, keeping the parts that concern each page for its report.
+
+    Each page of a duplicate group shares one copy of the group cut down to
+    its size and first group_limit URLs, so a group of n pages costs n
+    references rather than n copies of n URLs; site_analysis.json keeps the
+    full groups.
+    """
+    summary = {
+        "pages": analysis.get("pages", 0),
+        "links": analysis.get("links", 0),
+        "orphans": len(analysis.get("orphans", [])),
+        "redirect_chains": len(analysis.get("redirect_chains", [])),
+    }
+    views = {
+        url: {
+            "metrics": metrics,
+            "orphan": False,
+            "redirect_chains": [],
+            "duplicates": {},
+            "near_duplicates": {},
+            "summary": summary,
+        }
+        for url, metrics in analysis.get("page_metrics", {}).items()
+    }
+    for url in analysis.get("orphans", []):
+        if url in views:
+            views[url]["orphan"] = True
+    for chain in analysis.get("redirect_chains", []):
+        if chain["final_url"] in views:
+            views[chain["final_url"]]["redirect_chains"].append(chain)
+    for field, groups in analysis.get("duplicates", {}).items():
+        for group in groups:
+            shown = {"value": group["value"], "count": len(group["urls"]), "urls": group["urls"][:group_limit]}
+            for url in group["urls"]:
+                if url in views:
+                    views[url]["duplicates"][field] = shown
+    for field, groups in analysis.get("near_duplicates", {}).items():
+        for group in groups:
+            shown = {"count": len(group), "urls": group[:group_limit]}
+            for url in group:
+                if url in views:
+                    views[url]["near_duplicates"][field] = shown
+    return views
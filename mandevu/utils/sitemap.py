@@ -0,0 +1,88 @@
+import gzip
+import io
+import tempfile
+
+from lxml import etree
+
+from mandevu.utils.urls import FingerprintSet
+
+
+def _local_name(tag):
+    return tag.rpartition("}")[2]
+
+
+def iter_sitemap(body):
+    """Stream the entries of a sitemap or sitemap index.
+
+    Yields (kind, loc, lastmod, priority) tuples where kind is "url" for
+    pages and "sitemap" for child sitemaps of an index. The body itself is
+    already buffered by Scrapy (and capped by DOWNLOAD_MAXSIZE); gzipped
+    bodies are decompressed on the fly and parsed elements are discarded as
+    soon as they are read, so the decompressed XML and its parsed tree are
+    never held whole on top of it.
+    """
+    stream = io.BytesIO(body)
+    if body[:2] == b"\x1f\x8b":
+        stream = gzip.GzipFile(fileobj=stream)
+
+    parser = etree.iterparse(stream, events=("end",), resolve_entities=False, no_network=True, huge_tree=True)
+    for _, element in parser:
+        kind = _local_name(element.tag) if isinstance(element.tag, str) else None
+        if kind not in ("url", "sitemap"):
+            continue
+
+        fields = {_local_name(child.tag): (child.text or "").strip() for child in element if isinstance(child.tag, str)}
+        loc = fields.get("loc")
+        if loc:
+            try:
+                priority = float(fields["priority"]) if fields.get("priority") else None
+            except ValueError:
+                priority = None
+            yield kind, loc, fields.get("lastmod") or None, priority
+
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+
+class SitemapIndex:
+    """Compact record of every page URL listed in the site's sitemaps.
+
+    Membership ("is this page in the sitemap?") is answered from 64-bit
+    fingerprints, 8 bytes per URL in memory. The coverage analysis also
+    names the sitemap pages that were never crawled, so each URL is written
+    once, in the order it was listed, to an anonymous temporary file that
+    iteration reads back.
+    """
+
+    def __init__(self):
+        self.fingerprints = FingerprintSet()
+        self.spill = None
+        self.sitemap_count = 0
+
+    def add(self, url):
+        if self.fingerprints.add(url):
+            if self.spill is None:
+                self.spill = tempfile.TemporaryFile("w+", encoding="utf-8", newline="\n")
+            self.spill.write(url + "\n")
+
+    def __contains__(self, url):
+        return url in self.fingerprints
+
+    def __iter__(self):
+        if self.spill is None:
+            return
+        self.spill.flush()
+        self.spill.seek(0)
+        for line in self.spill:
+            yield line[:-1]
+        # Further adds append after the last URL
+        self.spill.seek(0, io.SEEK_END)
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    def close(self):
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
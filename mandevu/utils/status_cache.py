@@ -0,0 +1,69 @@
+from collections import OrderedDict
+
+from w3lib.url import canonicalize_url
+
+
+class StatusCache:
+    """Crawl-scoped LRU store of URL check results with shared in-flight checks.
+
+    Each normalized URL is checked at most once while it stays in the cache.
+    Callers asking for a URL whose check is already running are queued as
+    waiters and handed the result when it resolves. With a shared store
+    (an object with get(key) and put(key, result), such as a
+    frontier.SharedResults), results are also looked up in and written to
+    it, so the workers of a distributed crawl check each URL once between
+    them. A key can also be expected, when a response that will resolve it
+    is already on its way (a page queued for crawling answers the checks
+    of links to it); waiters on an expected key never start a check.
+    """
+
+    def __init__(self, max_size=10000, shared=None):
+        self.max_size = max_size
+        self.resolved = OrderedDict()
+        self.in_flight = {}
+        self.expected = set()
+        self.shared = shared
+
+    def key(self, url):
+        """Normalize a URL so that trivially different spellings share an entry."""
+        try:
+            return canonicalize_url(url)
+        except ValueError:
+            return url
+
+    def get(self, key):
+        """Return the cached result for a key, or None if it is unknown."""
+        if key not in self.resolved:
+            result = self.shared.get(key) if self.shared is not None else None
+            if result is not None:
+                self.remember(key, result)
+            return result
+        self.resolved.move_to_end(key)
+        return self.resolved[key]
+
+    def wait(self, key, waiter):
+        """Queue a waiter for a key. Returns True if the caller must start the check."""
+        waiters = self.in_flight.get(key)
+        if waiters is not None:
+            waiters.append(waiter)
+            return False
+        self.in_flight[key] = [waiter]
+        return key not in self.expected
+
+    def expect(self, key):
+        """Note that a response on its way will resolve a key."""
+        self.expected.add(key)
+
+    def remember(self, key, result):
+        self.resolved[key] = result
+        self.resolved.move_to_end(key)
+        while len(self.resolved) > self.max_size:
+            self.resolved.popitem(last=False)
+
+    def resolve(self, key, result):
+        """Store the result for a key and return the waiters that were queued on it."""
+        self.remember(key, result)
+        self.expected.discard(key)
+        if self.shared is not None:
+            self.shared.put(key, result)
+        return self.in_flight.pop(key, [])
@@ -0,0 +1,183 @@
+import math
+import re
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from scrapy.resolver import CachingThreadedResolver
+
+# Durations recorded for every download, in seconds
+TIMING_METRICS = ("queue_wait", "dns", "ttfb", "download", "total")
+
+_ID_SEGMENT = re.compile(r"^(\d+|[0-9a-f]{12,}|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})$", re.I)
+
+# Host name lookups the resolver has timed but no download has claimed yet
+dns_lookups = {}
+
+
+class TimingResolver(CachingThreadedResolver):
+    """The default caching resolver, timing the lookups that miss its cache.
+
+    Scrapy's HTTP/1.1 handler resolves host names inside the time it
+    reports as download latency. The time of each uncached lookup is kept
+    per host so the first download from that host can report it apart.
+    """
+
+    def getHostByName(self, name, timeout=()):
+        start = time.time()
+        deferred = super().getHostByName(name, timeout)
+        if not deferred.called:
+            deferred.addCallback(self._record_lookup, name, start)
+        return deferred
+
+    def _record_lookup(self, result, name, start):
+        dns_lookups[name] = time.time() - start
+        return result
+
+
+def url_pattern(url):
+    """Group a URL with the pages built from the same template.
+
+    The host and the first directory of the path are kept and the rest of
+    the path is replaced by *, so /blog/2024/my-post and
+    /blog/2023/other-post both fall under /blog/*/*, and /about and
+    /contact under /*. Directories that look like IDs become {id}.
+    """
+    parsed = urlparse(url)
+    segments = [segment for segment in parsed.path.split("/") if segment]
+    if not segments:
+        return f"{parsed.netloc}/"
+    if len(segments) == 1:
+        return f"{parsed.netloc}/*"
+    first = "{id}" if _ID_SEGMENT.match(segments[0]) else segments[0]
+    return f"{parsed.netloc}/" + "/".join([first] + ["*"] * (len(segments) - 1))
+
+
+class LatencyHistogram:
+    """A fixed-size histogram of durations with logarithmic buckets.
+
+    Buckets grow by growth per step from minimum up, so percentiles are
+    within a few percent of the real value however many samples are added,
+    and the memory used does not depend on the number of samples.
+    """
+
+    def __init__(self, minimum=0.001, maximum=600.0, growth=1.05):
+        self.minimum = minimum
+        self.log_growth = math.log(growth)
+        self.buckets = [0] * (int(math.log(maximum / minimum) / self.log_growth) + 2)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        if value <= self.minimum:
+            bucket = 0
+        else:
+            bucket = min(int(math.log(value / self.minimum) / self.log_growth) + 1, len(self.buckets) - 1)
+        self.buckets[bucket] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def upper_bound(self, bucket):
+        return self.minimum * math.exp(self.log_growth * bucket)
+
+    def percentile(self, fraction):
+        """Return the upper bound of the bucket holding the given fraction of samples."""
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(fraction * self.count))
+        seen = 0
+        last = len(self.buckets) - 1
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                # The last bucket also holds everything above maximum
+                return self.max if bucket == last else min(self.upper_bound(bucket), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 4) if self.count else None,
+            "p50": _rounded(self.percentile(0.50)),
+            "p95": _rounded(self.percentile(0.95)),
+            "p99": _rounded(self.percentile(0.99)),
+            "max": round(self.max, 4),
+        }
+
+
+def _rounded(value):
+    return round(value, 4) if value is not None else None
+
+
+class TimingStats:
+    """Latency histograms per request method and URL pattern, plus crawl-wide ones.
+
+    At most max_patterns groups are kept; downloads from any further URL
+    patterns are counted under "other" so templated sites with unusual
+    paths cannot make this grow without bound.
+    """
+
+    def __init__(self, max_patterns=100):
+        self.max_patterns = max_patterns
+        self.groups = {}
+        self.overall = {}
+        self.bytes = 0
+
+    def histograms(self, group):
+        if group not in self.groups:
+            if len(self.groups) >= self.max_patterns:
+                group = "other"
+            self.groups.setdefault(group, {})
+        return self.groups[group]
+
+    def record(self, method, url, timing):
+        group = self.histograms(f"{method} {url_pattern(url)}")
+        for metric in TIMING_METRICS:
+            value = timing.get(metric)
+            if value is None:
+                continue
+            for histograms in (group, self.overall):
+                histograms.setdefault(metric, LatencyHistogram()).add(value)
+        self.bytes += timing.get("response_size", 0)
+
+    def summary(self):
+        return {
+            "overall": {metric: histogram.summary() for metric, histogram in self.overall.items()},
+            "bytes": self.bytes,
+            "patterns": {
+                group: {metric: histogram.summary() for metric, histogram in histograms.items()}
+                for group, histograms in sorted(self.groups.items())
+            },
+        }
+
+
+class StageTimer:
+    """Accumulate the time spent in named stages of the audit.
+
+    Only a total and a call count per stage are kept, and they are written
+    to the crawl stats once, by publish(), so timing a stage costs two clock
+    reads and a couple of dict updates.
+    """
+
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+
+    def add(self, name, seconds):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def publish(self, stats, prefix="stages"):
+        for name, seconds in self.seconds.items():
+            stats.set_value(f"{prefix}/{name}/seconds", round(seconds, 4))
+            stats.set_value(f"{prefix}/{name}/calls", self.calls[name])
@@ -1,29 +1,34 @@
 import requests
 import json
 import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
 
 
 TOGETHER_AI_API_KEY = os.getenv("TOGETHER_AI_API_KEY")
 
-def get_recommendations(issues_detected):
-    """
-    Generates SEO recommendations based on detected issues using Together AI.
 
-    Args:
-        issues_detected (list): List of detected SEO issues.
-
-    Returns:
-        dict: AI-generated SEO recommendations in JSON format.
-    """
-    if not TOGETHER_AI_API_KEY:
-        raise ValueError("Missing Together AI API key. Set TOGETHER_AI_API_KEY in environment variables.")
+class TogetherAIBackend:
+    """Recommendation backend that asks the Together AI chat completions API."""
 
     api_url = "https://api.together.ai/v1/chat/completions"
+    model = "meta-llama/Llama-3.3-70B-Instruct-Turbo-Free"
+
+    def __init__(self, api_key=None, timeout=60):
+        self.api_key = api_key or TOGETHER_AI_API_KEY
+        self.timeout = timeout
 
+    def recommend(self, issue_sets):
+        """Return one recommendations dict per issue set, using a single API call."""
+        if not self.api_key:
+            raise ValueError("Missing Together AI API key. Set TOGETHER_AI_API_KEY in environment variables.")
 
-    prompt = f"""
+        if len(issue_sets) == 1:
+            prompt = f"""
     Here are the SEO issues detected on a webpage:
-    {json.dumps(issues_detected, indent=2)}
+    {json.dumps(issue_sets[0], indent=2)}
 
     Provide SEO recommendations, in **structured JSON format**.
 
@@ -36,29 +41,171 @@ def get_recommendations(issues_detected):
         ]
     }}
     """
+        else:
+            numbered = {str(index): issues for index, issues in enumerate(issue_sets)}
+            prompt = f"""
+    Here are the SEO issues detected on several webpages, keyed by page number:
+    {json.dumps(numbered, indent=2)}
+
+    Provide SEO recommendations for each page, in **structured JSON format**.
+
+    ONLY return a JSON response, in this exact format:
+    {{
+        "0": {{"ai_recommendations": ["Recommendation 1", "Recommendation 2"]}},
+        "1": {{"ai_recommendations": ["Recommendation 1", "Recommendation 2"]}}
+    }}
+    """
+
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
 
-    headers = {
-        "Authorization": f"Bearer {TOGETHER_AI_API_KEY}",
-        "Content-Type": "application/json",
-    }
+        payload = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": "You are an expert SEO assistant."},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.7
+        }
 
-    payload = {
-        "model": "meta-llama/Llama-3.3-70B-Instruct-Turbo-Free",
-        "messages": [
-            {"role": "system", "content": "You are an expert SEO assistant."},
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0.7
-    }
+        response = requests.post(self.api_url, headers=headers, json=payload, timeout=self.timeout)
 
-    response = requests.post(api_url, headers=headers, json=payload)
+        if response.status_code != 200:
+            error = {"Recommendations": [f"Error: {response.status_code}, {response.text}"]}
+            return [error] * len(issue_sets)
 
-    if response.status_code == 200:
         try:
             ai_response = response.json().get("choices", [{}])[0].get("message", {}).get("content", "{}")
-            return json.loads(ai_response)
+            parsed = json.loads(ai_response)
         except json.JSONDecodeError:
-            return {"Recommendations": ["Error: AI response is not valid JSON."]}
-    else:
-        return {"Recommendations": [f"Error: {response.status_code}, {response.text}"]}
+            return [{"Recommendations": ["Error: AI response is not valid JSON."]}] * len(issue_sets)
+
+        if len(issue_sets) == 1:
+            return [parsed]
+        missing = {"Recommendations": ["Error: AI response did not cover this page."]}
+        return [parsed.get(str(index), missing) for index in range(len(issue_sets))]
+
+
+class StubBackend:
+    """Deterministic offline backend, for tests and runs without API access."""
+
+    def recommend(self, issue_sets):
+        return [
+            {"ai_recommendations": [f"Resolve: {issue}" for issue in issues]}
+            for issues in issue_sets
+        ]
+
+
+BACKENDS = {
+    "together": TogetherAIBackend,
+    "stub": StubBackend,
+}
+
+
+class RecommendationService:
+    """Cache and batch recommendation lookups in front of a backend.
 
+    Issue lists are canonicalized (page URLs masked, duplicates removed,
+    sorted) and keyed by content hash. Results are kept in a bounded
+    in-memory LRU and, if cache_dir is set, as one JSON file per key on disk.
+    The LRU is shared between the reactor, which only looks in memory, and
+    the worker thread running recommend_many, so it is guarded by a lock.
+    """
+
+    def __init__(self, backend, cache_dir=None, batch_size=8, memory_size=1024):
+        self.backend = backend
+        self.cache_dir = cache_dir
+        self.batch_size = batch_size
+        self.memory_size = memory_size
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def canonicalize(self, issues):
+        """Reduce an issue list to a stable form that similar pages share."""
+        return sorted({re.sub(r"https?://\S+", "<url>", " ".join(issue.split())) for issue in issues})
+
+    def cache_key(self, canonical_issues):
+        return hashlib.sha256(json.dumps(canonical_issues).encode("utf-8")).hexdigest()
+
+    def cached(self, key, disk=True):
+        """Return the stored recommendations for a key, or None.
+
+        With disk=False only the memory cache is looked at, so the call
+        never blocks on file reads (the reactor calls it for every page).
+        """
+        with self.lock:
+            result = self.memory.get(key)
+            if result is not None:
+                self.memory.move_to_end(key)
+                return result
+        if not disk or not self.cache_dir:
+            return None
+        path = os.path.join(self.cache_dir, f"{key}.json")
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                result = json.load(file)
+        except (OSError, json.JSONDecodeError):
+            return None
+        self.remember(key, result)
+        return result
+
+    def remember(self, key, result):
+        with self.lock:
+            self.memory[key] = result
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_size:
+                self.memory.popitem(last=False)
+
+    def store(self, key, result):
+        """Cache a successful result in memory and on disk."""
+        self.remember(key, result)
+        if not self.cache_dir:
+            return
+        path = os.path.join(self.cache_dir, f"{key}.json")
+        # Unique per process, as batch audits share one cache directory
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(result, file)
+        os.replace(tmp_path, path)
+
+    def recommend_many(self, issue_lists):
+        """Return recommendations for each issue list, calling the backend only for cache misses."""
+        keys = []
+        misses = {}
+        for issues in issue_lists:
+            canonical = self.canonicalize(issues)
+            key = self.cache_key(canonical)
+            keys.append(key)
+            if key not in misses and self.cached(key) is None:
+                misses[key] = canonical
+
+        results = {}
+        pending = list(misses.items())
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start:start + self.batch_size]
+            for (key, _), result in zip(batch, self.backend.recommend([canonical for _, canonical in batch])):
+                results[key] = result
+                if "ai_recommendations" in result:
+                    self.store(key, result)
+
+        return [results[key] if key in results else self.cached(key) for key in keys]
+
+    def recommend(self, issues):
+        return self.recommend_many([issues])[0]
+
+
+def get_recommendations(issues_detected):
+    """
+    Generates SEO recommendations based on detected issues using Together AI.
+
+    Args:
+        issues_detected (list): List of detected SEO issues.
+
+    Returns:
+        dict: AI-generated SEO recommendations in JSON format.
+    """
+    return TogetherAIBackend().recommend([issues_detected])[0]
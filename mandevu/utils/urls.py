@@ -0,0 +1,215 @@
+import hashlib
+import math
+import re
+from array import array
+from functools import lru_cache
+
+from w3lib.url import canonicalize_url
+
+# Query parameters that only track where a visitor came from; a trailing *
+# matches any suffix
+TRACKING_PARAMS = (
+    "utm_*", "gclid", "gclsrc", "dclid", "fbclid", "msclkid", "yclid", "igshid",
+    "mc_cid", "mc_eid", "_ga", "_gl", "_hsenc", "_hsmi", "mkt_tok",
+)
+
+
+# Ports that are the same as none at all
+DEFAULT_PORTS = {"http": ":80", "https": ":443"}
+
+# URLs made only of characters that w3lib leaves as they are, which
+# canonicalize() handles without it (w3lib takes about 90 us per URL)
+_PLAIN_URL = re.compile(r"(https?)://([A-Za-z0-9.-]+(?::[0-9]*)?)(/[A-Za-z0-9._~/-]*)?(?:\?([A-Za-z0-9._~=&-]*))?", re.IGNORECASE)
+
+
+@lru_cache(maxsize=16)
+def _param_pattern(strip_params):
+    names = "|".join(re.escape(name[:-1]) + ".*" if name.endswith("*") else re.escape(name) for name in strip_params)
+    return re.compile(f"(?:{names})$")
+
+
+def _drop_default_port(scheme, netloc):
+    port = DEFAULT_PORTS.get(scheme)
+    return netloc[:-len(port)] if port and netloc.endswith(port) else netloc
+
+
+def canonicalize(url, strip_params=TRACKING_PARAMS):
+    """Return the canonical form of a URL, so that variants of one page compare equal.
+
+    The fragment and a default port are dropped, query arguments are sorted
+    and percent-encoding is normalized (w3lib's canonicalize_url), and the
+    query parameters matching strip_params are removed.
+    """
+    pattern = _param_pattern(tuple(strip_params)) if strip_params else None
+    plain = _PLAIN_URL.fullmatch(url.partition("#")[0])
+    if plain:
+        scheme, netloc, path, query = plain.groups()
+        scheme = scheme.lower()
+        url = f"{scheme}://{_drop_default_port(scheme, netloc.lower().rstrip(':'))}{path or '/'}"
+        pairs = sorted(
+            (key, value) for key, _, value in (pair.partition("=") for pair in (query or "").split("&") if pair)
+            if pattern is None or not pattern.match(key)
+        )
+        if pairs:
+            url += "?" + "&".join(f"{key}={value.replace('=', '%3D')}" for key, value in pairs)
+        return url
+
+    try:
+        url = canonicalize_url(url)
+    except ValueError:
+        return url
+    scheme, separator, rest = url.partition("://")
+    if separator:
+        netloc, slash, path = rest.partition("/")
+        url = f"{scheme}://{_drop_default_port(scheme, netloc)}{slash}{path}"
+    if pattern is not None and "?" in url:
+        base, _, query = url.partition("?")
+        kept = [pair for pair in query.split("&") if not pattern.match(pair.partition("=")[0])]
+        url = f"{base}?{'&'.join(kept)}" if kept else base
+    return url
+
+
+def url_fingerprint(url, strip_params=TRACKING_PARAMS):
+    """Return a 64-bit integer fingerprint of a canonicalized URL."""
+    return text_fingerprint(canonicalize(url, strip_params))
+
+
+def text_fingerprint(text):
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class FingerprintSet:
+    """A set of URLs that keeps only their 64-bit fingerprints, in one flat array.
+
+    Fingerprints live in an open-addressing hash table (linear probing, at
+    most half full), so each URL costs 16 to 32 bytes however long it is,
+    against well over 100 for a URL string in a Python set. Two URLs can
+    share a fingerprint, but at 64 bits the odds are about one in thirty
+    million for a crawl of a million URLs.
+    """
+
+    def __init__(self, capacity=1024, strip_params=TRACKING_PARAMS):
+        size = 16
+        while size < 2 * capacity:
+            size *= 2
+        self.slots = array("Q", bytes(8 * size))
+        self.count = 0
+        self.strip_params = strip_params
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, url):
+        return self.contains_fingerprint(url_fingerprint(url, self.strip_params))
+
+    def add(self, url):
+        """Add a URL and return whether it was new."""
+        return self.add_fingerprint(url_fingerprint(url, self.strip_params))
+
+    def contains_fingerprint(self, fingerprint):
+        fingerprint = fingerprint or 1
+        slots = self.slots
+        mask = len(slots) - 1
+        index = fingerprint & mask
+        while True:
+            slot = slots[index]
+            if slot == fingerprint:
+                return True
+            if slot == 0:
+                return False
+            index = (index + 1) & mask
+
+    def add_fingerprint(self, fingerprint):
+        # 0 marks an empty slot
+        fingerprint = fingerprint or 1
+        slots = self.slots
+        mask = len(slots) - 1
+        index = fingerprint & mask
+        while True:
+            slot = slots[index]
+            if slot == fingerprint:
+                return False
+            if slot == 0:
+                break
+            index = (index + 1) & mask
+        slots[index] = fingerprint
+        self.count += 1
+        if 2 * self.count > len(slots):
+            self._grow()
+        return True
+
+    def _grow(self):
+        old = self.slots
+        self.slots = array("Q", bytes(16 * len(old)))
+        self.count = 0
+        for fingerprint in old:
+            if fingerprint:
+                self.add_fingerprint(fingerprint)
+
+    def memory_size(self):
+        return self.slots.itemsize * len(self.slots)
+
+
+class BloomFilter:
+    """A set of URLs in a Bloom filter sized for capacity URLs at the given false-positive rate.
+
+    Takes about 1.2 bytes per URL at a 1% error rate and 1.8 at 0.1%, and
+    never grows; past capacity the false-positive rate rises. A false
+    positive reports an unseen URL as seen, so the crawl skips that page.
+    """
+
+    def __init__(self, capacity=1_000_000, error_rate=0.001, strip_params=TRACKING_PARAMS):
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+        self.capacity = capacity
+        self.strip_params = strip_params
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, url):
+        return self.contains_fingerprint(url_fingerprint(url, self.strip_params))
+
+    def add(self, url):
+        """Add a URL and return whether it was new (or rather, not seen as far as the filter can tell)."""
+        return self.add_fingerprint(url_fingerprint(url, self.strip_params))
+
+    def _positions(self, fingerprint):
+        # Double hashing over the two halves of the fingerprint (Kirsch and Mitzenmacher)
+        first, second = fingerprint & 0xFFFFFFFF, (fingerprint >> 32) | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def contains_fingerprint(self, fingerprint):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(fingerprint))
+
+    def add_fingerprint(self, fingerprint):
+        bits = self.bits
+        new = False
+        for position in self._positions(fingerprint):
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                new = True
+        self.count += new
+        return new
+
+    def memory_size(self):
+        return len(self.bits)
+
+
+def seen_set_from_settings(settings):
+    """Return the seen-set the SEEN_SET setting asks for ("fingerprints" or "bloom")."""
+    strip_params = tuple(settings.getlist("URL_STRIP_PARAMS", TRACKING_PARAMS))
+    kind = settings.get("SEEN_SET", "fingerprints")
+    if kind == "bloom":
+        return BloomFilter(
+            settings.getint("SEEN_SET_CAPACITY", 1_000_000),
+            settings.getfloat("SEEN_SET_ERROR_RATE", 0.001),
+            strip_params,
+        )
+    if kind == "fingerprints":
+        return FingerprintSet(strip_params=strip_params)
+    raise ValueError(f"Unknown SEEN_SET: {kind!r} (expected 'fingerprints' or 'bloom')")
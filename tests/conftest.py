@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The benchmarks' page builders and reference implementations double as test fixtures
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
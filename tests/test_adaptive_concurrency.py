@@ -0,0 +1,179 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+from scrapy.core.downloader import Slot
+from scrapy.exceptions import NotConfigured
+from scrapy.http import Request, Response
+from scrapy.utils.test import get_crawler
+
+from mandevu.middlewares import AdaptiveConcurrencyMiddleware
+
+
+def make_middleware(**kwargs):
+    slot = Slot(16, 0.0, True)
+    crawler = get_crawler()
+    crawler.engine = SimpleNamespace(downloader=SimpleNamespace(slots={"example.com": slot}))
+    return AdaptiveConcurrencyMiddleware(crawler, **kwargs), slot
+
+
+def request(latency=0.1):
+    return Request("https://example.com/", meta={"download_slot": "example.com", "download_latency": latency})
+
+
+def respond(middleware, status=200, latency=0.1, headers=None):
+    middleware.response_downloaded(Response("https://example.com/", status=status, headers=headers), request(latency), None)
+
+
+def test_starts_low_and_grows_by_about_one_per_round_of_fast_responses():
+    middleware, slot = make_middleware(start=4, maximum=8)
+    middleware.request_reached_downloader(request(), None)
+    assert slot.concurrency == 4
+    for _ in range(5):
+        respond(middleware)
+    assert slot.concurrency == 5
+    for _ in range(100):
+        respond(middleware)
+    assert slot.concurrency == 8
+
+
+def test_slow_responses_halve_concurrency_once_per_round_trip():
+    middleware, slot = make_middleware(start=8, maximum=16, target_latency=1.0)
+    respond(middleware, latency=5.0)
+    assert slot.concurrency == 4
+    # The rest of the round was sent at the old concurrency
+    respond(middleware, latency=5.0)
+    respond(middleware, latency=5.0)
+    assert slot.concurrency == 4
+    middleware.process_exception(request(), TimeoutError(), None)
+    assert slot.concurrency == 4
+
+
+def test_429_halves_concurrency_and_pauses_the_host_for_retry_after():
+    from twisted.internet import reactor
+
+    middleware, slot = make_middleware(start=8, maximum=16)
+    slot.lastseen = time.time()
+    respond(middleware, status=429, headers={"Retry-After": "30"})
+    try:
+        assert slot.concurrency == 4
+        assert 29 < slot.delay <= 30.5
+        assert slot.randomize_delay is False
+        assert middleware.crawler.stats.get_value("adaptive_concurrency/refused/429") == 1
+
+        state = middleware.hosts["example.com"]
+        state["paused_until"] = 0
+        middleware.resume(state, slot)
+        assert (slot.delay, slot.randomize_delay) == (0.0, True)
+    finally:
+        for call in reactor.getDelayedCalls():
+            call.cancel()
+
+
+def test_retry_after_accepts_seconds_and_http_dates():
+    middleware, _ = make_middleware()
+    assert middleware.retry_after(Response("https://example.com/", headers={"Retry-After": "120"})) == 120
+    assert middleware.retry_after(Response("https://example.com/", headers={"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})) == 0
+    assert middleware.retry_after(Response("https://example.com/", headers={"Retry-After": "soon"})) is None
+    assert middleware.retry_after(Response("https://example.com/")) is None
+
+
+def test_growth_past_a_refused_concurrency_is_slow():
+    from twisted.internet import reactor
+
+    middleware, slot = make_middleware(start=6, maximum=16, probe_rounds=10)
+    slot.lastseen = time.time()
+    respond(middleware, status=503)
+    # The rest of the refused round changes nothing
+    respond(middleware, status=503)
+    try:
+        assert middleware.hosts["example.com"]["ceiling"] == 5
+        assert slot.concurrency == 3
+        middleware.hosts["example.com"]["paused_until"] = 0
+        for _ in range(20):
+            respond(middleware)
+        assert slot.concurrency == 5
+        for _ in range(40):
+            respond(middleware)
+        assert slot.concurrency == 5
+    finally:
+        for call in reactor.getDelayedCalls():
+            call.cancel()
+
+
+def test_503_without_retry_after_pauses_for_a_doubling_backoff():
+    from twisted.internet import reactor
+
+    middleware, slot = make_middleware(start=8, maximum=16)
+    slot.lastseen = time.time()
+    state, _ = middleware.host(request())
+    try:
+        respond(middleware, status=503)
+        assert slot.concurrency == 4
+        assert 0.5 < state["paused_until"] - time.time() <= 1.0
+        state["paused_until"] = 0
+        respond(middleware, status=503)
+        assert slot.concurrency == 2
+        assert 1.5 < state["paused_until"] - time.time() <= 2.0
+        assert middleware.crawler.stats.get_value("adaptive_concurrency/refused/503") == 2
+        # A response that gets through resets the backoff
+        state["paused_until"] = 0
+        respond(middleware)
+        assert state["refusals"] == 0
+    finally:
+        for call in reactor.getDelayedCalls():
+            call.cancel()
+
+
+def test_download_errors_back_off_like_slow_responses():
+    middleware, slot = make_middleware(start=8, maximum=16)
+    middleware.process_exception(request(latency=0.0), TimeoutError(), None)
+    assert slot.concurrency == 4
+    assert middleware.crawler.stats.get_value("adaptive_concurrency/download_errors") == 1
+
+
+def test_concurrency_recovers_after_a_slow_spell():
+    middleware, slot = make_middleware(start=8, maximum=16, target_latency=1.0)
+    respond(middleware, latency=5.0)
+    assert slot.concurrency == 4
+    # Each fast response adds 1/concurrency, so the square of the concurrency grows by
+    # about 2: some 24 responses from 4 back to 8
+    for _ in range(25):
+        respond(middleware)
+    assert slot.concurrency == 8
+    # A slow spell does not set a ceiling: growth goes on at the same pace
+    for _ in range(10):
+        respond(middleware)
+    assert slot.concurrency == 9
+
+
+def test_concurrency_stays_between_the_minimum_and_the_maximum():
+    middleware, slot = make_middleware(start=4, minimum=2, maximum=6)
+    for _ in range(5):
+        middleware.process_exception(request(latency=0.0), TimeoutError(), None)
+    assert slot.concurrency == 2
+    for _ in range(200):
+        respond(middleware, latency=0.0)
+    assert slot.concurrency == 6
+
+
+def test_a_recreated_slot_gets_the_concurrency_learnt_for_its_host():
+    middleware, slot = make_middleware(start=4, maximum=16)
+    for _ in range(9):
+        respond(middleware)
+    assert slot.concurrency == 5
+    # The downloader drops idle slots and creates them again at CONCURRENT_REQUESTS_PER_DOMAIN
+    fresh = Slot(16, 0.0, True)
+    middleware.crawler.engine.downloader.slots["example.com"] = fresh
+    middleware.request_reached_downloader(request(), None)
+    assert fresh.concurrency == 5
+
+
+def test_from_crawler_starts_within_the_per_domain_limit():
+    crawler = get_crawler(settings_dict={
+        "ADAPTIVE_CONCURRENCY_ENABLED": True, "ADAPTIVE_CONCURRENCY_START": 8, "CONCURRENT_REQUESTS_PER_DOMAIN": 3,
+    })
+    middleware = AdaptiveConcurrencyMiddleware.from_crawler(crawler)
+    assert (middleware.start, middleware.maximum) == (3, 3)
+    with pytest.raises(NotConfigured):
+        AdaptiveConcurrencyMiddleware.from_crawler(get_crawler(settings_dict={"ADAPTIVE_CONCURRENCY_ENABLED": False}))
@@ -0,0 +1,78 @@
+from mandevu.items import PageRecord
+from mandevu.utils.audit_store import AuditStore, issue_type
+
+SITE = {"record_type": "site", "site_id": "example.com"}
+
+
+def page(url, *issues):
+    return {"record_type": "page", "url": url, "site_id": "example.com", "issues_detected": list(issues)}
+
+
+FIRST = [
+    SITE,
+    page("https://example.com/", "Missing canonical tag.", "Broken internal link found: https://example.com/old"),
+    page("https://example.com/a", "Missing canonical tag."),
+    page("https://example.com/gone"),
+]
+SECOND = [
+    SITE,
+    PageRecord.from_dict(page("https://example.com/", "Broken internal link found: https://example.com/old")),
+    page("https://example.com/a", "Missing canonical tag.", "Page load time is too high: 3.20 seconds."),
+    page("https://example.com/new", "Missing canonical tag."),
+]
+
+
+def test_issue_type_blanks_out_urls_numbers_and_quotes():
+    assert issue_type("Broken internal link found: https://example.com/x") == "Broken internal link found: <url>"
+    assert issue_type("Page load time is too high: 3.20 seconds.") == "Page load time is too high: <n> seconds."
+    assert issue_type("Duplicate alt text: 'logo' used on 3 images.") == "Duplicate alt text: '<text>' used on <n> images."
+    assert issue_type("Found h3 without an H2 above it.") == "Found h3 without an H2 above it."
+
+
+def test_runs_issue_queries_and_trend(tmp_path):
+    store = AuditStore(str(tmp_path / "audits.sqlite"), batch_size=2)
+    first = store.ingest(FIRST, "first")
+    second = store.ingest(SECOND, "second")
+
+    assert [(run_id, site, pages, issues) for run_id, site, _, _, _, pages, issues in store.runs()] == [
+        (first, "example.com", 3, 3),
+        (second, "example.com", 3, 4),
+    ]
+    assert store.issue_counts(first) == [
+        ("Missing canonical tag.", 2, 2),
+        ("Broken internal link found: <url>", 1, 1),
+    ]
+    assert list(store.pages_with_issue(second, "Page load time is too high: 9 seconds.")) == [
+        ("https://example.com/a", "Page load time is too high: 3.20 seconds."),
+    ]
+    assert [row[2:] for row in store.trend("example.com", "Missing canonical tag.")] == [(3, 2), (3, 2)]
+    assert [row[2:] for row in store.trend()] == [(3, 2), (3, 3)]
+    assert store.page_history("https://example.com/a") == [(first, 1), (second, 2)]
+    assert store.page_record(second, "https://example.com/")["site_id"] == "example.com"
+    store.close()
+
+
+def test_diff_between_runs(tmp_path):
+    store = AuditStore(str(tmp_path / "audits.sqlite"))
+    first = store.ingest(FIRST)
+    second = store.ingest(SECOND)
+
+    assert list(store.diff(first, second)) == [
+        ("page_added", "https://example.com/new", None),
+        ("page_removed", "https://example.com/gone", None),
+        ("issue_added", "https://example.com/a", "Page load time is too high: 3.20 seconds."),
+        ("issue_resolved", "https://example.com/", "Missing canonical tag."),
+    ]
+    store.close()
+
+
+def test_page_stored_twice_in_a_run_keeps_the_last_record(tmp_path):
+    store = AuditStore(str(tmp_path / "audits.sqlite"))
+    run_id = store.start_run("example.com")
+    store.add_pages(run_id, [page("https://example.com/", "Missing canonical tag.")])
+    store.add_pages(run_id, [page("https://example.com/", "Missing meta description.")])
+    store.finish_run(run_id)
+
+    assert store.issue_counts(run_id) == [("Missing meta description.", 1, 1)]
+    assert store.runs()[0][5:] == (1, 1)
+    store.close()
@@ -0,0 +1,13 @@
+from mandevu.utils.crawl_state import CrawlState
+
+
+def test_saves_are_committed_at_once_for_other_workers(tmp_path):
+    path = str(tmp_path / "crawl_state.sqlite")
+    first, second = CrawlState(path), CrawlState(path, timeout=1.0)
+    first.save("https://example.com/", '"v1"', None, "hash", {"url": "https://example.com/"}, ["Missing canonical tag."], "site")
+    # No transaction is left open, so the other worker can both read and write
+    assert second.get("https://example.com/")["etag"] == '"v1"'
+    second.save("https://example.com/a", None, None, "hash-a", {"url": "https://example.com/a"}, [], "site")
+    assert first.validators("https://example.com/a") == (None, None)
+    first.close()
+    second.close()
@@ -0,0 +1,19 @@
+import pytest
+from bench_extraction import build_page, xpath_extract
+from parsel import Selector
+
+from mandevu.utils.extraction import extract_page
+
+BARE_PAGE = "<html><head></head><body><p>No tags <img src='a.png' alt=''> here</p><h2>  </h2></body></html>"
+
+
+@pytest.mark.parametrize("html", [
+    build_page(0, 0),
+    build_page(1, 1),
+    build_page(30, 12),
+    build_page(200, 40),
+    BARE_PAGE,
+], ids=["empty", "one-section", "small", "large", "bare"])
+def test_single_pass_matches_the_xpath_queries(html):
+    selector = Selector(text=html)
+    assert extract_page(selector.root) == xpath_extract(selector)
@@ -0,0 +1,124 @@
+import time
+
+import pytest
+
+from mandevu.utils.frontier import LocalFrontier, LocalRedis, RedisFrontier, SQLiteFrontier, SharedResults, page_priority
+from mandevu.utils.urls import FingerprintSet
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def shared_frontier(request, tmp_path):
+    if request.param == "sqlite":
+        frontier = SQLiteFrontier(str(tmp_path / "frontier.db"))
+    else:
+        frontier = RedisFrontier(LocalRedis(), "test")
+    yield frontier
+    frontier.close()
+
+
+def test_page_priority_prefers_shallow_pages_and_sitemap_priority():
+    assert page_priority(0) > page_priority(1) > page_priority(2)
+    assert page_priority(1, 1.0) > page_priority(1) > page_priority(1, 0.1)
+    # The sitemap priority makes up for one click at most
+    assert page_priority(1, 0.0) >= page_priority(2, 1.0)
+
+
+def test_local_frontier_claims_by_priority_then_in_links_then_order():
+    frontier = LocalFrontier(FingerprintSet())
+    assert frontier.add(["https://example.com/deep"], page_priority(3), depth=3) == ["https://example.com/deep"]
+    frontier.add(["https://example.com/a", "https://example.com/b", "https://example.com/c"], page_priority(2), depth=2)
+    # Two more links to c, one to b; the tracking variant of a is the same page
+    assert frontier.add(["https://example.com/c", "https://example.com/b", "https://example.com/c"], page_priority(2)) == []
+    assert frontier.add(["https://example.com/a?utm_source=x"], page_priority(2)) == []
+
+    assert frontier.claim("worker", 3) == [
+        ("https://example.com/c", 2), ("https://example.com/b", 2), ("https://example.com/a", 2),
+    ]
+    assert frontier.counts() == {"queued": 1, "claimed": 3, "done": 0}
+    # Links to pages already claimed change nothing
+    frontier.add(["https://example.com/c"], 100)
+    frontier.done(["https://example.com/c", "https://example.com/b", "https://example.com/a"])
+    assert not frontier.finished()
+    assert frontier.claim("worker", 10) == [("https://example.com/deep", 3)]
+    frontier.done(["https://example.com/deep"])
+    assert frontier.finished()
+    assert frontier.counts() == {"queued": 0, "claimed": 0, "done": 4}
+
+
+def test_local_frontier_drops_stale_heap_entries():
+    frontier = LocalFrontier(FingerprintSet())
+    frontier.add([f"https://example.com/{number}" for number in range(10)])
+    for _ in range(300):
+        frontier.add([f"https://example.com/{number}" for number in range(10)])
+    assert len(frontier.heap) <= 2 * 10 + 1024
+    assert [url for url, _ in frontier.claim("worker", 20)] == [f"https://example.com/{number}" for number in range(10)]
+
+
+def test_sqlite_frontier_counts_links_to_queued_pages_and_keeps_depth(tmp_path):
+    frontier = SQLiteFrontier(str(tmp_path / "frontier.db"))
+    frontier.add(["https://example.com/a", "https://example.com/b"], page_priority(2), depth=2)
+    frontier.add(["https://example.com/b"], page_priority(2), depth=2)
+    frontier.add(["https://example.com/c"], page_priority(1, 0.8), depth=1)
+    assert frontier.claim("worker", 3) == [
+        ("https://example.com/c", 1), ("https://example.com/b", 2), ("https://example.com/a", 2),
+    ]
+    frontier.close()
+
+
+def test_shared_frontier_adds_each_url_once(shared_frontier):
+    assert shared_frontier.add(["https://example.com/a", "https://example.com/b"]) == ["https://example.com/a", "https://example.com/b"]
+    assert shared_frontier.add(["https://example.com/b", "https://example.com/c"]) == ["https://example.com/c"]
+    shared_frontier.claim("worker", 3)
+    shared_frontier.done(["https://example.com/a"])
+    # Claimed and done pages stay seen
+    assert shared_frontier.add(["https://example.com/a", "https://example.com/b"]) == []
+    assert shared_frontier.counts() == {"queued": 0, "claimed": 2, "done": 1}
+
+
+def test_shared_frontier_claims_by_priority_and_in_links(shared_frontier):
+    shared_frontier.add(["https://example.com/deep"], page_priority(3), depth=3)
+    shared_frontier.add(["https://example.com/a", "https://example.com/b"], page_priority(2), depth=2)
+    shared_frontier.add(["https://example.com/c"], page_priority(1, 0.8), depth=1)
+    # Another link to b puts it ahead of a
+    shared_frontier.add(["https://example.com/b"], page_priority(2), depth=2)
+    assert shared_frontier.claim("first", 2) == [("https://example.com/c", 1), ("https://example.com/b", 2)]
+    # Links to claimed pages change nothing
+    shared_frontier.add(["https://example.com/c"], page_priority(1))
+    assert shared_frontier.claim("second", 5) == [("https://example.com/a", 2), ("https://example.com/deep", 3)]
+    assert shared_frontier.claim("second", 5) == []
+    assert shared_frontier.counts() == {"queued": 0, "claimed": 4, "done": 0}
+
+
+def test_shared_frontier_hands_a_page_to_one_worker_and_finishes(shared_frontier):
+    shared_frontier.add(["https://example.com/"], claim_for="first")
+    assert shared_frontier.add(["https://example.com/"], claim_for="second") == []
+    shared_frontier.add(["https://example.com/a"], depth=1)
+    assert shared_frontier.claim("second", 5) == [("https://example.com/a", 1)]
+    assert shared_frontier.claim("first", 5) == []
+    assert not shared_frontier.finished()
+    shared_frontier.done(["https://example.com/", "https://example.com/a"])
+    # Done twice counts once
+    shared_frontier.done(["https://example.com/a"])
+    assert shared_frontier.finished()
+    assert shared_frontier.counts() == {"queued": 0, "claimed": 0, "done": 2}
+
+
+def test_shared_frontier_requeues_expired_claims_with_their_priority(shared_frontier):
+    shared_frontier.add(["https://example.com/low"], page_priority(3), depth=3)
+    shared_frontier.add(["https://example.com/high"], page_priority(1), depth=1)
+    assert shared_frontier.claim("dead", 1) == [("https://example.com/high", 1)]
+    assert shared_frontier.requeue_expired(lease=60) == 0
+    time.sleep(0.02)
+    assert shared_frontier.requeue_expired(lease=0.01) == 1
+    # Claimed by the next worker ahead of the lower priority page
+    assert shared_frontier.claim("live", 1) == [("https://example.com/high", 1)]
+    shared_frontier.done(["https://example.com/high"])
+    assert shared_frontier.counts() == {"queued": 1, "claimed": 0, "done": 1}
+
+
+def test_shared_frontier_keeps_check_results(shared_frontier):
+    results = SharedResults(shared_frontier, "link_status")
+    assert results.get("https://example.com/a") is None
+    results.put("https://example.com/a", {"status": 404})
+    assert results.get("https://example.com/a") == {"status": 404}
+    assert SharedResults(shared_frontier, "image_info").get("https://example.com/a") is None
@@ -0,0 +1,47 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+from scrapy.http import HtmlResponse
+
+from bench_extraction import build_page
+from mandevu.utils.offload import evaluate_rules, extract_body, extract_response
+from mandevu.utils.seo_rules import SEORuleChecker
+from site_server import SiteOptions, render_page
+
+URL = "https://example.com/bench"
+SITE = {"record_type": "site", "site_id": "example.com", "robots_txt": "User-agent: *\nDisallow: /private/"}
+
+
+def page_record(page_data):
+    return {"url": URL, "internal_links": [], "image_data": page_data.pop("images"), **page_data}
+
+
+@pytest.fixture(scope="module")
+def pool():
+    with ProcessPoolExecutor(2, mp_context=multiprocessing.get_context("spawn")) as pool:
+        yield pool
+
+
+@pytest.mark.parametrize("window", [1 << 20, 2000])
+def test_extract_body_in_worker_matches_in_process(pool, window):
+    body = build_page(200, 40).encode("utf-8")
+    expected = extract_response(HtmlResponse(URL, body=body, encoding="utf-8"), window)
+
+    page_data, truncated, seconds = pool.submit(extract_body, URL, body, "utf-8", window).result()
+
+    assert (page_data, truncated) == expected
+    assert truncated == (window < len(body))
+    assert seconds > 0
+
+
+def test_evaluate_rules_in_worker_matches_in_process(pool):
+    for number in range(5):
+        body = render_page(SiteOptions(pages=50), number)
+        seo_data = page_record(extract_response(HtmlResponse(URL, body=body, encoding="utf-8"), 1 << 20)[0])
+        expected = SEORuleChecker(dict(seo_data), SITE).analyze()
+
+        issues, seconds = pool.submit(evaluate_rules, seo_data, SITE).result()
+
+        assert issues == expected
+        assert seconds
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+from scrapy.exceptions import StopDownload
+from scrapy.http import Headers, Request, Response
+from scrapy.utils.test import get_crawler
+
+from mandevu.middlewares import PageDownloadLimitMiddleware
+from mandevu.spiders.my_spider import SEOAuditSpider
+
+SITE = "https://example.com"
+
+
+@pytest.fixture
+def crawl():
+    crawler = get_crawler(SEOAuditSpider, {
+        "PAGE_CONTENT_TYPES": ["text/html", "application/xhtml+xml"],
+        "PAGE_MAX_DOWNLOAD_SIZE": 1000,
+    })
+    spider = SEOAuditSpider.from_crawler(crawler, start_url=f"{SITE}/")
+    return PageDownloadLimitMiddleware.from_crawler(crawler), spider
+
+
+def page_request(spider, path="/page"):
+    return Request(f"{SITE}{path}", callback=spider.parse)
+
+
+def headers(content_type, **fields):
+    return Headers({"Content-Type": content_type, **fields})
+
+
+def parse(spider, response):
+    async def collect():
+        return [item async for item in spider.parse(response)]
+    return asyncio.run(collect())
+
+
+def test_an_oversized_page_is_cut_off_after_the_limit(crawl):
+    middleware, spider = crawl
+    request = page_request(spider)
+    middleware.process_request(request, spider)
+    # Without a Content-Length (a chunked body) the limit is kept on the bytes received
+    middleware.headers_received(headers("text/html; charset=utf-8"), -1, request, spider)
+    middleware.bytes_received(b"x" * 600, request, spider)
+    middleware.bytes_received(b"x" * 400, request, spider)
+    with pytest.raises(StopDownload) as stopped:
+        middleware.bytes_received(b"x", request, spider)
+    assert not stopped.value.fail
+    assert spider.crawler.stats.get_value("page_download/stopped_too_large") == 1
+    # Anything still in flight after the stop is not counted again
+    middleware.bytes_received(b"x" * 5000, request, spider)
+    assert spider.crawler.stats.get_value("page_download/stopped_too_large") == 1
+
+
+def test_a_redirected_page_counts_its_body_afresh(crawl):
+    middleware, spider = crawl
+    request = page_request(spider)
+    middleware.headers_received(headers("text/html"), 0, request, spider)
+    middleware.bytes_received(b"x" * 900, request, spider)
+    redirected = request.replace(url=f"{SITE}/moved")
+    middleware.process_request(redirected, spider)
+    middleware.bytes_received(b"x" * 900, redirected, spider)
+    middleware.headers_received(headers("text/html"), 0, redirected, spider)
+    middleware.bytes_received(b"x" * 900, redirected, spider)
+    assert spider.crawler.stats.get_value("page_download/stopped_too_large") is None
+
+
+def test_a_page_request_for_a_file_stops_at_the_headers(crawl):
+    middleware, spider = crawl
+    request = page_request(spider, "/report.pdf")
+    with pytest.raises(StopDownload) as stopped:
+        middleware.headers_received(headers("application/pdf", **{"Content-Length": "123456"}), 123456, request, spider)
+    assert not stopped.value.fail
+    assert spider.crawler.stats.get_value("page_download/stopped_not_html") == 1
+    # The body of a stopped file is never counted
+    middleware.bytes_received(b"x" * 5000, request, spider)
+    assert spider.crawler.stats.get_value("page_download/stopped_too_large") is None
+
+
+def test_only_page_requests_are_limited(crawl):
+    middleware, spider = crawl
+    for request in (
+        Request(f"{SITE}/report.pdf", method="HEAD", callback=spider.parse),
+        Request(f"{SITE}/sitemap.xml", callback=spider.parse_sitemap),
+    ):
+        middleware.headers_received(headers("application/xml"), 0, request, spider)
+        middleware.bytes_received(b"x" * 5000, request, spider)
+    assert spider.crawler.stats.get_value("page_download/stopped_not_html") is None
+    assert spider.crawler.stats.get_value("page_download/stopped_too_large") is None
+
+
+def test_a_stopped_file_is_sized_from_its_content_length(crawl):
+    _, spider = crawl
+    url = f"{SITE}/report.pdf"
+    response = Response(url, request=page_request(spider, "/report.pdf"), flags=["download_stopped"],
+                        headers=headers("application/pdf", **{"Content-Length": "123456"}), body=b"%PDF")
+    assert parse(spider, response) == []
+    assert spider.link_statuses.get(spider.link_statuses.key(url)) == {
+        "status": 200, "content_type": "application/pdf", "size": 123456,
+    }
+    assert spider.crawler.stats.get_value("pages_skipped/not_html") == 1
+
+
+def test_a_stopped_file_without_content_length_has_no_size(crawl):
+    _, spider = crawl
+    url = f"{SITE}/archive.zip"
+    response = Response(url, request=page_request(spider, "/archive.zip"), flags=["download_stopped"],
+                        headers=headers("application/zip"), body=b"PK")
+    parse(spider, response)
+    assert spider.link_statuses.get(spider.link_statuses.key(url))["size"] is None
@@ -0,0 +1,98 @@
+import sys
+import threading
+
+from mandevu.pipelines import AIRecommendationPipeline
+from mandevu.utils.together_ai import BACKENDS, RecommendationService, StubBackend
+
+
+class CountingStub(StubBackend):
+    def __init__(self):
+        self.calls = []
+
+    def recommend(self, issue_sets):
+        self.calls.append(issue_sets)
+        return super().recommend(issue_sets)
+
+
+def test_stub_backend_answers_each_issue_set_in_order():
+    backend = BACKENDS["stub"]()
+    assert backend.recommend([["Missing canonical tag."], [], ["A", "B"]]) == [
+        {"ai_recommendations": ["Resolve: Missing canonical tag."]},
+        {"ai_recommendations": []},
+        {"ai_recommendations": ["Resolve: A", "Resolve: B"]},
+    ]
+
+
+def test_service_batches_misses_and_shares_results_between_similar_pages(tmp_path):
+    backend = CountingStub()
+    service = RecommendationService(backend, cache_dir=str(tmp_path), batch_size=2)
+    issue_lists = [
+        ["Broken internal link found: https://example.com/a", "Missing canonical tag."],
+        # Same issues once URLs are masked, duplicates dropped and the order ignored
+        ["Missing canonical tag.", "Broken internal link found: https://example.com/b", "Missing canonical tag."],
+        ["Missing meta description."],
+        ["Missing Open Graph image."],
+    ]
+    results = service.recommend_many(issue_lists)
+    assert results[0] == results[1] == {
+        "ai_recommendations": ["Resolve: Broken internal link found: <url>", "Resolve: Missing canonical tag."],
+    }
+    assert results[2] == {"ai_recommendations": ["Resolve: Missing meta description."]}
+    assert [len(issue_sets) for issue_sets in backend.calls] == [2, 1]
+
+    # A new service over the same cache directory answers from disk
+    restarted = RecommendationService(CountingStub(), cache_dir=str(tmp_path))
+    assert restarted.recommend_many(issue_lists) == results
+    assert restarted.backend.calls == []
+
+
+def test_memory_cache_keeps_the_most_recent_results():
+    service = RecommendationService(CountingStub(), memory_size=2)
+    for issue in ("A", "B", "A", "C"):
+        service.recommend([issue])
+    assert len(service.backend.calls) == 3
+    assert list(service.memory) == [service.cache_key(["A"]), service.cache_key(["C"])]
+
+
+def test_reactor_lookups_only_look_in_memory(tmp_path):
+    issues = ["Missing canonical tag."]
+    RecommendationService(StubBackend(), cache_dir=str(tmp_path)).recommend(issues)
+
+    service = RecommendationService(CountingStub(), cache_dir=str(tmp_path))
+    key = service.cache_key(service.canonicalize(issues))
+    assert service.cached(key, disk=False) is None
+    # The pipeline sends the page to the worker-thread lookup instead of reading the file
+    pipeline = AIRecommendationPipeline(service, batch_size=8, batch_delay=60)
+    item = {"url": "https://example.com/", "issues_detected": issues}
+    assert pipeline.process_item(item, None) is not item
+    pipeline.flush_call.cancel()
+    # which finds it on disk without asking the backend
+    assert service.recommend_many([issues]) == [{"ai_recommendations": ["Resolve: Missing canonical tag."]}]
+    assert service.backend.calls == []
+    assert service.cached(key, disk=False) is not None
+    assert pipeline.process_item({"issues_detected": issues}, None)["ai_recommendations"] == service.cached(key)
+
+
+def test_memory_cache_can_be_read_while_a_worker_thread_fills_it():
+    service = RecommendationService(StubBackend(), memory_size=4)
+    keys = [service.cache_key([str(number)]) for number in range(16)]
+    done = threading.Event()
+
+    def fill():
+        number = 0
+        while not done.is_set():
+            service.remember(keys[number % len(keys)], {"ai_recommendations": []})
+            number += 1
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    worker = threading.Thread(target=fill)
+    worker.start()
+    try:
+        for number in range(50000):
+            service.cached(keys[number % len(keys)], disk=False)
+    finally:
+        done.set()
+        worker.join()
+        sys.setswitchinterval(interval)
+    assert len(service.memory) <= 4
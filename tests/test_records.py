@@ -0,0 +1,108 @@
+import io
+import json
+import pickle
+
+from itemadapter import ItemAdapter
+from scrapy.exporters import JsonLinesItemExporter
+
+from mandevu.exporters import RecordFeedExporter
+from mandevu.items import PageRecord
+from mandevu.utils.record_feed import iter_records
+
+PAGE = {
+    "record_type": "page",
+    "url": "https://example.com/",
+    "meta_title": "Home",
+    "h1_tags": ["Welcome"],
+    "internal_links_count": 3,
+    "internal_links": [
+        {"url": "https://example.com/a", "status": 200},
+        {"url": "https://example.com/report.pdf", "status": 200, "content_type": "application/pdf", "size": None},
+        {"url": "https://example.com/b", "status": "error", "error": "Connection refused"},
+    ],
+    "image_data": [{"src": "https://example.com/logo.png", "alt": "Logo", "size": 1200, "status": "200", "type": "png"}],
+    "open_graph_data": {"og:title": "Home", "og:description": "", "og:image": "", "og:url": ""},
+    "timing": {"queue_wait": 0.0, "dns": None, "ttfb": 0.1, "download": 0.2, "total": 0.3},
+    "truncated": False,
+    "site_id": "example.com",
+    "issues_detected": ["Missing canonical tag."],
+    "sitemap_lastmod": "2024-01-01",
+}
+SITE = {"record_type": "site", "site_id": "example.com", "robots_txt": "Missing"}
+
+
+def test_record_reads_like_the_page_dict():
+    record = PageRecord.from_dict(PAGE)
+
+    assert dict(record) == PAGE
+    assert list(record) == list(PAGE)
+    assert "canonical" not in record and record.get("canonical") is None
+    assert len(record) == len(PAGE)
+
+
+def test_record_assignment_and_pickling():
+    record = PageRecord.from_dict(PAGE)
+    record["internal_links"] = []
+    del record["sitemap_lastmod"]
+
+    copy = pickle.loads(pickle.dumps(record))
+
+    assert copy["internal_links"] == []
+    assert "sitemap_lastmod" not in copy
+    assert dict(copy) == dict(record)
+
+
+def test_item_adapter_sees_the_page_fields():
+    record = PageRecord.from_dict(PAGE)
+    adapter = ItemAdapter(record)
+    adapter["ai_recommendations"] = {"ai_recommendations": ["Add a canonical tag."]}
+
+    assert adapter["issues_detected"] == PAGE["issues_detected"]
+    assert record["ai_recommendations"] == {"ai_recommendations": ["Add a canonical tag."]}
+    assert adapter.asdict() == {**PAGE, "ai_recommendations": {"ai_recommendations": ["Add a canonical tag."]}}
+
+
+def test_json_lines_export_is_unchanged():
+    lines = []
+    for item in (PAGE, PageRecord.from_dict(PAGE)):
+        file = io.BytesIO()
+        exporter = JsonLinesItemExporter(file)
+        exporter.export_item(item)
+        lines.append(file.getvalue())
+
+    assert lines[0] == lines[1]
+
+
+def test_records_feed_round_trip():
+    pages = [{**PAGE, "url": f"https://example.com/{number}"} for number in range(5)]
+    bare = {"record_type": "page", "url": "https://example.com/bare"}
+    file = io.BytesIO()
+    exporter = RecordFeedExporter(file, chunk_size=2)
+    exporter.start_exporting()
+    exporter.export_item(SITE)
+    for page in pages:
+        exporter.export_item(PageRecord.from_dict(page))
+    # A page dict is converted on the way in
+    exporter.export_item(bare)
+    exporter.finish_exporting()
+
+    file.seek(0)
+    items = list(iter_records(file))
+
+    assert items[0] == SITE
+    assert all(isinstance(item, PageRecord) for item in items[1:])
+    assert [dict(item) for item in items[1:]] == pages + [bare]
+    assert json.dumps(dict(items[1])) == json.dumps(PAGE | {"url": "https://example.com/0"})
+
+
+def test_records_feed_stops_at_a_cut_off_chunk():
+    file = io.BytesIO()
+    exporter = RecordFeedExporter(file)
+    exporter.start_exporting()
+    exporter.export_item(SITE)
+    exporter.export_item(PageRecord.from_dict(PAGE))
+    exporter.finish_exporting()
+
+    items = list(iter_records(io.BytesIO(file.getvalue()[:-10])))
+
+    assert items == [SITE]
@@ -0,0 +1,170 @@
+import logging
+from types import SimpleNamespace
+
+import pytest
+from scrapy.utils.test import get_crawler
+from twisted.internet import defer
+
+import mandevu.pipelines
+from mandevu.pipelines import ReportPipeline
+from mandevu.utils.generate_report import SITE_SUMMARY_FILE, SiteSummary, report_file_name, write_site_summary
+
+SITE = {"record_type": "site", "site_id": "example.com", "ssl_cert": "Valid", "robots_txt": "User-agent: *"}
+
+
+def page(number, *issues, load_time=0.1):
+    return {
+        "record_type": "page",
+        "url": f"https://example.com/{number}",
+        "site_id": "example.com",
+        "load_time": load_time,
+        "issues_detected": list(issues),
+    }
+
+
+def test_summary_counts_issue_types_and_keeps_the_top_pages():
+    summary = SiteSummary()
+    summary.TOP = 3
+    records = [SITE] + [
+        page(number, *[f"Broken internal link found: https://example.com/missing/{n}" for n in range(number)],
+             load_time=number / 10)
+        for number in range(10)
+    ]
+    assert list(summary.track(records)) == records
+
+    context = summary.context()
+    assert context["site"]["site_id"] == "example.com"
+    assert context["pages"] == 10
+    assert context["issue_types"] == [("Broken internal link found: <url>", 9)]
+    assert [entry["issues"] for entry in context["most_issues"]] == [9, 8, 7]
+    assert context["slowest"][0] == {
+        "url": "https://example.com/9", "load_time": 0.9, "report": report_file_name("https://example.com/9"),
+    }
+    assert context["analysis"] is None
+
+
+def test_summary_cuts_the_site_analysis_down(tmp_path):
+    summary = SiteSummary()
+    summary.TOP = 2
+    for record in summary.track([SITE, page(1, "Missing canonical tag.")]):
+        pass
+    urls = [f"https://example.com/{number}" for number in range(50)]
+    analysis = {
+        "pages": 50,
+        "links": 400,
+        "orphans": urls[:7],
+        "unreachable": [],
+        "redirect_chains": [],
+        "duplicates": {"title": [{"value": "Home", "urls": urls[:30]}] * 4},
+        "near_duplicates": {"description": [urls[:3]]},
+        "page_metrics": {
+            url: {"click_depth": 1, "inlinks": 3, "internal_authority": number / 10}
+            for number, url in enumerate(urls)
+        },
+        "sitemap": {"urls": 60, "not_crawled": urls[40:], "not_in_sitemap": urls[:1]},
+    }
+    context = summary.context(analysis)["analysis"]
+    assert context["orphans"] == {"count": 7, "items": urls[:2]}
+    assert context["duplicates"]["title"]["count"] == 4
+    assert len(context["duplicates"]["title"]["items"]) == 2
+    assert context["duplicates"]["title"]["items"][0] == {"value": "Home", "count": 30, "urls": urls[:5]}
+    assert [entry["url"] for entry in context["top_authority"]] == [urls[49], urls[48]]
+    assert context["sitemap"]["not_crawled"] == {"count": 10, "items": urls[40:42]}
+
+    path = write_site_summary(summary.context(analysis), str(tmp_path))
+    assert path.endswith(SITE_SUMMARY_FILE)
+    html = open(path, encoding="utf-8").read()
+    assert "Orphan Pages (7)" in html
+    assert "and 5 more" in html
+    assert "Sitemap Pages Not Crawled (10)" in html
+    assert "Pages Missing from the Sitemap (1)" in html
+    assert "Missing canonical tag." in html
+
+
+class FakeThreads:
+    """Stands in for the report thread pool: jobs run only when the test finishes them."""
+
+    def __init__(self):
+        self.jobs = []
+        self.most_in_flight = 0
+
+    def deferToThreadPool(self, reactor, pool, function, *args):
+        d = defer.Deferred()
+        self.jobs.append((function, args, d))
+        self.most_in_flight = max(self.most_in_flight, len(self.jobs))
+        return d
+
+    def finish(self):
+        function, args, d = self.jobs.pop(0)
+        try:
+            result = function(*args)
+        except Exception:
+            d.errback()
+        else:
+            d.callback(result)
+
+
+@pytest.fixture
+def report_pipeline(tmp_path, monkeypatch):
+    fake = FakeThreads()
+    rendered = []
+
+    def render_page(entry, results_dir, html_only):
+        if entry["url"].endswith("/broken"):
+            raise ValueError("template error")
+        rendered.append(entry)
+        return {"timings": {"html": 0.01}, "pdf_skipped": False}
+
+    monkeypatch.setattr(mandevu.pipelines, "threads", fake)
+    monkeypatch.setattr(mandevu.pipelines, "render_page", render_page)
+    pipeline = ReportPipeline(str(tmp_path), html_only=True, max_pending=2, stats=get_crawler().stats)
+    spider = SimpleNamespace(logger=logging.getLogger("test"), analyze_site=lambda: None)
+    pipeline.open_spider(spider)
+    yield pipeline, spider, fake, rendered
+    if not pipeline.pool.joined:
+        pipeline.pool.stop()
+
+
+def test_report_pipeline_holds_items_back_while_max_pending_reports_render(report_pipeline):
+    pipeline, spider, fake, rendered = report_pipeline
+    assert pipeline.process_item(SITE, spider) is SITE
+    results = [pipeline.process_item(page(number), spider) for number in range(5)]
+    assert results[:2] == [page(0), page(1)]
+    held = results[2:]
+    assert all(isinstance(d, defer.Deferred) and not d.called for d in held)
+    assert pipeline.stats.get_value("report/held_back") == 3
+
+    # Each finished report lets the oldest held item through
+    fake.finish()
+    assert held[0].called and not held[1].called
+    assert held[0].result == page(2)
+    while fake.jobs:
+        fake.finish()
+    assert all(d.called for d in held)
+    assert fake.most_in_flight == 2
+    assert [entry["url"] for entry in rendered] == [f"https://example.com/{number}" for number in range(5)]
+    assert rendered[0]["ssl_cert"] == "Valid" and rendered[0]["site_report"] == SITE_SUMMARY_FILE
+    assert pipeline.stats.get_value("report/pages") == 5
+
+
+def test_report_pipeline_writes_the_summary_once_the_reports_are_done(report_pipeline, tmp_path):
+    pipeline, spider, fake, _ = report_pipeline
+    pipeline.process_item(SITE, spider)
+    pipeline.process_item(page(1, "Missing canonical tag."), spider)
+    pipeline.process_item({**page(2), "url": "https://example.com/broken"}, spider)
+
+    closed = []
+    pipeline.close_spider(spider).addCallback(closed.append)
+    fake.finish()
+    fake.finish()
+    # The summary is written after the last report, in the report threads
+    assert [job[0] for job in fake.jobs] == [write_site_summary]
+    assert not closed
+    fake.finish()
+    assert closed and pipeline.pool.joined
+
+    html = open(tmp_path / SITE_SUMMARY_FILE, encoding="utf-8").read()
+    assert "Missing canonical tag." in html
+    assert pipeline.stats.get_value("report/pages") == 1
+    assert pipeline.stats.get_value("report/errors") == 1
+    assert pipeline.stats.get_value("stages/report/drain/calls") == 1
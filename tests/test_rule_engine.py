@@ -0,0 +1,28 @@
+import json
+import random
+
+from bench_rules import SITE, build_record
+
+from mandevu.utils.rule_engine import PageBatch, RuleEngine, main
+from mandevu.utils.seo_rules import SEORuleChecker
+
+
+def test_batched_rules_match_the_per_page_checker():
+    rng = random.Random(1)
+    records = [build_record(number, rng) for number in range(300)]
+    issues = RuleEngine().evaluate(PageBatch(records, {SITE["site_id"]: SITE}))
+    assert issues.format() == [SEORuleChecker(record, SITE).analyze() for record in records]
+
+
+def test_main_streams_the_feed_into_the_batch(tmp_path, monkeypatch, capsys):
+    rng = random.Random(2)
+    records = [build_record(number, rng) for number in range(50)]
+    path = tmp_path / "crawl.jsonl"
+    path.write_text("".join(json.dumps(entry) + "\n" for entry in [SITE, *records]), encoding="utf-8")
+    monkeypatch.setenv("JSON_FILE_PATH", str(path))
+
+    main(["--threshold", "max_load_time=1"])
+    output = capsys.readouterr().out
+    issues = RuleEngine({"max_load_time": 1}).evaluate(PageBatch(records, {SITE["site_id"]: SITE}))
+    assert output.startswith(f"50 pages, {len(issues)} issues\n")
+    assert f"  {issues.counts()['load_time_high']:6d}  load_time_high" in output
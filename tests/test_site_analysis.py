@@ -0,0 +1,161 @@
+import pytest
+
+from mandevu.utils.generate_report import render_page
+from mandevu.utils.site_analysis import DuplicateIndex, LinkGraph, SiteAnalyzer, page_views, pagerank
+from mandevu.utils.sitemap import SitemapIndex
+
+
+def page(path, *links, redirect_chain=(), **fields):
+    return {
+        "url": f"https://example.com/{path}",
+        "internal_links": [f"https://example.com/{link}" for link in links],
+        "redirect_chain": [f"https://example.com/{hop}" for hop in redirect_chain],
+        **fields,
+    }
+
+
+def url(path):
+    return f"https://example.com/{path}"
+
+
+SENTENCE = "the quick brown fox jumps over the lazy dog near the old river bank this morning"
+
+
+@pytest.fixture(scope="module")
+def analysis():
+    """A small site: / links to a and b, b links to c and to old-d, which redirects to d; o links to / but nothing links to o."""
+    analyzer = SiteAnalyzer(url(""))
+    for record in (
+        page("", "a", "b", "a#reviews", meta_title="Home | Site", h1_tags=[SENTENCE]),
+        page("a", "b", "", meta_title="  home |  SITE ", meta_description="About us", h1_tags=[SENTENCE.replace("dog", "cat")]),
+        page("b", "c", "old-d", meta_title="B", meta_description="Shared description", h1_tags=["Something else entirely, in more than three words"]),
+        page("c", meta_title="C", meta_description="Shared description"),
+        page("d", "d", redirect_chain=["old-d"], meta_title="D"),
+        page("o", "", meta_title="O"),
+    ):
+        analyzer.add(record)
+    return analyzer.analyze()
+
+
+def test_orphans_and_unreachable_pages(analysis):
+    assert analysis["pages"] == 6
+    assert analysis["start_url"] == url("")
+    assert analysis["orphans"] == [url("o")]
+    assert analysis["unreachable"] == [url("o")]
+
+
+def test_click_depths_and_inlinks_follow_redirects(analysis):
+    metrics = analysis["page_metrics"]
+    assert {path: metrics[url(path)]["click_depth"] for path in ("", "a", "b", "c", "d", "o")} == {
+        "": 0, "a": 1, "b": 1, "c": 2, "d": 2, "o": None,
+    }
+    # A fragment is the same page, a self link does not count and old-d counts for d
+    assert {path: metrics[url(path)]["inlinks"] for path in ("", "a", "b", "c", "d", "o")} == {
+        "": 2, "a": 1, "b": 2, "c": 1, "d": 1, "o": 0,
+    }
+    assert analysis["redirect_chains"] == [
+        {"url": url("old-d"), "final_url": url("d"), "hops": 1, "chain": [url("old-d")]},
+    ]
+
+
+def test_internal_authority_ranks_linked_pages_above_orphans(analysis):
+    authority = {path: analysis["page_metrics"][url(path)]["internal_authority"] for path in ("", "a", "b", "c", "d", "o")}
+    # / and b are each linked from two pages (authority is rounded to three places)
+    assert authority[""] == pytest.approx(authority["b"], abs=1e-2)
+    assert authority[""] > authority["a"] > authority["c"] == pytest.approx(authority["d"], abs=1e-2)
+    assert min(authority, key=authority.get) == "o"
+
+
+def test_pagerank_by_hand():
+    # A three-page cycle shares the rank evenly
+    assert list(pagerank([0, 1, 2, 3], [1, 2, 0])) == pytest.approx([1 / 3] * 3)
+    # 0 links to 1, which has no links: its rank is spread over both pages
+    assert list(pagerank([0, 1, 1], [1])) == pytest.approx([20 / 57, 37 / 57], abs=1e-5)
+    assert len(pagerank([0], [])) == 0
+
+
+def test_exact_duplicates_compare_normalized_text(analysis):
+    assert analysis["duplicates"]["meta_title"] == [{"value": "home | site", "urls": [url(""), url("a")]}]
+    assert analysis["duplicates"]["meta_description"] == [{"value": "shared description", "urls": [url("b"), url("c")]}]
+    assert analysis["duplicates"]["h1"] == []
+
+
+def test_near_duplicates_find_texts_one_word_apart(analysis):
+    assert analysis["near_duplicates"]["h1"] == [[url(""), url("a")]]
+    assert analysis["near_duplicates"]["meta_title"] == []
+
+
+def test_near_duplicates_leave_out_exact_duplicates_and_short_texts():
+    index = DuplicateIndex()
+    for number, text in enumerate([SENTENCE, SENTENCE, SENTENCE + " again", "Two words", "Two words!"]):
+        index.add(number, text)
+    assert index.exact() == [{"value": SENTENCE, "pages": [0, 1]}]
+    assert index.near() == [[0, 2]]
+
+
+def test_link_graph_interns_urls_without_fragments():
+    graph = LinkGraph()
+    home = graph.add_page(url(""), [url("a#top"), url("a"), url("")])
+    assert len(graph) == 2
+    offsets, targets = graph.to_csr()
+    assert list(targets[offsets[home]:offsets[home + 1]]) == [graph.ids[url("a")]] * 2
+
+
+def test_sitemap_coverage_compares_the_sitemap_with_the_crawl():
+    sitemap = SitemapIndex()
+    sitemap.sitemap_count = 1
+    for path in ("", "a", "old-b", "missing", "a#top", "c?utm_source=feed"):
+        sitemap.add(f"https://example.com/{path}")
+    analyzer = SiteAnalyzer("https://example.com/", sitemap)
+    for record in (page("", "a", "old-b", "d"), page("a"), page("b", redirect_chain=["old-b"]), page("c"), page("d")):
+        analyzer.add(record)
+
+    coverage = analyzer.analyze()["sitemap"]
+    assert coverage["urls"] == 5
+    # Fragments and tracking parameters do not make a new sitemap URL; a redirect counts as crawled
+    assert coverage["not_crawled"] == ["https://example.com/missing"]
+    assert sorted(coverage["not_in_sitemap"]) == ["https://example.com/b", "https://example.com/d"]
+
+
+def test_sitemap_index_reads_its_urls_back_from_disk():
+    sitemap = SitemapIndex()
+    assert list(sitemap) == []
+    sitemap.add(url("a"))
+    sitemap.add(url("b"))
+    assert list(sitemap) == [url("a"), url("b")]
+    # Reading the URLs back does not stop more from being added
+    sitemap.add(url("a#top"))
+    sitemap.add(url("c"))
+    assert list(sitemap) == [url("a"), url("b"), url("c")]
+    assert url("b") in sitemap and len(sitemap) == 3
+    sitemap.close()
+    assert url("b") in sitemap
+
+
+def test_no_sitemap_coverage_without_a_sitemap():
+    analyzer = SiteAnalyzer("https://example.com/", SitemapIndex())
+    analyzer.add(page(""))
+    assert analyzer.analyze()["sitemap"] is None
+
+
+def test_page_views_share_one_cut_down_copy_of_each_duplicate_group(tmp_path):
+    urls = [f"https://example.com/{number}" for number in range(50)]
+    analysis = {
+        "pages": 50,
+        "page_metrics": {url: {"click_depth": 1, "inlinks": 1, "internal_authority": 1.0} for url in urls},
+        "duplicates": {"meta_title": [{"value": "Home", "urls": urls}]},
+        "near_duplicates": {"h1": [urls[:3]]},
+    }
+    views = page_views(analysis, group_limit=4)
+    group = views[urls[0]]["duplicates"]["meta_title"]
+    assert group == {"value": "Home", "count": 50, "urls": urls[:4]}
+    assert views[urls[49]]["duplicates"]["meta_title"] is group
+    assert views[urls[2]]["near_duplicates"]["h1"] == {"count": 3, "urls": urls[:3]}
+    assert "h1" not in views[urls[3]]["near_duplicates"]
+
+    entry = {"url": urls[0], "security_headers": {}, "site_analysis": views[urls[0]]}
+    html_path = render_page(entry, str(tmp_path), html_only=True)["html"]
+    html = open(html_path, encoding="utf-8").read()
+    assert "used on 50 pages" in html
+    assert "and 46 more" in html
+    assert urls[4] + '"' not in html
@@ -0,0 +1,251 @@
+import asyncio
+import gzip
+
+import pytest
+from scrapy.http import HtmlResponse, Request, Response
+from scrapy.spidermiddlewares.httperror import HttpError
+from twisted.internet.error import DNSLookupError
+from twisted.python.failure import Failure
+from scrapy.utils.test import get_crawler
+
+from mandevu.items import PageRecord
+from mandevu.middlewares import FrontierMiddleware
+from mandevu.spiders.my_spider import SEOAuditSpider
+
+SITE = "https://example.com"
+
+
+def make_spider(**settings):
+    crawler = get_crawler(SEOAuditSpider, {
+        "PAGE_CONTENT_TYPES": ["text/html", "application/xhtml+xml"],
+        "PAGE_PARSE_WINDOW": 1 << 20,
+        **settings,
+    })
+    return SEOAuditSpider.from_crawler(crawler, start_url=f"{SITE}/")
+
+
+def finish_site_checks(spider):
+    """Fill in every site-wide check and return what the spider yields once they are done."""
+    spider.site_record.update({
+        "robots_txt": "User-agent: *\nSitemap: https://example.com/sitemap.xml",
+        "sitemap": "Missing",
+        "ssl_cert": {"is_valid": True},
+    })
+    return run(spider.record_security_headers({"Content-Security-Policy": "default-src 'self'"}))
+
+
+def run(output):
+    """Return everything a callback yields, for plain and async generators alike."""
+    if hasattr(output, "__anext__"):
+        async def collect():
+            return [item async for item in output]
+        return asyncio.run(collect())
+    return list(output or [])
+
+
+def page_response(path, links=(), images=(), meta=None):
+    body = "<html><head><title>Page</title></head><body>{}{}</body></html>".format(
+        "".join(f"<a href='{link}'>link</a>" for link in links),
+        "".join(f"<img src='{src}' alt='Picture'>" for src in images),
+    )
+    url = f"{SITE}{path}"
+    return HtmlResponse(url, body=body.encode(), encoding="utf-8", request=Request(url, meta=meta or {}),
+                        headers={"Content-Type": "text/html; charset=utf-8"})
+
+
+def answer(request, status=200, headers=None, body=b""):
+    """Return a response to a request the spider yielded and the callback's output for it."""
+    response = Response(request.url, status=status, headers=headers, body=body, request=request)
+    return run(request.callback(response))
+
+
+def fail(request, error):
+    """Return the errback's output for a request that failed before a response came back."""
+    failure = Failure(error)
+    failure.request = request
+    return run(request.errback(failure))
+
+
+def checks(output, method="HEAD"):
+    return [item for item in output if isinstance(item, Request) and item.method == method]
+
+
+def pages(output):
+    return [item for item in output if isinstance(item, PageRecord)]
+
+
+@pytest.fixture
+def spider():
+    spider = make_spider()
+    finish_site_checks(spider)
+    return spider
+
+
+@pytest.mark.parametrize("headers", [{"Content-Length": "abc"}, {}], ids=["malformed", "missing"])
+def test_image_without_a_usable_content_length_is_sized_by_a_ranged_get(spider, headers):
+    (head,) = checks(run(spider.parse(page_response("/", images=["/logo.png"]))))
+
+    (ranged,) = checks(answer(head, headers={"Content-Type": "image/png", **headers}), method="GET")
+    assert ranged.headers["Range"] == b"bytes=0-0"
+    (page,) = pages(answer(ranged, status=206, headers={"Content-Type": "image/png", "Content-Range": "bytes 0-0/1234"}))
+    assert list(page.image_data.sizes) == [1234]
+
+
+def test_unreadable_image_response_still_finishes_every_page_using_it(spider, monkeypatch):
+    def broken(response):
+        raise ValueError("bad header")
+    monkeypatch.setattr(spider, "image_type", broken)
+
+    (head,) = checks(run(spider.parse(page_response("/", images=["/logo.png"]))))
+    # A second page waits on the same check
+    assert not checks(run(spider.parse(page_response("/other", images=["/logo.png"]))))
+
+    finished = pages(answer(head, headers={"Content-Type": "image/png", "Content-Length": "100"}))
+    assert sorted(page.url for page in finished) == [f"{SITE}/", f"{SITE}/other"]
+    assert finished[0].image_data.types == ["unknown"]
+    assert spider.crawler.stats.get_value("image_info/unreadable") == 1
+    # Later pages get the image from the cache
+    assert pages(run(spider.parse(page_response("/third", images=["/logo.png"]))))
+
+
+def test_page_is_emitted_after_its_last_check(spider):
+    output = run(spider.parse(page_response("/", links=["/a", "/b", "/c"], images=["/logo.png"])))
+    heads = checks(output)
+    assert sorted(request.url for request in heads) == [f"{SITE}/a", f"{SITE}/b", f"{SITE}/c", f"{SITE}/logo.png"]
+    # The links are crawled as pages too
+    assert sorted(request.url for request in checks(output, method="GET")) == [f"{SITE}/a", f"{SITE}/b", f"{SITE}/c"]
+    assert not pages(output)
+
+    statuses = {f"{SITE}/a": 200, f"{SITE}/b": 404, f"{SITE}/c": 500}
+    finished = []
+    for number, request in enumerate(heads):
+        if request.url in statuses:
+            output = answer(request, status=statuses[request.url], headers={"Content-Type": "text/html"})
+        else:
+            output = answer(request, headers={"Content-Type": "image/png", "Content-Length": "2048"})
+        finished += pages(output)
+        assert len(finished) == (1 if number == len(heads) - 1 else 0)
+
+    (page,) = finished
+    assert {link["url"]: link["status"] for link in page.internal_links.as_dicts()} == statuses
+    assert list(page.image_data.sizes) == [2048]
+
+
+def test_failed_checks_still_complete_the_page(spider):
+    heads = checks(run(spider.parse(page_response("/", links=["/a"], images=["/logo.png"]))))
+    link, image = sorted(heads, key=lambda request: request.url)
+    assert not pages(fail(link, DNSLookupError("example.com")))
+
+    (page,) = pages(fail(image, DNSLookupError("example.com")))
+    assert page.internal_links.statuses == ["error"]
+    assert "DNS lookup failed" in page.internal_links.errors[0]
+    assert page.image_data.types == ["unknown"]
+
+
+def test_pages_finished_before_the_site_checks_are_held_until_the_site_record():
+    spider = make_spider()
+    assert not run(spider.parse(page_response("/")))
+    (head,) = checks(run(spider.parse(page_response("/other", links=["/a"]))))
+    assert not pages(answer(head, headers={"Content-Type": "text/html"}))
+    assert len(spider.pages_awaiting_site) == 2
+
+    site_record, *held = finish_site_checks(spider)
+    assert site_record["record_type"] == "site"
+    assert sorted(page.url for page in held) == [f"{SITE}/", f"{SITE}/other"]
+    assert all(isinstance(page, PageRecord) for page in held)
+    assert spider.pages_awaiting_site == []
+    # Security header issues come from the site record
+    assert "Missing Security Header: Strict-Transport-Security." in " ".join(held[0].issues_detected)
+    # From now on pages are emitted as soon as they are done
+    assert pages(run(spider.parse(page_response("/third"))))
+
+
+def crawl_page(middleware, response):
+    """Run a page response through parse and the frontier middleware, as the engine would."""
+    spider = middleware.spider
+
+    async def collect():
+        return [item async for item in middleware.process_spider_output_async(response, spider.parse(response), spider)]
+    return asyncio.run(collect())
+
+
+def test_links_shared_by_pages_are_checked_once(spider):
+    (head,) = checks(run(spider.parse(page_response("/", links=["/shared"]))))
+    assert not checks(run(spider.parse(page_response("/other", links=["/shared"]))))
+
+    finished = pages(answer(head, status=404, headers={"Content-Type": "text/html"}))
+    assert sorted(page.url for page in finished) == [f"{SITE}/", f"{SITE}/other"]
+    assert all(page.internal_links.statuses == [404] for page in finished)
+    # Later pages are answered from the cache
+    (page,) = pages(run(spider.parse(page_response("/third", links=["/shared"]))))
+    assert page.internal_links.statuses == [404]
+    stats = spider.crawler.stats
+    assert stats.get_value("link_status/requested") == 1
+    assert stats.get_value("link_status/shared") == 1
+    assert stats.get_value("link_status/cache_hit") == 1
+
+
+def test_links_to_pages_the_crawl_will_fetch_are_answered_by_the_page_response(spider):
+    middleware = FrontierMiddleware.from_crawler(spider.crawler)
+    middleware.spider_opened(spider)
+
+    output = crawl_page(middleware, page_response("/", links=["/a", "/old", "/gone"]))
+    # No HEAD requests: the pages are queued in the frontier and their responses answer the checks
+    assert not checks(output) and not pages(output)
+    # Each response only finishes its own page until the last check of / is answered
+    assert [page.url for page in pages(crawl_page(middleware, page_response("/a")))] == [f"{SITE}/a"]
+    # A redirect answers the check of the URL it started from
+    output = crawl_page(middleware, page_response("/new", meta={"redirect_urls": [f"{SITE}/old"]}))
+    assert [page.url for page in pages(output)] == [f"{SITE}/new"]
+
+    gone = Request(f"{SITE}/gone", callback=spider.parse)
+    failure = Failure(HttpError(Response(gone.url, status=410, request=gone)))
+    failure.request = gone
+    (page,) = pages(run(middleware.page_failed(failure)))
+    assert {link["url"]: link["status"] for link in page.internal_links.as_dicts()} == {
+        f"{SITE}/a": 200, f"{SITE}/old": 200, f"{SITE}/gone": 410,
+    }
+    stats = spider.crawler.stats
+    assert stats.get_value("link_status/requested") is None
+    assert stats.get_value("link_status/from_page") == 3
+
+
+def urlset(*paths):
+    entries = "".join(f"<url><loc>{SITE}{path}</loc><priority>0.5</priority></url>" for path in paths)
+    return f"<urlset xmlns='http://www.sitemaps.org/schemas/sitemap/0.9'>{entries}</urlset>".encode()
+
+
+def sitemap_index(*paths):
+    entries = "".join(f"<sitemap><loc>{SITE}{path}</loc></sitemap>" for path in paths)
+    return f"<sitemapindex xmlns='http://www.sitemaps.org/schemas/sitemap/0.9'>{entries}</sitemapindex>".encode()
+
+
+def test_sitemap_index_is_followed_down_to_gzipped_child_sitemaps():
+    spider = make_spider()
+    bodies = {
+        "/sitemap_products.xml.gz": gzip.compress(urlset("/shoes", "/hats")),
+        "/sitemap_nested.xml": sitemap_index("/sitemap_blog.xml"),
+        "/sitemap_blog.xml": urlset("/blog/first", "/shoes"),
+    }
+    output = answer(Request(f"{SITE}/sitemap.xml", callback=spider.parse_sitemap),
+                    body=sitemap_index("/sitemap_products.xml.gz", "/sitemap_nested.xml"))
+    assert spider.site_record["sitemap"] == {"url": f"{SITE}/sitemap.xml", "urls": 0, "sitemaps": 2}
+
+    page_requests = []
+    queue = [item for item in output if isinstance(item, Request)]
+    while queue:
+        request = queue.pop(0)
+        if request.callback == spider.parse_child_sitemap:
+            queue.extend(answer(request, body=bodies[request.url[len(SITE):]]))
+        else:
+            page_requests.append(request)
+
+    assert [request.url for request in page_requests] == [
+        f"{SITE}/shoes", f"{SITE}/hats", f"{SITE}/blog/first", f"{SITE}/shoes",
+    ]
+    assert page_requests[0].meta["sitemap_priority"] == 0.5
+    # The sitemap index keeps each page once, in the order the sitemaps listed them
+    assert list(spider.sitemap_index) == [f"{SITE}/shoes", f"{SITE}/hats", f"{SITE}/blog/first"]
+    assert spider.sitemap_index.sitemap_count == 4
+    assert spider.crawler.stats.get_value("sitemap/urls") == 4
+
@@ -0,0 +1,24 @@
+from mandevu.utils.status_cache import StatusCache
+
+
+def test_waiters_share_one_check():
+    cache = StatusCache()
+    key = cache.key("https://example.com/a?b=2&a=1#top")
+    assert key == cache.key("https://example.com/a?a=1&b=2")
+    assert cache.wait(key, "first")
+    assert not cache.wait(key, "second")
+    assert cache.resolve(key, {"status": 200}) == ["first", "second"]
+    assert cache.get(key) == {"status": 200}
+
+
+def test_expected_key_is_answered_by_the_response_on_its_way():
+    cache = StatusCache()
+    key = cache.key("https://example.com/page")
+    cache.expect(key)
+    # No waiter starts a check for a page that is queued for crawling
+    assert not cache.wait(key, "first")
+    assert not cache.wait(key, "second")
+    assert cache.resolve(key, {"status": 404}) == ["first", "second"]
+    # Once resolved, an evicted key is checked again
+    cache.resolved.clear()
+    assert cache.wait(key, "third")
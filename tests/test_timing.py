@@ -0,0 +1,128 @@
+import json
+
+import pytest
+from scrapy import Spider
+from scrapy.http import Request, Response
+from scrapy.resolver import dnscache
+from scrapy.utils.test import get_crawler
+from twisted.internet import defer
+from twisted.internet.base import ThreadedResolver
+
+import mandevu.middlewares
+from mandevu.middlewares import MandevuDownloaderMiddleware
+from mandevu.utils.timing import LatencyHistogram, TimingResolver, dns_lookups
+
+
+class Clock:
+    def __init__(self, now=100.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    # The middleware and the resolver share the time module
+    monkeypatch.setattr(mandevu.middlewares.time, "time", clock)
+    yield clock
+    dns_lookups.clear()
+
+
+def test_histogram_percentiles_are_within_a_bucket_of_the_real_value():
+    histogram = LatencyHistogram()
+    for millisecond in range(1, 1001):
+        histogram.add(millisecond / 1000)
+    for fraction in (0.5, 0.95, 0.99):
+        assert histogram.percentile(fraction) == pytest.approx(fraction, rel=0.05)
+    assert histogram.percentile(1.0) == 1.0
+    summary = histogram.summary()
+    assert summary["count"] == 1000
+    assert summary["mean"] == pytest.approx(0.5005)
+    assert summary["max"] == 1.0
+
+
+def test_histogram_size_does_not_depend_on_the_samples():
+    histogram = LatencyHistogram()
+    buckets = len(histogram.buckets)
+    for value in (0.0, 0.0005, 3.0, 10_000.0):
+        histogram.add(value)
+    assert len(histogram.buckets) == buckets
+    assert histogram.percentile(0.25) == pytest.approx(0.001)
+    # The last bucket is open-ended: its percentile is the largest sample
+    assert histogram.percentile(1.0) == 10_000.0
+    assert LatencyHistogram().percentile(0.5) is None
+
+
+def test_resolver_times_lookups_that_miss_its_cache(clock, monkeypatch):
+    pending = {}
+
+    def lookup(self, name, timeout=()):
+        pending[name] = defer.Deferred()
+        return pending[name]
+
+    monkeypatch.setattr(ThreadedResolver, "getHostByName", lookup)
+    # The resolver sets the size of Scrapy's process-wide DNS cache
+    monkeypatch.setattr(dnscache, "limit", dnscache.limit)
+    resolver = TimingResolver(None, cache_size=10, timeout=5.0)
+    try:
+        resolved = resolver.getHostByName("timed.example.com")
+        clock.now += 0.25
+        pending.pop("timed.example.com").callback("192.0.2.1")
+        assert resolved.result == "192.0.2.1"
+        assert dns_lookups == {"timed.example.com": 0.25}
+
+        # Answered from the cache: nothing to time
+        dns_lookups.clear()
+        assert resolver.getHostByName("timed.example.com").result == "192.0.2.1"
+        assert dns_lookups == {} and not pending
+    finally:
+        dnscache.pop("timed.example.com", None)
+
+
+def download(middleware, clock, request, latency, wait, body):
+    """Drive the downloader signals for one download and return its timing."""
+    middleware.request_reached_downloader(request, None)
+    clock.now += wait + latency
+    request.meta["download_latency"] = latency
+    middleware.headers_received({}, None, request, None)
+    clock.now += body
+    middleware.response_downloaded(Response(request.url, body=b"x" * 100, request=request), request, None)
+    return request.meta.get("timing")
+
+
+def test_downloads_are_split_from_the_downloader_signals(clock):
+    middleware = MandevuDownloaderMiddleware()
+    dns_lookups["example.com"] = 0.05
+    timing = download(middleware, clock, Request("https://example.com/a"), latency=0.3, wait=0.2, body=0.5)
+    assert timing == {"queue_wait": 0.2, "dns": 0.05, "ttfb": 0.3, "download": 0.5, "total": 0.8, "response_size": 100}
+
+    # The lookup is claimed by the first download from the host only
+    timing = download(middleware, clock, Request("https://example.com/b"), latency=0.1, wait=0.0, body=0.1)
+    assert timing["dns"] is None and timing["queue_wait"] == 0.0
+    assert middleware.timings.overall["total"].count == 2
+    assert "GET example.com/*" in middleware.timings.groups
+
+
+def test_downloads_that_never_reached_the_downloader_are_not_timed(clock):
+    middleware = MandevuDownloaderMiddleware()
+    request = Request("https://example.com/")
+    middleware.response_downloaded(Response(request.url, request=request), request, None)
+    assert "timing" not in request.meta
+    assert middleware.timings.overall == {}
+
+
+def test_spider_closed_exports_timings_and_drops_unclaimed_lookups(clock, tmp_path):
+    crawler = get_crawler(settings_dict={"TIMING_PATH": str(tmp_path / "out" / "timing.json")})
+    middleware = MandevuDownloaderMiddleware.from_crawler(crawler)
+    download(middleware, clock, Request("https://example.com/"), latency=0.3, wait=0.0, body=0.2)
+    dns_lookups["unreachable.example.com"] = 1.0
+
+    middleware.spider_closed(Spider("test"))
+    assert dns_lookups == {}
+    assert crawler.stats.get_value("timing/total/p50") == pytest.approx(0.5, rel=0.05)
+    with open(tmp_path / "out" / "timing.json", encoding="utf-8") as file:
+        summary = json.load(file)
+    assert summary["overall"]["ttfb"]["count"] == 1
+    assert summary["bytes"] == 100
@@ -0,0 +1,60 @@
+import pytest
+
+from mandevu.utils.urls import BloomFilter, FingerprintSet, canonicalize
+
+
+@pytest.mark.parametrize("variant, canonical", [
+    # Fragments
+    ("https://example.com/a#top", "https://example.com/a"),
+    ("https://example.com/ä#top", "https://example.com/%C3%A4"),
+    # Default ports; other ports are kept
+    ("https://example.com:443/a", "https://example.com/a"),
+    ("http://example.com:80/a", "http://example.com/a"),
+    ("https://example.com:/a", "https://example.com/a"),
+    ("https://example.com:443/ä", "https://example.com/%C3%A4"),
+    ("https://example.com:8443/a", "https://example.com:8443/a"),
+    ("http://example.com:443/a", "http://example.com:443/a"),
+    # Query order and tracking parameters
+    ("https://example.com/a?b=2&a=1", "https://example.com/a?a=1&b=2"),
+    ("https://example.com/a?utm_source=feed&id=3&fbclid=x", "https://example.com/a?id=3"),
+    ("https://example.com/a?utm_medium=email", "https://example.com/a"),
+    ("https://example.com/ä?b=é&a=1&gclid=x", "https://example.com/%C3%A4?a=1&b=%C3%A9"),
+    # Trailing slashes: a bare host gets its path, otherwise /a and /a/ are different pages
+    ("https://example.com", "https://example.com/"),
+    ("https://example.com/a/", "https://example.com/a/"),
+    ("https://example.com/a", "https://example.com/a"),
+    # Scheme and host are case-insensitive, the path is not
+    ("HTTPS://Example.COM/A", "https://example.com/A"),
+])
+def test_canonicalize(variant, canonical):
+    assert canonicalize(variant) == canonical
+
+
+def test_strip_params_can_be_turned_off():
+    assert canonicalize("https://example.com/a?utm_source=feed", strip_params=()) == "https://example.com/a?utm_source=feed"
+
+
+def test_fingerprint_set_membership_survives_growth():
+    urls = FingerprintSet(capacity=4)
+    for number in range(1000):
+        assert urls.add(f"https://example.com/page/{number}?utm_source=feed")
+    assert len(urls) == 1000
+    assert all(f"https://example.com/page/{number}#reviews" in urls for number in range(1000))
+    assert "https://example.com/page/1000" not in urls
+    assert not urls.add("https://example.com:443/page/7")
+    assert len(urls) == 1000
+
+
+@pytest.mark.parametrize("error_rate", [0.01, 0.001])
+def test_bloom_filter_has_no_false_negatives_and_bounded_false_positives(error_rate):
+    capacity = 20000
+    seen = BloomFilter(capacity, error_rate)
+    for number in range(capacity):
+        seen.add(f"https://example.com/page/{number}")
+    assert all(f"https://example.com/page/{number}#top" in seen for number in range(capacity))
+
+    probes = 50000
+    false_positives = sum(f"https://example.com/other/{number}" in seen for number in range(probes))
+    assert false_positives / probes < 2 * error_rate
+    # About 1.2 bytes per URL at 1%, 1.8 at 0.1%
+    assert seen.memory_size() <= capacity * (1.25 if error_rate == 0.01 else 1.85)